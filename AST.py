@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Any, List
+from typing import Any, List, Optional
 
 from tokenizer import TokenList, Terminal
 
@@ -20,11 +20,16 @@ class AstNode:
     type: AstNodeType
     value: Any
     child_nodes: List = list()
+    # Span in source code: offset of the first character and offset after the last one
+    start: Optional[int] = None
+    end: Optional[int] = None
 
-    def __init__(self, node_type: AstNodeType, value: Any):
+    def __init__(self, node_type: AstNodeType, value: Any, start: Optional[int] = None, end: Optional[int] = None):
         self.type = node_type
         self.value = value
         self.child_nodes = list()
+        self.start = start
+        self.end = end
 
     def add_child(self, child_node):
         self.child_nodes.append(child_node)
@@ -53,7 +58,7 @@ class AstNode:
     @staticmethod
     def build_list():
         global tokenList
-        node = AstNode(AstNodeType.List, None)
+        node = AstNode(AstNodeType.List, None, tokenList.get_current_token().position)
 
         tokenList.inc()
         while tokenList.get_current_token().type != Terminal.RP:
@@ -61,6 +66,7 @@ class AstNode:
                 tokenList.inc()
                 continue
             node.add_child(AstNode.build_element())
+        node.end = tokenList.get_current_token().position + 1
         tokenList.inc()
 
         return node
@@ -68,7 +74,7 @@ class AstNode:
     @staticmethod
     def build_atom():
         global tokenList
-        node = AstNode(AstNodeType.Atom, None)
+        node = AstNode(AstNodeType.Atom, None, tokenList.get_current_token().position)
 
         value: str = tokenList.get_current_token().value
 
@@ -76,7 +82,10 @@ class AstNode:
         while tokenList.get_current_token().type == Terminal.Letter or \
                 tokenList.get_current_token().type == Terminal.Digit:
             value += tokenList.get_current_token().value
+            node.end = tokenList.get_current_token().position + 1
             tokenList.inc()
+        if node.end is None:
+            node.end = node.start + 1
 
         node.value = value.lower()
         return node
@@ -84,13 +93,16 @@ class AstNode:
     @staticmethod
     def build_literal():
         global tokenList
-        node = AstNode(AstNodeType.Literal, None)
+        node = AstNode(AstNodeType.Literal, None, tokenList.get_current_token().position)
         value = tokenList.get_current_token().value
 
         tokenList.inc()
         while tokenList.get_current_token().type == Terminal.Digit:
             value += tokenList.get_current_token().value
+            node.end = tokenList.get_current_token().position + 1
             tokenList.inc()
+        if node.end is None:
+            node.end = node.start + 1
 
         node.value = int(value)
         return node
@@ -99,7 +111,13 @@ class AstNode:
 class AST:
     root: AstNode
 
-    def __init__(self, token_list: TokenList):
+    def __init__(self, token_list: Optional[TokenList] = None, root: Optional[AstNode] = None):
+        """
+        Parses list of tokens or takes already built tree, e.g. loaded from binary format
+        """
+        if root is not None:
+            self.root = root
+            return
         global tokenList
         tokenList = token_list
         tokenList.set_current_token_index(0)
@@ -0,0 +1,242 @@
+from array import array
+from typing import Dict, List, Tuple
+
+from AST import AST, AstNode, AstNodeType
+
+MAGIC = b'FSTA'
+VERSION = 1
+# Node kinds in binary format
+KINDS = [AstNodeType.Program, AstNodeType.List, AstNodeType.Atom, AstNodeType.Literal]
+KIND_NUMBERS = {kind: i for i, kind in enumerate(KINDS)}
+NO_SPAN = -1
+
+
+class AstFormatError(Exception):
+    pass
+
+
+class FlatAst:
+    """
+    AST as flat arrays of nodes in preorder, several times smaller than tree of AstNode objects.
+    Compiler changes tree in place, so it gets the usual tree from to_ast, flat form is only kept on disk.
+    Value of node is number of children for program and list, index in table of atom names for atom
+    and index in table of literals for literal. Nodes made by optimizer may have no span, it is NO_SPAN then.
+
+    Binary format:
+        magic 'FSTA', version byte
+        varint count of atom names, then every name as varint length and UTF-8 bytes
+        varint count of nodes, then every node in preorder:
+            varint header: value << 4 | has natural length << 3 | kind << 1 | has span
+                (value of literal is the literal itself)
+            if has span: zigzag varint of start minus start of previous list with span or end of previous other node
+            if has span and no natural length: varint length of span
+        Natural length of atom or literal is length of its text, so it is not stored.
+    """
+    atoms: List[str]
+    literals: List[int]
+    kinds: bytearray
+    values: array
+    starts: array
+    ends: array
+
+    def __init__(self):
+        self.atoms = []
+        self.literals = []
+        self.kinds = bytearray()
+        self.values = array('L')
+        self.starts = array('l')
+        self.ends = array('l')
+
+    def __len__(self):
+        return len(self.kinds)
+
+    @staticmethod
+    def from_ast(ast: AST) -> 'FlatAst':
+        flat = FlatAst()
+        atom_indexes: Dict[str, int] = {}
+        literal_indexes: Dict[int, int] = {}
+        stack = [ast.root]
+        while len(stack) > 0:
+            node = stack.pop()
+            if node.type not in KIND_NUMBERS:
+                raise AstFormatError(f'Node of type {node.type} can not be serialized')
+            kind = KIND_NUMBERS[node.type]
+            if node.type == AstNodeType.Atom:
+                value = atom_indexes.setdefault(node.value, len(atom_indexes))
+                if value == len(flat.atoms):
+                    flat.atoms.append(node.value)
+            elif node.type == AstNodeType.Literal:
+                value = literal_indexes.setdefault(node.value, len(literal_indexes))
+                if value == len(flat.literals):
+                    flat.literals.append(node.value)
+            else:
+                value = len(node.child_nodes)
+                stack.extend(reversed(node.child_nodes))
+            flat.kinds.append(kind)
+            flat.values.append(value)
+            flat.starts.append(node.start if node.start is not None else NO_SPAN)
+            flat.ends.append(node.end if node.end is not None else NO_SPAN)
+        return flat
+
+    def to_ast(self) -> AST:
+        if len(self) == 0 or self.kinds[0] != KIND_NUMBERS[AstNodeType.Program]:
+            raise AstFormatError('The first node must be program')
+        atoms, literals, values, starts, ends = self.atoms, self.literals, self.values, self.starts, self.ends
+        root = None
+        # Lists which still wait for children and number of them
+        parents: List[AstNode] = []
+        remaining: List[int] = []
+        for i, kind in enumerate(self.kinds):
+            value = values[i]
+            start = starts[i] if starts[i] != NO_SPAN else None
+            end = ends[i] if ends[i] != NO_SPAN else None
+            if kind == 2:
+                node = AstNode(AstNodeType.Atom, atoms[value], start, end)
+            elif kind == 3:
+                node = AstNode(AstNodeType.Literal, literals[value], start, end)
+            else:
+                node = AstNode(KINDS[kind], None, start, end)
+
+            if root is None:
+                root = node
+            elif kind == 0:
+                raise AstFormatError(f'Node {i} is program inside of program')
+            elif len(parents) == 0:
+                raise AstFormatError(f'Node {i} is out of the program')
+            else:
+                parents[-1].child_nodes.append(node)
+                remaining[-1] -= 1
+                if remaining[-1] == 0:
+                    parents.pop()
+                    remaining.pop()
+            if kind <= 1 and value > 0:
+                parents.append(node)
+                remaining.append(value)
+        if len(parents) > 0:
+            raise AstFormatError('Unexpected end of nodes')
+        return AST(root=root)
+
+    def to_bytes(self) -> bytes:
+        out = bytearray(MAGIC)
+        out.append(VERSION)
+        _write_varint(out, len(self.atoms))
+        for atom in self.atoms:
+            encoded = atom.encode('utf-8')
+            _write_varint(out, len(encoded))
+            out += encoded
+        _write_varint(out, len(self))
+        base = 0
+        for i, kind in enumerate(self.kinds):
+            value = self.literals[self.values[i]] if kind == 3 else self.values[i]
+            start, end = self.starts[i], self.ends[i]
+            has_span = start != NO_SPAN and end != NO_SPAN
+            is_natural = has_span and kind >= 2 and end - start == len(self.atoms[value] if kind == 2 else str(value))
+            _write_varint(out, value << 4 | is_natural << 3 | kind << 1 | has_span)
+            if has_span:
+                delta = start - base
+                _write_varint(out, delta << 1 if delta >= 0 else (-delta << 1) - 1)
+                if not is_natural:
+                    _write_varint(out, end - start)
+                # The next node is the first child of list or goes after this one
+                base = start if kind <= 1 else end
+        return bytes(out)
+
+    @staticmethod
+    def from_bytes(data: bytes) -> 'FlatAst':
+        if data[:len(MAGIC)] != MAGIC:
+            raise AstFormatError('Not a binary F-Stroke AST')
+        if len(data) <= len(MAGIC) or data[len(MAGIC)] != VERSION:
+            raise AstFormatError('Unsupported version of binary AST')
+        flat = FlatAst()
+        position = len(MAGIC) + 1
+        try:
+            count, position = _read_varint(data, position)
+            for _ in range(count):
+                length, position = _read_varint(data, position)
+                if position + length > len(data):
+                    raise IndexError()
+                flat.atoms.append(data[position:position + length].decode('utf-8'))
+                position += length
+
+            count, position = _read_varint(data, position)
+            atoms = flat.atoms
+            literal_indexes: Dict[int, int] = {}
+            kinds, values, starts, ends = flat.kinds, flat.values, flat.starts, flat.ends
+            base = 0
+            for _ in range(count):
+                # Varints are decoded inline, it is the hot loop of loading
+                header = shift = 0
+                while True:
+                    byte = data[position]
+                    position += 1
+                    header |= (byte & 0x7f) << shift
+                    shift += 7
+                    if byte < 0x80:
+                        break
+                kind = header >> 1 & 3
+                value = header >> 4
+                if kind == 2 and value >= len(atoms):
+                    raise AstFormatError(f'Atom name {value} is not in the table')
+                if header & 1:
+                    delta = shift = 0
+                    while True:
+                        byte = data[position]
+                        position += 1
+                        delta |= (byte & 0x7f) << shift
+                        shift += 7
+                        if byte < 0x80:
+                            break
+                    start = base + (delta >> 1 if delta & 1 == 0 else -((delta + 1) >> 1))
+                    if header & 8:
+                        end = start + len(atoms[value] if kind == 2 else str(value))
+                    else:
+                        length, position = _read_varint(data, position)
+                        end = start + length
+                    base = start if kind <= 1 else end
+                    starts.append(start)
+                    ends.append(end)
+                else:
+                    starts.append(NO_SPAN)
+                    ends.append(NO_SPAN)
+                if kind == 3:
+                    if value not in literal_indexes:
+                        literal_indexes[value] = len(flat.literals)
+                        flat.literals.append(value)
+                    value = literal_indexes[value]
+                kinds.append(kind)
+                values.append(value)
+        except IndexError:
+            raise AstFormatError('Unexpected end of data')
+        except UnicodeDecodeError:
+            raise AstFormatError('Atom name is not UTF-8')
+        if position != len(data):
+            raise AstFormatError('Unexpected data after the last node')
+        return flat
+
+
+def save_ast(ast: AST, path: str):
+    with open(path, 'wb') as f:
+        f.write(FlatAst.from_ast(ast).to_bytes())
+
+
+def load_ast(path: str) -> AST:
+    with open(path, 'rb') as f:
+        return FlatAst.from_bytes(f.read()).to_ast()
+
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, position: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, position
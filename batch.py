@@ -0,0 +1,95 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from evm import Evm, EvmError, ExecutionResult, Program
+
+# Vectors sent to worker at once, results are still written one by one in order of vectors
+CHUNK_SIZE = 64
+
+
+class BatchError(Exception):
+    pass
+
+
+class BatchResult:
+    index: int
+    result: Optional[ExecutionResult]
+    error: Optional[str]
+
+    def __init__(self, index: int, result: Optional[ExecutionResult], error: Optional[str] = None):
+        self.index = index
+        self.result = result
+        self.error = error
+
+    def to_json(self) -> dict:
+        if self.result is None:
+            return {'vector': self.index, 'error': self.error}
+        return {
+            'vector': self.index,
+            'value': self.result.value,
+            'gas_used': self.result.gas_used,
+            'steps': self.result.steps
+        }
+
+
+class BatchRunner:
+    """
+    Runs one compiled program with many calldata vectors. Byte code is decoded once per process,
+    vectors are spread over the pool in chunks and results come back in order of vectors as soon as they are ready.
+    """
+    __byte_code: str
+    __jobs: int
+    __gas_limit: int
+
+    def __init__(self, byte_code: str, jobs: int = 1, gas_limit: int = 30000000):
+        assert jobs >= 1
+        self.__byte_code = byte_code
+        self.__jobs = jobs
+        self.__gas_limit = gas_limit
+
+    def run(self, vectors: Iterable[bytes]) -> Iterator[BatchResult]:
+        if self.__jobs == 1:
+            _init_worker(self.__byte_code, self.__gas_limit)
+            for task in enumerate(vectors):
+                yield BatchResult(*_run_vector(task))
+            return
+
+        with ProcessPoolExecutor(self.__jobs, initializer=_init_worker,
+                                 initargs=(self.__byte_code, self.__gas_limit)) as pool:
+            for index, result, error in pool.map(_run_vector, enumerate(vectors), chunksize=CHUNK_SIZE):
+                yield BatchResult(index, result, error)
+
+
+def read_vectors(path: str) -> List[bytes]:
+    """
+    One hex calldata per line, 0x prefix is optional, empty lines and lines starting with # are skipped
+    """
+    vectors = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if len(line) == 0 or line.startswith('#'):
+                continue
+            try:
+                vectors.append(bytes.fromhex(line[2:] if line.startswith('0x') else line))
+            except ValueError:
+                raise BatchError(f'{path}:{number}: calldata is not a hex string')
+    return vectors
+
+
+# Decoded program and interpreter of the current process
+_program: Optional[Program] = None
+_evm: Optional[Evm] = None
+
+
+def _init_worker(byte_code: str, gas_limit: int):
+    global _program, _evm
+    _program = Program(byte_code)
+    _evm = Evm(gas_limit)
+
+
+def _run_vector(task: Tuple[int, bytes]) -> Tuple[int, Optional[ExecutionResult], Optional[str]]:
+    try:
+        return task[0], _evm.run(_program, task[1]), None
+    except EvmError as e:
+        return task[0], None, str(e)
@@ -1,63 +1,142 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
 from context import Context
 from utils import dec_to_hex
 from AST import AST, AstNode, AstNodeType
 from fst_functions.builtin import BuiltIns
 from fst_functions.declared import Declared
+from fst_functions.memoization import Memoization
 from memory_stack import VirtualStackHelper
 from opcodes import OpcodeList
+from optimizer.ast_utils import is_boolean, is_call
+from optimizer.code_folding import CodeFolding
+from optimizer.common_subexpressions import CommonSubexpressions
+from optimizer.loop_invariants import LoopInvariantMotion
+from optimizer.loop_unrolling import LoopUnrolling
+from optimizer.partial_evaluation import PartialEvaluator
+from optimizer.stack_scheduling import StackScheduling
 from singleton import Singleton
 
+# Chains of cond with less comparisons are compiled as usual
+MIN_DISPATCH_CASES = 4
+# Jump table is used if there are at least 1 / JUMP_TABLE_DENSITY values in its range
+JUMP_TABLE_DENSITY = 2
+BINARY_SEARCH_LEAF_SIZE = 2
+
 
 class Generator(metaclass=Singleton):
     __opcodes: OpcodeList
     __address_length: int
     __frame_service_atoms: int
+    __fold_code: bool
+    __jobs: int
+    __memoize: List[str]
+    __memo_slots: int
 
-    def __init__(self, ast: AST, address_length=32, frame_service_atoms=3):
+    def __init__(self, ast: Optional[AST], address_length=32, frame_service_atoms=3, fold_code=True, jobs=1,
+                 memoize: Optional[List[str]] = None, memo_slots=256, unroll_budget=64):
+        """
+        AST is None in worker processes, which only compile fragments of already optimized tree.
+        Functions listed in memoize keep results in tables of memo_slots slots (64 bytes each).
+        Loops with known number of iterations are unrolled into at most unroll_budget AST nodes, 0 disables it.
+        """
         self.__address_length = address_length
         self.__frame_service_atoms = frame_service_atoms
+        self.__fold_code = fold_code
+        self.__jobs = jobs
+        self.__memoize = memoize if memoize is not None else []
+        self.__memo_slots = memo_slots
 
         assert 32 >= address_length >= 1
         assert frame_service_atoms >= 2
+        assert jobs >= 1
 
         self.__opcodes: OpcodeList = OpcodeList(address_length)
+        if ast is not None:
+            ast = LoopInvariantMotion().run(PartialEvaluator(address_length).run(ast))
+            ast = LoopUnrolling(unroll_budget).run(ast)
         self.__ast = ast
 
         # Init Virtual stack and function Singletons
-        VirtualStackHelper(address_length, frame_service_atoms).init_stack(self.__opcodes)
+        VirtualStackHelper(address_length, frame_service_atoms)
         SpecialForms(address_length)
         BuiltIns(self.__address_length)
         Declared(address_length, frame_service_atoms)
+        Memoization(address_length, memo_slots)
 
     def run(self):
+        forms = self.__ast.root.child_nodes
+        Declared().set_forms([None if el.child_nodes[0].value == 'prog' else el.child_nodes[1].value for el in forms])
+        Memoization().set_functions(forms, self.__memoize)
+        VirtualStackHelper().init_stack(self.__opcodes, Memoization().get_reserved_size())
+
         # Set jump to main program body
         self.__opcodes.add('PUSH', dec_to_hex(0, 2 * self.__address_length))
         jump_to_prog_start_i = len(self.__opcodes.list) - 1
         self.__opcodes.add('JUMP')
 
-        for el in self.__ast.root.child_nodes:
-            context = Context(self.__frame_service_atoms)
+        if self.__jobs == 1 or len(forms) < 2:
+            fragments = [self.compile_fragment(el, i) for i, el in enumerate(forms)]
+        else:
+            with ProcessPoolExecutor(self.__jobs, initializer=_init_worker,
+                                     initargs=(self.__address_length, self.__frame_service_atoms,
+                                               Declared().get_forms(), self.__memo_slots,
+                                               Memoization().get_tables())) as pool:
+                chunk_size = max(1, len(forms) // (4 * self.__jobs))
+                packed = pool.map(_compile_fragment, enumerate(forms), chunksize=chunk_size)
+                fragments = [OpcodeList.unpack(x, el, self.__address_length) for x, el in zip(packed, forms)]
+
+        # Link: fragments go one after another, calls and jump to prog get addresses of entry points
+        entries = []
+        for el, fragment in zip(forms, fragments):
+            entries.append(fragment.list[0])
+            if el.child_nodes[0].value == 'prog':
+                self.__opcodes.set_target(jump_to_prog_start_i, fragment.list[0])
+            self.__opcodes.list.extend(fragment.list)
+        for opcode in self.__opcodes.list:
+            if opcode.symbol is not None:
+                opcode.target = entries[opcode.symbol]
+        self.__opcodes.relocate()
+
+        # Shared copies of repeated code make contract smaller at the cost of extra jumps
+        if self.__fold_code:
+            CodeFolding(self.__opcodes).run()
+        return self
 
+    def compile_fragment(self, el: AstNode, index: int) -> OpcodeList:
+        """
+        Compiles prog or function, which is top level form number index, into separate list of opcodes.
+        Fragment is position independent: jumps refer to JUMPDEST opcodes and calls to indexes of called functions.
+        """
+        opcodes = OpcodeList(self.__address_length)
+        context = Context(self.__frame_service_atoms)
+        opcodes.current_function = 'prog' if el.child_nodes[0].value == 'prog' else el.child_nodes[1].value
+        Declared().set_position(index)
+
+        with opcodes.source(el):
             if el.child_nodes[0].value == 'prog':
                 context.is_prog = True
-                # Jump from header to prog body
-                self.__opcodes.add('JUMPDEST')
-                self.__opcodes.list[jump_to_prog_start_i].extra_value = dec_to_hex(self.__opcodes.list[-1].id,
-                                                                                   2 * self.__address_length)
+                # Entry point, header jumps here
+                opcodes.add('JUMPDEST')
 
-                self.__opcodes.add('PUSH', dec_to_hex(0, 2 * self.__address_length))
-                prog_atom_count = len(self.__opcodes.list) - 1
-                VirtualStackHelper().load_cur_atom_counter_addr(self.__opcodes)
-                self.__opcodes.add('MSTORE')
+                opcodes.add('PUSH', dec_to_hex(0, 2 * self.__address_length))
+                prog_atom_count = len(opcodes.list) - 1
+                VirtualStackHelper().load_cur_atom_counter_addr(opcodes)
+                opcodes.add('MSTORE')
 
-                self.process_code_block(el.child_nodes[1], context, self.__opcodes)
+                self.process_code_block(el.child_nodes[1], context, opcodes)
 
-                self.__opcodes.list[prog_atom_count].extra_value = \
+                opcodes.list[prog_atom_count].extra_value = \
                     dec_to_hex(context.id_counter - self.__frame_service_atoms, 2 * self.__address_length)
 
             else:
-                self.declare_function(el, context, self.__opcodes)
-        return self
+                self.declare_function(el, index, context, opcodes)
+        opcodes.current_function = None
+        return opcodes
+
+    def get_opcodes(self) -> OpcodeList:
+        return self.__opcodes
 
     def __str__(self):
         byte_code = self.__opcodes.get_str()
@@ -65,10 +144,45 @@ class Generator(metaclass=Singleton):
 
     def process_code_block(self, prog_body: AstNode, ctx: Context, opcodes: OpcodeList):
         # assert prog_body.type == AstNodeType.List
-        for call in prog_body.child_nodes:
-            self.process_call(call, ctx, opcodes)
+        statements = prog_body.child_nodes
+        i = 0
+        while i < len(statements):
+            # Straight-line runs of assignments share common subexpressions on EVM stack
+            run_length = CommonSubexpressions.get_run_length(statements, i)
+            if run_length > 0:
+                CommonSubexpressions(self, ctx, opcodes).process_run(statements[i:i + run_length])
+                i += run_length
+            else:
+                self.process_statement(statements[i], ctx, opcodes)
+                i += 1
+
+    def process_statement(self, statement: AstNode, ctx: Context, opcodes: OpcodeList):
+        """
+        Value of expression used as statement is dropped, so loops do not fill EVM stack
+        INPUT  (0): | EoS |
+        OUTPUT (0): | EoS |
+        """
+        self.process_call(statement, ctx, opcodes)
+        if self.__leaves_value(statement):
+            with opcodes.source(statement):
+                opcodes.add('POP')
+
+    @staticmethod
+    def __leaves_value(node: AstNode) -> bool:
+        if node.type != AstNodeType.List:
+            return True
+        if len(node.child_nodes) == 0 or node.child_nodes[0].type == AstNodeType.List:
+            return False
+        name = node.child_nodes[0].value
+        if SpecialForms().has(name) or name == 'return':
+            return False
+        return BuiltIns().has(name) or Declared().has(name)
 
     def process_call(self, call_body: AstNode, ctx: Context, opcodes: OpcodeList):
+        with opcodes.source(call_body):
+            return self.__process_call(call_body, ctx, opcodes)
+
+    def __process_call(self, call_body: AstNode, ctx: Context, opcodes: OpcodeList):
         # Processing syntax features: literals, atoms
         if call_body.type == AstNodeType.Literal:
             return self.process_literal(call_body, opcodes)
@@ -87,12 +201,20 @@ class Generator(metaclass=Singleton):
         if SpecialForms().has(name):
             return SpecialForms().call(call_body, ctx, opcodes, self)
 
-        # Else we prepare an arguments and calls a function
-        for i in range(1, len(call_body.child_nodes)):
-            self.process_call(call_body.child_nodes[i], ctx, opcodes)
+        # Multiplication or division by power of two needs only one operand to be prepared
+        shift = BuiltIns().get_shift(call_body) if BuiltIns().has(name) else None
+        if shift is not None:
+            self.process_call(shift[0], ctx, opcodes)
+            return BuiltIns().call_shift(call_body, shift[1], ctx, opcodes)
+
+        # Else we prepare an arguments and calls a function, operand needing more stack goes first
+        mirrored = BuiltIns().has(name) and StackScheduling.is_mirrored(call_body)
+        args = call_body.child_nodes[1:]
+        for arg in (reversed(args) if mirrored else args):
+            self.process_call(arg, ctx, opcodes)
 
         if BuiltIns().has(name):
-            return BuiltIns().call(call_body, ctx, opcodes)
+            return BuiltIns().call(call_body, ctx, opcodes, mirrored)
 
         if Declared().has(name):
             return Declared().call(call_body, ctx, opcodes)
@@ -110,7 +232,7 @@ class Generator(metaclass=Singleton):
         atom_address, is_new = ctx.get_atom_addr(atom_name)
         VirtualStackHelper().load_atom_value(opcodes, atom_address)
 
-    def declare_function(self, call_body: AstNode, ctx: Context, opcodes: OpcodeList):
+    def declare_function(self, call_body: AstNode, index: int, ctx: Context, opcodes: OpcodeList):
         assert call_body.type == AstNodeType.List
         assert call_body.child_nodes[0].type == AstNodeType.Literal or call_body.child_nodes[0].type == AstNodeType.Atom
         assert call_body.child_nodes[0].value == 'func'
@@ -120,7 +242,10 @@ class Generator(metaclass=Singleton):
         """
         # Set entry point
         opcodes.add('JUMPDEST')
-        Declared().add(call_body.child_nodes[1].value, opcodes.list[-1].id)
+        is_memoized = Memoization().has(index)
+        if is_memoized:
+            # Known result returns at once, key of table goes under back address
+            Memoization().add_lookup(index, opcodes)
 
         # Make new stack frame
         # Back address gone
@@ -132,6 +257,11 @@ class Generator(metaclass=Singleton):
         VirtualStackHelper().load_cur_atom_counter_addr(opcodes)
         opcodes.add('MSTORE')
 
+        if is_memoized:
+            # Key gone, returns jump to the end of function to fill the table
+            Memoization().store_key(ctx, opcodes)
+            ctx.memo_returns = []
+
         # Declare arguments in context
         # Args gone
         for arg_name in reversed(call_body.child_nodes[2].child_nodes):
@@ -140,16 +270,48 @@ class Generator(metaclass=Singleton):
             VirtualStackHelper().store_atom_value(opcodes, address)
 
         # Generate body
-        self.process_call(call_body.child_nodes[3], ctx, opcodes)
+        self.process_statement(call_body.child_nodes[3], ctx, opcodes)
 
         # Set atom counter, part 2
         opcodes.list[func_atom_counter].extra_value = \
             dec_to_hex(ctx.id_counter - self.__frame_service_atoms, 2 * self.__address_length)
 
-        # Remove frame and leave function
-        VirtualStackHelper().load_back_address(opcodes)
-        VirtualStackHelper().remove_frame(opcodes)
-        opcodes.add('JUMP')
+        if not Generator.__ends_with_return(call_body.child_nodes[3]):
+            # Remove frame and leave function, call always leaves one value
+            opcodes.add('PUSH', dec_to_hex(0, 2 * self.__address_length))
+            VirtualStackHelper().load_back_address(opcodes)
+            VirtualStackHelper().remove_frame(opcodes)
+            opcodes.add('JUMP')
+
+        if is_memoized and len(ctx.memo_returns) > 0:
+            # Returns of memoized function: save result and leave function
+            opcodes.add('JUMPDEST')
+            for i in ctx.memo_returns:
+                opcodes.set_target(i, opcodes.list[-1])
+            Memoization().add_store(index, ctx, opcodes)
+            VirtualStackHelper().load_back_address(opcodes)
+            VirtualStackHelper().remove_frame(opcodes)
+            opcodes.add('JUMP')
+
+
+    @staticmethod
+    def __ends_with_return(body: AstNode) -> bool:
+        if is_call(body, 'return'):
+            return True
+        return body.type == AstNodeType.List and len(body.child_nodes) > 0 and \
+            body.child_nodes[0].type == AstNodeType.List and Generator.__ends_with_return(body.child_nodes[-1])
+
+
+def _init_worker(address_length: int, frame_service_atoms: int, forms: List[Optional[str]], memo_slots: int,
+                 memo_tables: Dict[int, int]):
+    # Processes started with spawn have no singletons of the parent one
+    Generator(None, address_length, frame_service_atoms, memo_slots=memo_slots)
+    Declared().set_forms(forms)
+    Memoization().set_tables(memo_tables)
+
+
+def _compile_fragment(task: Tuple[int, AstNode]) -> tuple:
+    return Generator().compile_fragment(task[1], task[0]).pack(task[1])
 
 
 class SpecialForms(metaclass=Singleton):
@@ -160,6 +322,7 @@ class SpecialForms(metaclass=Singleton):
 
     def __init__(self, address_length: int):
         self.__funcs = {
+            'setq': SpecialForms.__setq,
             'cond': SpecialForms.__cond,
             'while': SpecialForms.__while,
             'break': SpecialForms.__break
@@ -174,6 +337,18 @@ class SpecialForms(metaclass=Singleton):
     def call(self, body: AstNode, ctx: Context, opcodes: OpcodeList, generator: Generator):
         self.__funcs[body.child_nodes[0].value](self, body, ctx, opcodes, generator)
 
+    def __setq(self, body: AstNode, ctx: Context, opcodes: OpcodeList, generator: Generator):
+        """
+        INPUT  (0): | EoS |
+        OUTPUT (0): | EoS |
+        """
+        assert len(body.child_nodes) == 3
+
+        generator.process_call(body.child_nodes[2], ctx, opcodes)
+        atom_name = body.child_nodes[1].value
+        address, is_new = ctx.get_atom_addr(atom_name)
+        VirtualStackHelper().store_atom_value(opcodes, address)
+
     def __cond(self, body: AstNode, ctx: Context, opcodes: OpcodeList, generator: Generator):
         """
         INPUT  (0): | EoS |
@@ -181,40 +356,245 @@ class SpecialForms(metaclass=Singleton):
         """
         assert len(body.child_nodes) == 3 or len(body.child_nodes) == 4
 
-        # Conditions check
-        generator.process_call(body.child_nodes[1], ctx, opcodes)
-        # JUMP TO TRUE
-        opcodes.add('PUSH')
-        jump_from_check_to_true = len(opcodes.list) - 1
-        opcodes.add('JUMPI')
-        # JUMP TO ELSE
-        opcodes.add('PUSH')
-        jump_from_check_to_false = len(opcodes.list) - 1
-        opcodes.add('JUMP')
+        # Chain of comparisons of one atom with literals
+        atom_name, cases, default = SpecialForms.__get_dispatch_cases(body)
+        if len(cases) >= MIN_DISPATCH_CASES:
+            return self.__dispatch(atom_name, cases, default, ctx, opcodes, generator)
+
+        # Conditions check, falls through to TRUE BLOCK
+        jumps_from_check_to_false = self.__branch(body.child_nodes[1], False, ctx, opcodes, generator)
         # TRUE BLOCK
+        generator.process_statement(body.child_nodes[2], ctx, opcodes)
+        if len(body.child_nodes) == 4:
+            opcodes.add('PUSH')
+            jump_from_true_to_end = len(opcodes.list) - 1
+            opcodes.add('JUMP')
+            # FALSE BLOCK
+            opcodes.add('JUMPDEST')
+            self.__set_jump_targets(opcodes, jumps_from_check_to_false)
+            generator.process_statement(body.child_nodes[3], ctx, opcodes)
+            # END
+            opcodes.add('JUMPDEST')
+            self.__set_jump_targets(opcodes, [jump_from_true_to_end])
+        else:
+            # END
+            opcodes.add('JUMPDEST')
+            self.__set_jump_targets(opcodes, jumps_from_check_to_false)
+
+    @staticmethod
+    def __get_dispatch_cases(body: AstNode) -> Tuple[Optional[str], List[Tuple[int, AstNode]], Optional[AstNode]]:
+        """
+        Splits chain of cond forms, comparing one atom with literals, into cases and default branch:
+            (cond (equal x 1) A (cond (equal x 2) B C))  ->  x, [(1, A), (2, B)], C
+        """
+        atom_name = None
+        cases = []
+        node = body
+        while is_call(node, 'cond') and (len(node.child_nodes) == 3 or len(node.child_nodes) == 4):
+            condition = node.child_nodes[1]
+            if not is_call(condition, 'equal') or len(condition.child_nodes) != 3:
+                break
+            atom, literal = condition.child_nodes[1:]
+            if atom.type == AstNodeType.Literal:
+                atom, literal = literal, atom
+            if atom.type != AstNodeType.Atom or literal.type != AstNodeType.Literal or \
+                    (atom_name is not None and atom.value != atom_name):
+                break
+
+            atom_name = atom.value
+            # Repeated value can never be matched again
+            if all(literal.value != value for value, branch in cases):
+                cases.append((literal.value, node.child_nodes[2]))
+            if len(node.child_nodes) == 3:
+                return atom_name, cases, None
+            node = node.child_nodes[3]
+        return atom_name, cases, node
+
+    def __dispatch(self, atom_name: str, cases: List[Tuple[int, AstNode]], default: Optional[AstNode], ctx: Context,
+                   opcodes: OpcodeList, generator: Generator):
+        """
+        Jumps straight to the branch matching value of atom, using jump table for dense values
+        and binary search for sparse ones.
+        INPUT  (0): | EoS |
+        OUTPUT (0): | EoS |
+        """
+        values = sorted(value for value, branch in cases)
+        jumps_to_case = {value: [] for value in values}
+        jumps_to_default = []
+
+        address, is_new = ctx.get_atom_addr(atom_name)
+        VirtualStackHelper().load_atom_value(opcodes, address)
+        if values[-1] - values[0] < JUMP_TABLE_DENSITY * len(values):
+            self.__jump_table(values, jumps_to_case, jumps_to_default, opcodes)
+        else:
+            self.__binary_search(values, jumps_to_case, jumps_to_default, opcodes)
+
+        # CASES, atom value is still on stack
+        jumps_to_end = []
+        for value, branch in cases:
+            opcodes.add('JUMPDEST')
+            self.__set_jump_targets(opcodes, jumps_to_case[value])
+            opcodes.add('POP')
+            generator.process_statement(branch, ctx, opcodes)
+            opcodes.add('PUSH')
+            jumps_to_end.append(len(opcodes.list) - 1)
+            opcodes.add('JUMP')
+        # DEFAULT
         opcodes.add('JUMPDEST')
-        block_id = opcodes.list[-1].id
-        opcodes.list[jump_from_check_to_true].extra_value = dec_to_hex(block_id, 2 * self.__address_length)
-        generator.process_call(body.child_nodes[2], ctx, opcodes)
-        opcodes.add('PUSH', )
-        jump_from_true_to_end = len(opcodes.list) - 1
+        self.__set_jump_targets(opcodes, jumps_to_default)
+        opcodes.add('POP')
+        if default is not None:
+            generator.process_statement(default, ctx, opcodes)
+        # END
+        opcodes.add('JUMPDEST')
+        self.__set_jump_targets(opcodes, jumps_to_end)
+
+    def __jump_table(self, values: List[int], jumps_to_case: Dict[int, List[int]], jumps_to_default: List[int],
+                     opcodes: OpcodeList):
+        """
+        Computed jump into table of equally sized stubs, one per value from min to max.
+        INPUT  (1): | EoS | Atom value
+        OUTPUT (1): | EoS | Atom value
+        """
+        table_size = values[-1] - values[0] + 1
+        # JUMPDEST, PUSH with address, JUMP
+        stub_size = self.__address_length + 3
+
+        # Index in table, out of range (including negative) goes to default
+        opcodes.add('DUP1')
+        opcodes.add('PUSH', dec_to_hex(values[0], 2 * self.__address_length))
+        opcodes.add('SWAP1')
+        opcodes.add('SUB')
+        opcodes.add('DUP1')
+        opcodes.add('PUSH', dec_to_hex(table_size, 2 * self.__address_length))
+        opcodes.add('GT')
+        opcodes.add('ISZERO')
+        jump_to_out_of_range = self.__add_jumpi(opcodes)
+
+        opcodes.add('PUSH', dec_to_hex(stub_size, 2 * self.__address_length))
+        opcodes.add('MUL')
+        opcodes.add('PUSH')
+        jump_to_table = len(opcodes.list) - 1
+        opcodes.add('ADD')
         opcodes.add('JUMP')
-        # FALSE BLOCK
+        opcodes.list[-1].jump_targets = []
+        computed_jump = opcodes.list[-1]
+
         opcodes.add('JUMPDEST')
-        block_id = opcodes.list[-1].id
-        opcodes.list[jump_from_check_to_false].extra_value = dec_to_hex(block_id, 2 * self.__address_length)
-        if len(body.child_nodes) == 4:
-            generator.process_call(body.child_nodes[3], ctx, opcodes)
+        self.__set_jump_targets(opcodes, [jump_to_out_of_range])
+        opcodes.add('POP')
         opcodes.add('PUSH')
-        jump_from_false_to_end = len(opcodes.list) - 1
+        jumps_to_default.append(len(opcodes.list) - 1)
         opcodes.add('JUMP')
-        # END
+
+        for value in range(values[0], values[-1] + 1):
+            opcodes.add('JUMPDEST')
+            computed_jump.jump_targets.append(opcodes.list[-1])
+            if value == values[0]:
+                self.__set_jump_targets(opcodes, [jump_to_table])
+            opcodes.add('PUSH')
+            (jumps_to_case[value] if value in jumps_to_case else jumps_to_default).append(len(opcodes.list) - 1)
+            opcodes.add('JUMP')
+
+    def __binary_search(self, values: List[int], jumps_to_case: Dict[int, List[int]], jumps_to_default: List[int],
+                        opcodes: OpcodeList):
+        """
+        INPUT  (1): | EoS | Atom value
+        OUTPUT (1): | EoS | Atom value
+        """
+        if len(values) <= BINARY_SEARCH_LEAF_SIZE:
+            for value in values:
+                opcodes.add('DUP1')
+                opcodes.add('PUSH', dec_to_hex(value, 2 * self.__address_length))
+                opcodes.add('EQ')
+                jumps_to_case[value].append(self.__add_jumpi(opcodes))
+            opcodes.add('PUSH')
+            jumps_to_default.append(len(opcodes.list) - 1)
+            opcodes.add('JUMP')
+            return
+
+        middle = len(values) // 2
+        # If value is less than middle one, jump to the lower half, else fall through to the upper one
+        opcodes.add('DUP1')
+        opcodes.add('PUSH', dec_to_hex(values[middle], 2 * self.__address_length))
+        opcodes.add('GT')
+        jump_to_lower_half = self.__add_jumpi(opcodes)
+        self.__binary_search(values[middle:], jumps_to_case, jumps_to_default, opcodes)
         opcodes.add('JUMPDEST')
-        block_id = opcodes.list[-1].id
-        opcodes.list[jump_from_true_to_end].extra_value = dec_to_hex(block_id, 2 * self.__address_length)
-        opcodes.list[jump_from_false_to_end].extra_value = dec_to_hex(block_id, 2 * self.__address_length)
+        self.__set_jump_targets(opcodes, [jump_to_lower_half])
+        self.__binary_search(values[:middle], jumps_to_case, jumps_to_default, opcodes)
+
+    def __branch(self, condition: AstNode, jump_if: bool, ctx: Context, opcodes: OpcodeList,
+                 generator: Generator) -> List[int]:
+        """
+        Jumps when condition evaluates to jump_if, falls through otherwise.
+        Operands of not, or and and are evaluated lazily: or is non-zero as soon as one of operands is non-zero,
+        and is zero as soon as the first one is zero (for other values its result is bitwise AND of both).
+        Returns indexes of PUSH opcodes which must be patched with the jump target.
+        INPUT  (0): | EoS |
+        OUTPUT (0): | EoS |
+        """
+        if condition.type == AstNodeType.List and condition.child_nodes[0].type == AstNodeType.Atom:
+            name = condition.child_nodes[0].value
+            args = condition.child_nodes[1:]
+
+            if name == 'not' and len(args) == 1:
+                return self.__branch(args[0], not jump_if, ctx, opcodes, generator)
+
+            # Bitwise and of other values may differ from logical one: (and 2 1) is 0
+            if name == 'or' and len(args) == 2 or name == 'and' and len(args) == 2 and is_boolean(condition):
+                # "v1 AND v2" is false as soon as v1 is false, "v1 OR v2" is true as soon as v1 is true
+                if (name == 'and') != jump_if:
+                    return self.__branch(args[0], jump_if, ctx, opcodes, generator) + \
+                           self.__branch(args[1], jump_if, ctx, opcodes, generator)
+                jumps_to_skip = self.__branch(args[0], not jump_if, ctx, opcodes, generator)
+                jumps_to_target = self.__branch(args[1], jump_if, ctx, opcodes, generator)
+                opcodes.add('JUMPDEST')
+                self.__set_jump_targets(opcodes, jumps_to_skip)
+                return jumps_to_target
+
+            if name == 'and' and len(args) == 2:
+                # Zero first operand is the result itself, so it goes right to the test
+                generator.process_call(args[0], ctx, opcodes)
+                opcodes.add('DUP1')
+                opcodes.add('ISZERO')
+                jump_to_test = self.__add_jumpi(opcodes)
+                generator.process_call(args[1], ctx, opcodes)
+                opcodes.add('AND')
+                opcodes.add('JUMPDEST')
+                self.__set_jump_targets(opcodes, [jump_to_test])
+                if not jump_if:
+                    opcodes.add('ISZERO')
+                return [self.__add_jumpi(opcodes)]
+
+            if not jump_if and BuiltIns().has_inverted(name):
+                mirrored = StackScheduling.is_mirrored(condition)
+                for arg in (reversed(args) if mirrored else args):
+                    generator.process_call(arg, ctx, opcodes)
+                BuiltIns().call_inverted(condition, ctx, opcodes, mirrored)
+                return [self.__add_jumpi(opcodes)]
+
+        generator.process_call(condition, ctx, opcodes)
+        if not jump_if:
+            opcodes.add('ISZERO')
+        return [self.__add_jumpi(opcodes)]
+
+    def __add_jumpi(self, opcodes: OpcodeList) -> int:
+        """
+        INPUT  (1): | EoS | Condition
+        OUTPUT (0): | EoS |
+        """
+        opcodes.add('PUSH')
+        jump_index = len(opcodes.list) - 1
+        opcodes.add('JUMPI')
+        return jump_index
+
+    def __set_jump_targets(self, opcodes: OpcodeList, jump_indexes: List[int]):
+        # Last added opcode (JUMPDEST) becomes a target of all listed jumps
+        for i in jump_indexes:
+            opcodes.set_target(i, opcodes.list[-1])
 
-    def __break(self, body: AstNode, ctx: Context, opcodes: OpcodeList):
+    def __break(self, body: AstNode, ctx: Context, opcodes: OpcodeList, generator: Generator):
         """
         INPUT:  | EoS |
         OUTPUT: | EoS |
@@ -222,7 +602,6 @@ class SpecialForms(metaclass=Singleton):
         assert len(body.child_nodes) == 1
         opcodes.add('PUSH', dec_to_hex(0, 2 * self.__address_length))
         opcodes.add('JUMP', dec_to_hex(self.__current_while_id, 2 * self.__address_length))
-        pass
 
     def __while(self, body: AstNode, ctx: Context, opcodes: OpcodeList, generator: Generator):
         """
@@ -233,30 +612,27 @@ class SpecialForms(metaclass=Singleton):
         prev_while = self.__current_while_id
         self.__current_while_id = self.__while_count
         self.__while_count += 1
-        opcodes.add('JUMPDEST', dec_to_hex(self.__current_while_id, 2 * self.__address_length))
-        jumpdest_to_condition_check_id = dec_to_hex(opcodes.list[-1].id, 2 * self.__address_length)
-        generator.process_call(body.child_nodes[1], ctx, opcodes)
-        # if true: jump to while body
-        opcodes.add('PUSH')
-        jump_to_while_body = len(opcodes.list) - 1
-        opcodes.add('JUMPI')
-        # else: jump to while end
+        # Condition is checked at the bottom of the loop, so every iteration takes one jump
         opcodes.add('PUSH')
-        jump_to_while_end = len(opcodes.list) - 1
+        jump_to_condition_check = len(opcodes.list) - 1
         opcodes.add('JUMP')
 
         # while body
         opcodes.add('JUMPDEST')
-        opcodes.list[jump_to_while_body].extra_value = dec_to_hex(opcodes.list[-1].id, 2 * self.__address_length)
-        generator.process_call(body.child_nodes[2], ctx, opcodes)
-        opcodes.add('PUSH', jumpdest_to_condition_check_id)
-        opcodes.add('JUMP')
+        while_body = opcodes.list[-1]
+        generator.process_statement(body.child_nodes[2], ctx, opcodes)
+
+        # if true: jump to while body, else fall through to while end
+        opcodes.add('JUMPDEST', dec_to_hex(self.__current_while_id, 2 * self.__address_length))
+        self.__set_jump_targets(opcodes, [jump_to_condition_check])
+        for i in self.__branch(body.child_nodes[1], True, ctx, opcodes, generator):
+            opcodes.set_target(i, while_body)
+
         # while end
         opcodes.add('JUMPDEST')
-        opcodes.list[jump_to_while_end].extra_value = dec_to_hex(opcodes.list[-1].id, 2 * self.__address_length)
         for i in range(len(opcodes.list)):
             if opcodes.list[i].name == 'JUMP' and opcodes.list[i].extra_value == dec_to_hex(self.__current_while_id,
                                                                                             2 * self.__address_length):
-                opcodes.list[i - 1].extra_value = dec_to_hex(opcodes.list[-1].id, 2 * self.__address_length)
+                opcodes.set_target(i - 1, opcodes.list[-1])
                 opcodes.list[i].extra_value = None
-        BuiltIns.current_while = prev_while
+        self.__current_while_id = prev_while
@@ -1,8 +1,13 @@
+from typing import List, Optional
+
+
 class Context:
     id_counter: int
     __name_by_num: dict
     __num_by_name: dict
     is_prog: bool = False
+    # Indexes of jumps from returns of memoized function to saving of result, None for other functions
+    memo_returns: Optional[List[int]] = None
 
     def __init__(self, frame_service_atoms: int):
         # ZERO reserved for prev gap
@@ -0,0 +1,280 @@
+from typing import Callable, Dict, List, Optional
+
+from opcodes import OpcodeList
+
+WORD_MODULO = 2 ** 256
+SIGN_BIT = 2 ** 255
+MAX_STACK_SIZE = 1024
+
+# Static gas of instructions, memory expansion and exponent size are charged separately
+GAS_COSTS = {
+    'STOP': 0,
+    'ADD': 3,
+    'MUL': 5,
+    'SUB': 3,
+    'DIV': 5,
+    'MOD': 5,
+    'ADDMOD': 8,
+    'MULMOD': 8,
+    'EXP': 10,
+    'LT': 3,
+    'GT': 3,
+    'SLT': 3,
+    'SGT': 3,
+    'EQ': 3,
+    'ISZERO': 3,
+    'AND': 3,
+    'OR': 3,
+    'XOR': 3,
+    'NOT': 3,
+    'SHL': 3,
+    'SHR': 3,
+    'CALLDATALOAD': 3,
+    'POP': 2,
+    'MLOAD': 3,
+    'MSTORE': 3,
+    'JUMP': 8,
+    'JUMPI': 10,
+    'JUMPDEST': 1,
+    'PUSH': 3,
+    'RETURN': 0
+}
+for _i in range(1, 17):
+    GAS_COSTS[f'DUP{_i}'] = 3
+    GAS_COSTS[f'SWAP{_i}'] = 3
+EXP_BYTE_GAS = 50
+
+
+class EvmError(Exception):
+    pass
+
+
+class Instruction:
+    offset: int
+    code: int
+    name: str
+    size: int
+    push_value: Optional[int]
+
+    def __init__(self, offset: int, code: int, name: str, size: int, push_value: Optional[int] = None):
+        self.offset = offset
+        self.code = code
+        self.name = name
+        self.size = size
+        self.push_value = push_value
+
+
+class Program:
+    """
+    Byte code decoded once: instructions, their indexes by offset and valid jump destinations
+    with indexes of their instructions, so jump is checked and taken with one lookup
+    """
+    instructions: List[Instruction]
+    index_by_offset: Dict[int, int]
+    jump_destinations: Dict[int, int]
+
+    def __init__(self, byte_code: str):
+        code = bytes.fromhex(byte_code)
+        names = {int(code, 16): name for name, code in OpcodeList(32).getInstructionCode.items() if name != 'PUSH'}
+
+        self.instructions = []
+        self.index_by_offset = {}
+        self.jump_destinations = {}
+        offset = 0
+        while offset < len(code):
+            op = code[offset]
+            if 0x60 <= op <= 0x7f:
+                size = op - 0x5f + 1
+                value = int.from_bytes(code[offset + 1:offset + size].ljust(size - 1, b'\x00'), 'big')
+                instruction = Instruction(offset, op, 'PUSH', size, value)
+            else:
+                instruction = Instruction(offset, op, names.get(op, 'INVALID'), 1)
+                if instruction.name == 'JUMPDEST':
+                    self.jump_destinations[offset] = len(self.instructions)
+            self.index_by_offset[offset] = len(self.instructions)
+            self.instructions.append(instruction)
+            offset += instruction.size
+
+
+class ExecutionResult:
+    return_data: Optional[bytes]
+    gas_used: int
+    steps: int
+
+    def __init__(self, return_data: Optional[bytes], gas_used: int, steps: int):
+        self.return_data = return_data
+        self.gas_used = gas_used
+        self.steps = steps
+
+    @property
+    def value(self) -> Optional[int]:
+        """
+        Returned word, None if program stopped without RETURN
+        """
+        if self.return_data is None:
+            return None
+        return int.from_bytes(self.return_data, 'big')
+
+
+def memory_gas(words: int) -> int:
+    return 3 * words + words * words // 512
+
+
+class Evm:
+    """
+    Interpreter of the EVM instructions used by the generator, with gas accounting for a single call frame
+    """
+    __gas_limit: int
+
+    def __init__(self, gas_limit: int = 30000000):
+        self.__gas_limit = gas_limit
+
+    def run(self, program: Program, calldata: bytes = b'',
+            trace: Callable[[Instruction, int], None] = None) -> ExecutionResult:
+        """
+        Executes program, calling trace with every instruction and its gas before execution
+        """
+        instructions = program.instructions
+        jump_destinations = program.jump_destinations
+        gas_limit = self.__gas_limit
+
+        stack = []
+        memory = bytearray()
+        gas = 0
+        steps = 0
+        i = 0
+        while i < len(instructions):
+            instruction = instructions[i]
+            name = instruction.name
+            op = instruction.code
+            if name == 'INVALID':
+                raise EvmError(f'Invalid instruction 0x{op:02x} at {instruction.offset}')
+            cost = GAS_COSTS[name]
+            i += 1
+            steps += 1
+
+            if name == 'PUSH':
+                stack.append(instruction.push_value)
+            elif 0x80 <= op <= 0x8f:
+                depth = op - 0x7f
+                if depth > len(stack):
+                    raise EvmError(f'Stack underflow at {instruction.offset}')
+                stack.append(stack[-depth])
+            elif 0x90 <= op <= 0x9f:
+                depth = op - 0x8f + 1
+                if depth > len(stack):
+                    raise EvmError(f'Stack underflow at {instruction.offset}')
+                stack[-1], stack[-depth] = stack[-depth], stack[-1]
+            elif name == 'JUMPDEST':
+                pass
+            elif name in ('MLOAD', 'MSTORE', 'RETURN'):
+                if len(stack) < (1 if name == 'MLOAD' else 2):
+                    raise EvmError(f'Stack underflow at {instruction.offset}')
+                address = stack.pop()
+                size = stack[-1] if name == 'RETURN' else 32
+                end = address + size if size > 0 else 0
+                if end > len(memory):
+                    if end > 2 ** 32:
+                        raise EvmError(f'Out of gas: memory expansion at {instruction.offset}')
+                    words = (end + 31) // 32
+                    cost += memory_gas(words) - memory_gas(len(memory) // 32)
+                    memory.extend(bytes(words * 32 - len(memory)))
+                if name == 'MLOAD':
+                    stack.append(int.from_bytes(memory[address:address + 32], 'big'))
+                elif name == 'MSTORE':
+                    memory[address:address + 32] = stack.pop().to_bytes(32, 'big')
+                else:
+                    stack.pop()
+                    gas += cost
+                    if trace is not None:
+                        trace(instruction, cost)
+                    return ExecutionResult(bytes(memory[address:address + size]), gas, steps)
+            elif name == 'JUMP' or name == 'JUMPI':
+                if len(stack) < (1 if name == 'JUMP' else 2):
+                    raise EvmError(f'Stack underflow at {instruction.offset}')
+                destination = stack.pop()
+                if name == 'JUMP' or stack.pop() != 0:
+                    i = jump_destinations.get(destination, -1)
+                    if i < 0:
+                        raise EvmError(f'Bad jump destination {destination} at {instruction.offset}')
+            elif name == 'STOP':
+                gas += cost
+                if trace is not None:
+                    trace(instruction, cost)
+                return ExecutionResult(None, gas, steps)
+            elif name in BINARY_OPERATIONS:
+                # The most frequent case, result replaces the second operand in place
+                if len(stack) < 2:
+                    raise EvmError(f'Stack underflow at {instruction.offset}')
+                a = stack.pop()
+                stack[-1] = BINARY_OPERATIONS[name](a, stack[-1]) % WORD_MODULO
+            else:
+                cost += self.__execute_operation(instruction, stack, calldata)
+
+            gas += cost
+            if trace is not None:
+                trace(instruction, cost)
+            if gas > gas_limit:
+                raise EvmError(f'Out of gas at {instruction.offset}')
+            if len(stack) > MAX_STACK_SIZE:
+                raise EvmError(f'Stack overflow at {instruction.offset}')
+
+        return ExecutionResult(None, gas, steps)
+
+    @staticmethod
+    def __execute_operation(instruction: Instruction, stack: List[int], calldata: bytes) -> int:
+        """
+        Executes arithmetic, logic or data instruction, returns its dynamic gas
+        """
+        name = instruction.name
+        arity = OPERATION_ARITY[name]
+        if len(stack) < arity:
+            raise EvmError(f'Stack underflow at {instruction.offset}')
+        args = [stack.pop() for _ in range(arity)]
+
+        dynamic_gas = 0
+        if name == 'CALLDATALOAD':
+            offset = args[0]
+            result = int.from_bytes(calldata[offset:offset + 32].ljust(32, b'\x00'), 'big') \
+                if offset < len(calldata) else 0
+        elif name == 'EXP':
+            result = pow(args[0], args[1], WORD_MODULO)
+            dynamic_gas = EXP_BYTE_GAS * ((args[1].bit_length() + 7) // 8)
+        else:
+            result = OPERATIONS[name](*args) % WORD_MODULO
+        if name != 'POP':
+            stack.append(result)
+        return dynamic_gas
+
+
+def _signed(value: int) -> int:
+    return value - WORD_MODULO if value >= SIGN_BIT else value
+
+
+# Operations take arguments in order of popping: top of the stack goes first
+OPERATIONS = {
+    'ADD': lambda a, b: a + b,
+    'MUL': lambda a, b: a * b,
+    'SUB': lambda a, b: a - b,
+    'DIV': lambda a, b: a // b if b != 0 else 0,
+    'MOD': lambda a, b: a % b if b != 0 else 0,
+    'ADDMOD': lambda a, b, n: (a + b) % n if n != 0 else 0,
+    'MULMOD': lambda a, b, n: (a * b) % n if n != 0 else 0,
+    'LT': lambda a, b: int(a < b),
+    'GT': lambda a, b: int(a > b),
+    'SLT': lambda a, b: int(_signed(a) < _signed(b)),
+    'SGT': lambda a, b: int(_signed(a) > _signed(b)),
+    'EQ': lambda a, b: int(a == b),
+    'ISZERO': lambda a: int(a == 0),
+    'AND': lambda a, b: a & b,
+    'OR': lambda a, b: a | b,
+    'XOR': lambda a, b: a ^ b,
+    'NOT': lambda a: WORD_MODULO - 1 - a,
+    'SHL': lambda shift, value: value << shift if shift < 256 else 0,
+    'SHR': lambda shift, value: value >> shift if shift < 256 else 0,
+    'POP': lambda a: 0
+}
+OPERATION_ARITY = {name: operation.__code__.co_argcount for name, operation in OPERATIONS.items()}
+BINARY_OPERATIONS = {name: operation for name, operation in OPERATIONS.items() if OPERATION_ARITY[name] == 2}
+OPERATION_ARITY['CALLDATALOAD'] = 1
+OPERATION_ARITY['EXP'] = 2
@@ -1,4 +1,6 @@
-from AST import AstNode
+from typing import Optional, Tuple
+
+from AST import AstNode, AstNodeType
 from context import Context
 from utils import dec_to_hex
 from memory_stack import VirtualStackHelper
@@ -31,16 +33,60 @@ class BuiltIns(metaclass=Singleton):
 
             'read': self.__read,
 
-            # Special forms setq and return are listed as builtin functions because of similarity with default func
-            'setq': self.__setq,
+            # Special form return is listed as builtin function because of similarity with default func
             'return': self.__return
         }
+        # Multiplication and division by power of two are done with shifts
+        self.__shift_funcs = {
+            'times': 'SHL',
+            'divide': 'SHR'
+        }
+        # Comparisons which leave non-zero exactly when they do not hold, used to lower branch conditions
+        self.__inverted_funcs = {
+            'equal': self.__nonequal_inverted,
+            'nonequal': self.__equal,
+            'less': self.__less_inverted,
+            'lesseq': self.__greater,
+            'greater': self.__greater_inverted,
+            'greatereq': self.__less
+        }
+        # Functions giving the same result with operands in reversed order
+        self.__mirrored_names = {
+            'plus': 'plus',
+            'times': 'times',
+            'equal': 'equal',
+            'nonequal': 'nonequal',
+            'less': 'greater',
+            'lesseq': 'greatereq',
+            'greater': 'less',
+            'greatereq': 'lesseq',
+            'and': 'and',
+            'or': 'or'
+        }
+        # Operations taking operands in reversed order: Value 2 is pushed first
+        self.__mirrored_funcs = {name: self.__funcs[mirror] for name, mirror in self.__mirrored_names.items()}
+        self.__mirrored_funcs['minus'] = self.__minus_mirrored
+        self.__mirrored_funcs['divide'] = self.__divide_mirrored
 
     def has(self, name: str):
         return name in self.__funcs
 
-    def call(self, call_body: AstNode, ctx: Context, opcodes: OpcodeList):
-        self.__funcs[call_body.child_nodes[0].value](call_body, ctx, opcodes)
+    def call(self, call_body: AstNode, ctx: Context, opcodes: OpcodeList, mirrored: bool = False):
+        """
+        Mirrored call takes operands in reversed order, see has_mirrored
+        """
+        funcs = self.__mirrored_funcs if mirrored else self.__funcs
+        funcs[call_body.child_nodes[0].value](call_body, ctx, opcodes)
+
+    def has_mirrored(self, name: str):
+        return name in self.__mirrored_funcs
+
+    def has_inverted(self, name: str):
+        return name in self.__inverted_funcs
+
+    def call_inverted(self, call_body: AstNode, ctx: Context, opcodes: OpcodeList, mirrored: bool = False):
+        name = call_body.child_nodes[0].value
+        self.__inverted_funcs[self.__mirrored_names[name] if mirrored else name](call_body, ctx, opcodes)
 
     def __read(self, body: AstNode, ctx: Context, opcodes: OpcodeList):
         """
@@ -49,22 +95,12 @@ class BuiltIns(metaclass=Singleton):
         """
         assert len(body.child_nodes) == 2
 
-        opcodes.add('PUSH', dec_to_hex(0x20, 2 * self.address_length))
-        opcodes.add('MUL')
+        # Index * 0x20
+        opcodes.add('PUSH', dec_to_hex(5, 2 * self.address_length))
+        opcodes.add('SHL')
 
         opcodes.add('CALLDATALOAD')
 
-    def __setq(self, body: AstNode, ctx: Context, opcodes: OpcodeList):
-        """
-        INPUT  (1): | EoS | New Atom value
-        OUTPUT (0): | EoS |
-        """
-        assert len(body.child_nodes) == 3
-
-        atom_name = body.child_nodes[1].value
-        address, is_new = ctx.get_atom_addr(atom_name)
-        VirtualStackHelper().store_atom_value(opcodes, address)
-
     def __equal(self, body: AstNode, ctx: Context, opcodes: OpcodeList):
         """
         INPUT  (2): | EoS | Value 1 | Value 2
@@ -95,6 +131,36 @@ class BuiltIns(metaclass=Singleton):
         opcodes.add('PUSH', dec_to_hex(0, 2 * self.address_length))
         opcodes.add('EQ')
 
+    def get_shift(self, call_body: AstNode) -> Optional[Tuple[AstNode, int]]:
+        """
+        Returns operand of multiplication or division by power of two and the shift replacing it,
+        shift is taken from the other operand, so both of them may be literals
+        """
+        name = call_body.child_nodes[0].value
+        if name not in self.__shift_funcs or len(call_body.child_nodes) != 3:
+            return None
+        operands = call_body.child_nodes[1:]
+        if name == 'times' and BuiltIns.__is_power_of_two(operands[0]):
+            return operands[1], operands[0].value.bit_length() - 1
+        if BuiltIns.__is_power_of_two(operands[1]):
+            return operands[0], operands[1].value.bit_length() - 1
+        return None
+
+    def call_shift(self, call_body: AstNode, shift: int, ctx: Context, opcodes: OpcodeList):
+        """
+        INPUT  (1): | EoS | Operand returned by get_shift
+        OUTPUT (1): | EoS | Operand shifted by power of two
+        """
+        if shift == 0:
+            return
+
+        opcodes.add('PUSH', dec_to_hex(shift, 2 * self.address_length))
+        opcodes.add(self.__shift_funcs[call_body.child_nodes[0].value])
+
+    @staticmethod
+    def __is_power_of_two(node: AstNode):
+        return node.type == AstNodeType.Literal and 0 < node.value < 2 ** 256 and node.value & (node.value - 1) == 0
+
     def __plus(self, body: AstNode, ctx: Context, opcodes: OpcodeList):
         """
         INPUT  (2): | EoS | Value 1 | Value 2
@@ -114,6 +180,15 @@ class BuiltIns(metaclass=Singleton):
         opcodes.add('SWAP1')
         opcodes.add('SUB')
 
+    def __minus_mirrored(self, body: AstNode, ctx: Context, opcodes: OpcodeList):
+        """
+        INPUT  (2): | EoS | Value 2 | Value 1
+        OUTPUT (1): | EoS | Value 1 - Value 2
+        """
+        assert len(body.child_nodes) == 3
+
+        opcodes.add('SUB')
+
     def __times(self, body: AstNode, ctx: Context, opcodes: OpcodeList):
         """
         INPUT  (2): | EoS | Value 1 | Value 2
@@ -133,6 +208,15 @@ class BuiltIns(metaclass=Singleton):
         opcodes.add('SWAP1')
         opcodes.add('DIV')
 
+    def __divide_mirrored(self, body: AstNode, ctx: Context, opcodes: OpcodeList):
+        """
+        INPUT  (2): | EoS | Value 2 | Value 1
+        OUTPUT (1): | EoS | Value 1 // Value 2
+        """
+        assert len(body.child_nodes) == 3
+
+        opcodes.add('DIV')
+
     def __return(self, body: AstNode, ctx: Context, opcodes: OpcodeList):
         """
         INPUT  (1): | EoS | Some value
@@ -146,6 +230,11 @@ class BuiltIns(metaclass=Singleton):
             opcodes.add('PUSH', dec_to_hex(32, 2 * self.address_length))
             opcodes.add('PUSH', dec_to_hex(0, 2 * self.address_length))
             opcodes.add('RETURN')
+        elif ctx.memo_returns is not None:
+            # Memoized function saves result before leaving
+            opcodes.add('PUSH')
+            ctx.memo_returns.append(len(opcodes.list) - 1)
+            opcodes.add('JUMP')
         else:
             VirtualStackHelper().load_back_address(opcodes)
             VirtualStackHelper().remove_frame(opcodes)
@@ -206,3 +295,33 @@ class BuiltIns(metaclass=Singleton):
         assert len(body.child_nodes) == 3
 
         opcodes.add('AND')
+
+    def __nonequal_inverted(self, body: AstNode, ctx: Context, opcodes: OpcodeList):
+        """
+        INPUT  (2): | EoS | Value 1 | Value 2
+        OUTPUT (1): | EoS | Does Value 1 differs from Value 2 (bool)
+        """
+        assert len(body.child_nodes) == 3
+
+        opcodes.add('EQ')
+        opcodes.add('ISZERO')
+
+    def __less_inverted(self, body: AstNode, ctx: Context, opcodes: OpcodeList):
+        """
+        INPUT  (2): | EoS | Value 1 | Value 2
+        OUTPUT (1): | EoS | Does Value 1 greater or equals Value 2 (bool)
+        """
+        assert len(body.child_nodes) == 3
+
+        opcodes.add('GT')
+        opcodes.add('ISZERO')
+
+    def __greater_inverted(self, body: AstNode, ctx: Context, opcodes: OpcodeList):
+        """
+        INPUT  (2): | EoS | Value 1 | Value 2
+        OUTPUT (1): | EoS | Does Value 1 less or equals Value 2 (bool)
+        """
+        assert len(body.child_nodes) == 3
+
+        opcodes.add('LT')
+        opcodes.add('ISZERO')
@@ -1,21 +1,43 @@
+from bisect import bisect_right
+from typing import List, Optional
+
 from AST import AstNode, AstNodeType
 from context import Context
-from utils import dec_to_hex
 from opcodes import OpcodeList
 from singleton import Singleton
 
 
 class Declared(metaclass=Singleton):
+    """
+    Functions are referred to by index of top level form declaring them, linker replaces it with entry address.
+    Form sees functions declared before it and itself, the latest one if name is declared several times.
+    """
     def __init__(self, address_length, frame_service_atoms):
         self.address_length = address_length
         self.frame_service_atoms = frame_service_atoms
+        # Name -> indexes of declaring forms in ascending order
+        self.__forms = []
         self.__funcs = {}
+        self.__position = 0
 
     def has(self, name: str):
-        return name in self.__funcs
+        return self.__find(name) is not None
+
+    def set_forms(self, forms: List[Optional[str]]):
+        """
+        Takes names of functions declared by top level forms, None for prog
+        """
+        self.__forms = forms
+        self.__funcs = {}
+        for i, name in enumerate(forms):
+            if name is not None:
+                self.__funcs.setdefault(name, []).append(i)
 
-    def add(self, name: str, address: int):
-        self.__funcs[name] = address
+    def get_forms(self) -> List[Optional[str]]:
+        return self.__forms
+
+    def set_position(self, index: int):
+        self.__position = index
 
     def call(self, call_body: AstNode, ctx: Context, opcodes: OpcodeList):
         assert call_body.type == AstNodeType.List
@@ -26,9 +48,15 @@ class Declared(metaclass=Singleton):
         back_address = len(opcodes.list) - 1
 
         # Jump into the function
-        opcodes.add('PUSH', dec_to_hex(self.__funcs[call_body.child_nodes[0].value], 2 * self.address_length))
+        opcodes.add('PUSH')
+        opcodes.list[-1].symbol = self.__find(call_body.child_nodes[0].value)
         opcodes.add('JUMP')
 
         # Prepare back address, part 2
         opcodes.add('JUMPDEST')
-        opcodes.list[back_address].extra_value = dec_to_hex(opcodes.list[-1].id, 2 * self.address_length)
\ No newline at end of file
+        opcodes.set_target(back_address, opcodes.list[-1])
+
+    def __find(self, name: str) -> Optional[int]:
+        indexes = self.__funcs.get(name, [])
+        i = bisect_right(indexes, self.__position)
+        return indexes[i - 1] if i > 0 else None
@@ -0,0 +1,146 @@
+from typing import Dict, List
+
+from AST import AstNode
+from context import Context
+from memory_stack import RESERVED_MEMORY_START, VirtualStackHelper
+from opcodes import OpcodeList
+from singleton import Singleton
+from utils import dec_to_hex
+
+# Slot of table: argument + 1 (zero for empty slot) and result
+SLOT_SIZE = 0x40
+# Frame atom keeping argument + 1 of the call, source atoms consist of letters and digits only
+KEY_ATOM = '#memo'
+
+
+class MemoizationError(Exception):
+    pass
+
+
+class Memoization(metaclass=Singleton):
+    """
+    Results of memoized functions are kept in tables in reserved memory below ZERO FRAME.
+    Entry point of function looks argument up before making a frame, return fills the table on the way out.
+    Table is direct mapped: argument + 1 selects one of slots, so colliding arguments only evict each other.
+    Result depends only on arguments, because frames are private and calldata never changes,
+    so any function of one argument may be memoized.
+    """
+    __address_length: int
+    __slots: int
+    # Index of top level form -> address of its table
+    __tables: Dict[int, int]
+
+    def __init__(self, address_length: int, slots: int):
+        assert slots >= 1 and slots & (slots - 1) == 0
+        self.__address_length = address_length
+        self.__slots = slots
+        self.__tables = {}
+
+    def set_functions(self, forms: List[AstNode], names: List[str]):
+        """
+        Gives table to every declaration of listed functions
+        """
+        self.__tables = {}
+        declared = set()
+        for i, el in enumerate(forms):
+            if el.child_nodes[0].value != 'func' or el.child_nodes[1].value not in names:
+                continue
+            name = el.child_nodes[1].value
+            if len(el.child_nodes[2].child_nodes) != 1:
+                raise MemoizationError(f'Only functions of one argument can be memoized, {name} has '
+                                       f'{len(el.child_nodes[2].child_nodes)}')
+            self.__tables[i] = RESERVED_MEMORY_START + len(self.__tables) * self.__slots * SLOT_SIZE
+            declared.add(name)
+
+        unknown = [name for name in names if name not in declared]
+        if len(unknown) > 0:
+            raise MemoizationError(f'Function {unknown[0]} is not declared')
+        if RESERVED_MEMORY_START + self.get_reserved_size() >= 256 ** self.__address_length:
+            raise MemoizationError(f'Tables do not fit into addresses of {self.__address_length} bytes')
+
+    def get_tables(self) -> Dict[int, int]:
+        return self.__tables
+
+    def set_tables(self, tables: Dict[int, int]):
+        self.__tables = tables
+
+    def get_reserved_size(self) -> int:
+        return len(self.__tables) * self.__slots * SLOT_SIZE
+
+    def has(self, index: int) -> bool:
+        return index in self.__tables
+
+    def add_lookup(self, index: int, opcodes: OpcodeList):
+        """
+        Found result is returned at once, otherwise execution falls through with key for store_key
+        INPUT:  | EoS | Arg | Back address
+        OUTPUT: | EoS | Arg | Key | Back address
+        """
+        opcodes.add('DUP2')
+        opcodes.add('PUSH', dec_to_hex(1, 2 * self.__address_length))
+        opcodes.add('ADD')
+        self.__load_slot_address(index, opcodes)
+
+        # Empty slot has zero key, so key of the largest argument never matches
+        opcodes.add('DUP1')
+        opcodes.add('MLOAD')
+        opcodes.add('DUP3')
+        opcodes.add('EQ')
+        opcodes.add('DUP3')
+        opcodes.add('MUL')
+        opcodes.add('ISZERO')
+        opcodes.add('PUSH')
+        jump_to_miss = len(opcodes.list) - 1
+        opcodes.add('JUMPI')
+
+        # HIT: result replaces argument and goes back
+        opcodes.add('PUSH', dec_to_hex(0x20, 2 * self.__address_length))
+        opcodes.add('ADD')
+        opcodes.add('MLOAD')
+        opcodes.add('SWAP3')
+        opcodes.add('POP')
+        opcodes.add('POP')
+        opcodes.add('JUMP')
+
+        # MISS
+        opcodes.add('JUMPDEST')
+        opcodes.set_target(jump_to_miss, opcodes.list[-1])
+        opcodes.add('POP')
+        opcodes.add('SWAP1')
+
+    def store_key(self, ctx: Context, opcodes: OpcodeList):
+        """
+        Called in new frame, key is kept there because body may change the argument
+        INPUT:  | EoS | Key
+        OUTPUT: | EoS |
+        """
+        address, is_new = ctx.get_atom_addr(KEY_ATOM)
+        VirtualStackHelper().store_atom_value(opcodes, address)
+
+    def add_store(self, index: int, ctx: Context, opcodes: OpcodeList):
+        """
+        INPUT:  | EoS | Result
+        OUTPUT: | EoS | Result
+        """
+        address, is_new = ctx.get_atom_addr(KEY_ATOM)
+        VirtualStackHelper().load_atom_value(opcodes, address)
+        self.__load_slot_address(index, opcodes)
+        opcodes.add('DUP3')
+        opcodes.add('DUP2')
+        opcodes.add('PUSH', dec_to_hex(0x20, 2 * self.__address_length))
+        opcodes.add('ADD')
+        opcodes.add('MSTORE')
+        opcodes.add('MSTORE')
+
+    def __load_slot_address(self, index: int, opcodes: OpcodeList):
+        """
+        INPUT:  | EoS | Key
+        OUTPUT: | EoS | Key | Address of slot
+        """
+        opcodes.add('DUP1')
+        opcodes.add('PUSH', dec_to_hex(self.__slots - 1, 2 * self.__address_length))
+        opcodes.add('AND')
+        opcodes.add('PUSH', dec_to_hex(SLOT_SIZE.bit_length() - 1, 2 * self.__address_length))
+        opcodes.add('SHL')
+        opcodes.add('PUSH', dec_to_hex(self.__tables[index], 2 * self.__address_length))
+        opcodes.add('ADD')
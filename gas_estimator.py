@@ -0,0 +1,574 @@
+import heapq
+from typing import Dict, List, Optional, Set, Tuple
+
+from evm import EXP_BYTE_GAS, GAS_COSTS, MAX_STACK_SIZE, OPERATION_ARITY
+from opcodes import OpcodeList
+from source_map import SourceMapEntry, get_line_starts
+
+# Limit of deployed code size (EIP-170)
+MAX_CODE_SIZE = 24576
+INIT_UNIT = '<init>'
+# Instructions which are not operations of evm module: values taken from stack and put on it
+STACK_EFFECTS = {
+    'PUSH': (0, 1),
+    'POP': (1, 0),
+    'JUMPDEST': (0, 0),
+    'JUMP': (1, 0),
+    'JUMPI': (2, 0),
+    'MLOAD': (1, 1),
+    'MSTORE': (2, 0),
+    'RETURN': (2, 0),
+    'STOP': (0, 0)
+}
+
+
+class BasicBlock:
+    # Indexes of the first opcode and after the last one in OpcodeList
+    start: int
+    end: int
+    offset: int
+    function: Optional[str]
+    min_gas: int
+    max_gas: int
+    # Change of EVM stack height after the block and the highest point inside of it, relative to its start
+    stack_delta: int
+    stack_peak: int
+    # Next block (None if control leaves the function) and function called on the way (None if no call)
+    successors: List[Tuple[Optional[int], Optional[str]]]
+
+    def __init__(self, start: int, offset: int, function: Optional[str]):
+        self.start = start
+        self.end = start
+        self.offset = offset
+        self.function = function
+        self.min_gas = 0
+        self.max_gas = 0
+        self.stack_delta = 0
+        self.stack_peak = 0
+        self.successors = []
+
+
+class LoopEstimate:
+    entry: SourceMapEntry
+    depth: int
+    # Gas of one iteration, None if it contains another loop or unbounded call
+    min_gas: Optional[int]
+    max_gas: Optional[int]
+
+    def __init__(self, entry: SourceMapEntry, depth: int, min_gas: Optional[int], max_gas: Optional[int]):
+        self.entry = entry
+        self.depth = depth
+        self.min_gas = min_gas
+        self.max_gas = max_gas
+
+    def to_json(self) -> dict:
+        return {
+            'offset': self.entry.offset,
+            'form': self.entry.form,
+            'line': self.entry.line,
+            'column': self.entry.column,
+            'depth': self.depth,
+            'iteration_gas': {'min': self.min_gas, 'max': self.max_gas}
+        }
+
+
+class FunctionEstimate:
+    name: str
+    offset: int
+    size: int
+    # Gas from entry to leaving the function, None as max if path is unbounded (loop or recursion)
+    min_gas: Optional[int]
+    max_gas: Optional[int]
+    # Most values on EVM stack above the arguments during the call including callees, None if unbounded
+    max_stack: Optional[int]
+    calls: List[str]
+    recursive: bool
+    loops: List[LoopEstimate]
+    # Function which code runs instead of this one after folding, it has the same figures and no own size
+    alias_of: Optional[str]
+
+    def __init__(self, name: str, offset: int):
+        self.name = name
+        self.offset = offset
+        self.size = 0
+        self.min_gas = None
+        self.max_gas = None
+        self.max_stack = None
+        self.calls = []
+        self.recursive = False
+        self.loops = []
+        self.alias_of = None
+
+    def to_json(self) -> dict:
+        return {
+            'offset': self.offset,
+            'size': self.size,
+            'gas': {'min': self.min_gas, 'max': self.max_gas},
+            'max_stack': self.max_stack,
+            'calls': self.calls,
+            'recursive': self.recursive,
+            'loops': [x.to_json() for x in self.loops],
+            'alias_of': self.alias_of
+        }
+
+
+class GasEstimate:
+    """
+    Static cost of compiled program: exact byte code size and gas bounds per function, prog and loop body.
+    Gas does not include memory expansion, which depends on depth of calls.
+    """
+    size: int
+    min_gas: Optional[int]
+    max_gas: Optional[int]
+    # Most values on EVM stack during execution, None if unbounded (recursion or loop leaving values)
+    max_stack: Optional[int]
+    functions: Dict[str, FunctionEstimate]
+    warnings: List[str]
+
+    def __init__(self):
+        self.size = 0
+        self.min_gas = None
+        self.max_gas = None
+        self.max_stack = None
+        self.functions = {}
+        self.warnings = []
+
+    def check_budget(self, gas_budget: Optional[int] = None, size_budget: Optional[int] = None,
+                     stack_budget: int = MAX_STACK_SIZE) -> bool:
+        """
+        Adds warning for every function over budget, returns True if all of them fit.
+        Program which may overflow stack only gets warning, if stack depth is unbounded.
+        """
+        fits = True
+        if self.size > MAX_CODE_SIZE:
+            self.warnings.append(f'Program size {self.size} exceeds limit of deployed code {MAX_CODE_SIZE}')
+            fits = False
+        if self.max_stack is None:
+            self.warnings.append(f'Stack depth is unbounded (recursion or loop leaving values on stack), '
+                                 f'budget {stack_budget} is not guaranteed')
+        elif self.max_stack > stack_budget:
+            self.warnings.append(f'Stack depth up to {self.max_stack} exceeds budget {stack_budget}')
+            fits = False
+        for function in self.functions.values():
+            # Code of alias is checked once under the name of its function
+            if function.alias_of is not None:
+                continue
+            if size_budget is not None and function.size > size_budget:
+                self.warnings.append(f'{function.name}: size {function.size} exceeds budget {size_budget}')
+                fits = False
+            if gas_budget is None:
+                continue
+            if function.max_gas is not None and function.max_gas > gas_budget:
+                self.warnings.append(f'{function.name}: gas up to {function.max_gas} exceeds budget {gas_budget}')
+                fits = False
+            elif function.max_gas is None:
+                reason = 'recursion' if function.recursive else 'loop or unbounded call'
+                self.warnings.append(f'{function.name}: gas is unbounded ({reason}), budget {gas_budget} '
+                                     f'is not guaranteed')
+                fits = False
+        return fits
+
+    def to_json(self) -> dict:
+        return {
+            'size': self.size,
+            'gas': {'min': self.min_gas, 'max': self.max_gas},
+            'max_stack': self.max_stack,
+            'functions': {name: x.to_json() for name, x in self.functions.items()},
+            'warnings': self.warnings
+        }
+
+
+class GasEstimator:
+    """
+    Splits generated opcodes into basic blocks and builds control flow graph of every function.
+    Jumps with pushed target and computed jumps into tables are followed, other jumps return from function.
+    Call adds gas bounds of callee to the edge to its back address, bounds of all functions are refined together
+    until they stop changing, so recursive functions get min gas of their shortest way out and unbounded max.
+    Loops are strongly connected components of control flow graph, iteration is a way from loop header back to it.
+    Stack depth is found the same way: heights of blocks are propagated from entry, call adds peak of callee
+    and leaves its net change of height, peaks still growing after the last round are unbounded.
+    """
+    __opcodes: OpcodeList
+    __code: Optional[str]
+    __line_starts: Optional[List[int]]
+    __blocks: List[BasicBlock]
+    __block_by_offset: Dict[int, int]
+    __entries: Dict[Optional[str], int]
+    __predecessors: List[List[int]]
+
+    def __init__(self, opcodes: OpcodeList, code: Optional[str] = ''):
+        self.__opcodes = opcodes
+        self.__code = code
+        self.__line_starts = get_line_starts(code) if code is not None else None
+        self.__blocks = []
+        self.__block_by_offset = {}
+        self.__entries = {}
+        self.__predecessors = []
+
+    def run(self) -> GasEstimate:
+        self.__split_blocks()
+        function_offsets = {self.__blocks[i].offset: name for name, i in self.__entries.items() if name != INIT_UNIT}
+        self.__predecessors = [[] for _ in self.__blocks]
+        for i, block in enumerate(self.__blocks):
+            self.__link_block(block, function_offsets)
+            for successor, _ in block.successors:
+                if successor is not None:
+                    self.__predecessors[successor].append(i)
+
+        estimate = GasEstimate()
+        # Folded function -> function it was folded into, entry point lists both of them (tails never include it)
+        aliases: Dict[str, str] = {}
+        for opcode in self.__opcodes.list:
+            size = self.__get_size(opcode.name)
+            estimate.size += size
+            if opcode.function is not None:
+                if opcode.function not in estimate.functions:
+                    estimate.functions[opcode.function] = FunctionEstimate(opcode.function, opcode.id)
+                    for name in sorted(opcode.shared_by) if opcode.shared_by is not None else []:
+                        aliases.setdefault(name, opcode.function)
+                estimate.functions[opcode.function].size += size
+
+        bounds: Dict[Optional[str], Tuple[Optional[int], Optional[int]]] = \
+            {name: (None, None) for name in self.__entries}
+        # Every round resolves one more level of calls
+        for _ in range(len(self.__entries) + 1):
+            bounds = {name: self.__get_bounds(entry, bounds) for name, entry in self.__entries.items()}
+        if INIT_UNIT in bounds:
+            estimate.min_gas, estimate.max_gas = bounds[INIT_UNIT]
+
+        stack_bounds: Dict[Optional[str], Tuple[Optional[int], Optional[int]]] = \
+            {name: (None, None) for name in self.__entries}
+        for _ in range(len(self.__entries) + 1):
+            stack_bounds = {name: self.__get_stack_bounds(entry, stack_bounds)
+                            for name, entry in self.__entries.items()}
+        # One more round: peaks changing in it grow with every level of recursion
+        last_bounds = {name: self.__get_stack_bounds(entry, stack_bounds) for name, entry in self.__entries.items()}
+        max_stacks = {name: x[0] if x[0] == stack_bounds[name][0] else None for name, x in last_bounds.items()}
+        if INIT_UNIT in max_stacks:
+            estimate.max_stack = max_stacks[INIT_UNIT]
+
+        calls = {name: self.__get_calls(entry) for name, entry in self.__entries.items()}
+        for name, function in estimate.functions.items():
+            function.min_gas, function.max_gas = bounds[name]
+            function.max_stack = max_stacks[name]
+            function.calls = sorted(calls[name])
+            function.recursive = name in GasEstimator.__get_reachable(calls[name], calls)
+            reachable = self.__get_reachable_blocks(self.__entries[name])
+            self.__find_loops(reachable, bounds, 0, function.loops)
+
+        for name, target in sorted(aliases.items()):
+            if name in estimate.functions:
+                continue
+            function = estimate.functions[target]
+            alias = FunctionEstimate(name, function.offset)
+            alias.min_gas, alias.max_gas, alias.max_stack = function.min_gas, function.max_gas, function.max_stack
+            alias.calls, alias.recursive, alias.loops = function.calls, function.recursive, function.loops
+            alias.alias_of = target
+            estimate.functions[name] = alias
+        return estimate
+
+    def __split_blocks(self):
+        opcodes = self.__opcodes.list
+        block = None
+        for i, opcode in enumerate(opcodes):
+            function = opcode.function if opcode.function is not None else INIT_UNIT
+            if block is None or opcode.name == 'JUMPDEST' or function != block.function:
+                block = BasicBlock(i, opcode.id, function)
+                self.__block_by_offset[opcode.id] = len(self.__blocks)
+                if function not in self.__entries:
+                    self.__entries[function] = len(self.__blocks)
+                self.__blocks.append(block)
+            block.end = i + 1
+            pops, pushes = GasEstimator.__get_stack_effect(opcode.name)
+            block.stack_peak = max(block.stack_peak, block.stack_delta - pops + pushes)
+            block.stack_delta += pushes - pops
+            block.min_gas += GAS_COSTS[opcode.name]
+            block.max_gas += GAS_COSTS[opcode.name] + (EXP_BYTE_GAS * 32 if opcode.name == 'EXP' else 0)
+            if opcode.name in ('JUMP', 'JUMPI', 'RETURN', 'STOP'):
+                block = None
+
+    def __link_block(self, block: BasicBlock, function_offsets: Dict[int, str]):
+        opcodes = self.__opcodes.list
+        last = opcodes[block.end - 1]
+        target = None
+        if last.name in ('JUMP', 'JUMPI') and block.end - block.start >= 2 and opcodes[block.end - 2].name == 'PUSH':
+            target = int(opcodes[block.end - 2].extra_value, 16)
+        next_block = self.__block_by_offset.get(opcodes[block.end].id) if block.end < len(opcodes) else None
+        if next_block is not None and self.__blocks[next_block].function != block.function:
+            next_block = None
+
+        if last.name == 'JUMP':
+            if target is not None and target in function_offsets:
+                # Call returns to JUMPDEST after the jump, which address was pushed before the callee one
+                is_call = next_block is not None and block.end - block.start >= 3 and \
+                    opcodes[block.end - 3].name == 'PUSH' and int(opcodes[block.end - 3].extra_value, 16) == \
+                    opcodes[block.end].id
+                block.successors.append((next_block if is_call else None, function_offsets[target]))
+            elif target is not None:
+                block.successors.append((self.__block_by_offset[target], None))
+            elif last.jump_targets is not None:
+                block.successors.extend((self.__block_by_offset[x.id], None) for x in last.jump_targets)
+            else:
+                block.successors.append((None, None))
+        elif last.name == 'JUMPI':
+            block.successors.append((self.__block_by_offset[target], None))
+            block.successors.append((next_block, None))
+        elif last.name in ('RETURN', 'STOP'):
+            block.successors.append((None, None))
+        else:
+            block.successors.append((next_block, None))
+
+    def __get_stack_bounds(self, entry: int, stack_bounds: Dict[Optional[str], Tuple[Optional[int], Optional[int]]]) \
+            -> Tuple[Optional[int], Optional[int]]:
+        """
+        Returns peak of stack height from entry of function and its change after leaving the function,
+        both relative to height at entry, with bounds of callees of previous round.
+        Calls of callees with unknown change are not followed. Peak is None if a loop leaves values on stack.
+        """
+        heights = {entry: 0}
+        work = [entry]
+        peak = 0
+        delta = None
+        while len(work) > 0:
+            node = work.pop()
+            block = self.__blocks[node]
+            height = heights[node]
+            peak = max(peak, height + block.stack_peak)
+            height += block.stack_delta
+            for successor, callee in block.successors:
+                next_height = height
+                if callee is not None:
+                    callee_peak, callee_delta = stack_bounds[callee]
+                    if callee_peak is None:
+                        continue
+                    peak = max(peak, height + callee_peak)
+                    if callee_delta is None:
+                        continue
+                    next_height += callee_delta
+                if successor is None:
+                    if callee is None and self.__opcodes.list[block.end - 1].name == 'JUMP':
+                        delta = next_height if delta is None else max(delta, next_height)
+                    continue
+                # Joins take the highest way, it keeps growing only if a loop leaves values on stack
+                if successor not in heights or next_height > heights[successor]:
+                    if next_height > MAX_STACK_SIZE:
+                        return None, delta
+                    heights[successor] = next_height
+                    work.append(successor)
+        return peak, delta
+
+    def __get_bounds(self, entry: int, bounds: Dict[Optional[str], Tuple[Optional[int], Optional[int]]]) \
+            -> Tuple[Optional[int], Optional[int]]:
+        """
+        Returns min and max gas from entry block to leaving the function with callee bounds of previous round
+        """
+        min_gas = self.__get_min_path(entry, None, set(range(len(self.__blocks))), bounds)
+
+        reachable = self.__get_reachable_blocks(entry)
+        if GasEstimator.__has_cycle(reachable, lambda x: [y for y, _ in self.__blocks[x].successors if y is not None]):
+            return min_gas, None
+        return min_gas, self.__get_max_path(entry, None, reachable, bounds)
+
+    def __get_min_path(self, start: int, finish: Optional[int], nodes: Set[int],
+                       bounds: Dict[Optional[str], Tuple[Optional[int], Optional[int]]]) -> Optional[int]:
+        """
+        Dijkstra over blocks: gas of the cheapest way from start through nodes to finish (None is leaving function)
+        """
+        distances = {start: self.__blocks[start].min_gas}
+        queue = [(distances[start], start)]
+        best = None
+        while len(queue) > 0:
+            distance, node = heapq.heappop(queue)
+            if distance > distances[node]:
+                continue
+            for successor, callee in self.__blocks[node].successors:
+                call_gas = bounds[callee][0] if callee is not None else 0
+                if call_gas is None:
+                    continue
+                if successor == finish:
+                    best = distance + call_gas if best is None else min(best, distance + call_gas)
+                    continue
+                if successor is None or successor not in nodes:
+                    continue
+                new_distance = distance + call_gas + self.__blocks[successor].min_gas
+                if successor not in distances or new_distance < distances[successor]:
+                    distances[successor] = new_distance
+                    heapq.heappush(queue, (new_distance, successor))
+        return best
+
+    def __get_max_path(self, start: int, finish: Optional[int], nodes: Set[int],
+                       bounds: Dict[Optional[str], Tuple[Optional[int], Optional[int]]]) -> Optional[int]:
+        """
+        Longest way from start through acyclic nodes to finish, None if it passes unbounded call or there is no way
+        """
+        # Blocks in reversed topological order, so successors are done before the block
+        order = []
+        visited = {start}
+        work = [(start, iter(self.__blocks[start].successors))]
+        while len(work) > 0:
+            node, successors = work[-1]
+            successor, _ = next(successors, (-1, None))
+            if successor == -1:
+                order.append(node)
+                work.pop()
+            elif successor != finish and successor is not None and successor in nodes and successor not in visited:
+                visited.add(successor)
+                work.append((successor, iter(self.__blocks[successor].successors)))
+
+        # Gas from the block to finish, no key if finish is not reachable
+        longest: Dict[int, Optional[int]] = {}
+        for node in order:
+            best = -1
+            for successor, callee in self.__blocks[node].successors:
+                if successor == finish:
+                    rest = 0
+                elif successor in longest:
+                    rest = longest[successor]
+                else:
+                    continue
+                call_gas = bounds[callee][1] if callee is not None else 0
+                if call_gas is None or rest is None:
+                    best = None
+                    break
+                best = max(best, call_gas + rest)
+            if best is None:
+                longest[node] = None
+            elif best >= 0:
+                longest[node] = best + self.__blocks[node].max_gas
+        return longest.get(start)
+
+    def __find_loops(self, nodes: Set[int], bounds: Dict[Optional[str], Tuple[Optional[int], Optional[int]]],
+                     depth: int, loops: List[LoopEstimate]):
+        for component in self.__get_components(nodes):
+            if not self.__is_loop(component):
+                continue
+            header = self.__get_header(component)
+            # Iteration starts at header and ends with jump back to it
+            body = component - {header}
+            min_gas = self.__get_min_path(header, header, body, bounds)
+            has_inner_loop = any(self.__is_loop(x) for x in self.__get_components(body))
+            max_gas = None if has_inner_loop else self.__get_max_path(header, header, body, bounds)
+
+            opcode = self.__opcodes.list[self.__blocks[header].start]
+            entry = SourceMapEntry(opcode.id, opcode.name, opcode.function, opcode.source, self.__code,
+                                   self.__line_starts)
+            loops.append(LoopEstimate(entry, depth, min_gas, max_gas))
+            self.__find_loops(body, bounds, depth + 1, loops)
+
+    def __is_loop(self, component: Set[int]) -> bool:
+        node = next(iter(component))
+        return len(component) > 1 or any(x == node for x, _ in self.__blocks[node].successors)
+
+    def __get_header(self, component: Set[int]) -> int:
+        """
+        Block entered from outside of the loop, the first one if there are several
+        """
+        for node in sorted(component):
+            if any(x not in component for x in self.__predecessors[node]):
+                return node
+        return min(component)
+
+    def __get_components(self, nodes: Set[int]) -> List[Set[int]]:
+        """
+        Strongly connected components of blocks (Tarjan's algorithm without recursion)
+        """
+        index: Dict[int, int] = {}
+        low: Dict[int, int] = {}
+        stack: List[int] = []
+        on_stack: Set[int] = set()
+        components = []
+        for root in sorted(nodes):
+            if root in index:
+                continue
+            work = [(root, 0)]
+            while len(work) > 0:
+                node, i = work.pop()
+                if i == 0:
+                    index[node] = low[node] = len(index)
+                    stack.append(node)
+                    on_stack.add(node)
+                successors = [x for x, _ in self.__blocks[node].successors if x is not None and x in nodes]
+                if i < len(successors):
+                    work.append((node, i + 1))
+                    successor = successors[i]
+                    if successor not in index:
+                        work.append((successor, 0))
+                    elif successor in on_stack:
+                        low[node] = min(low[node], index[successor])
+                    continue
+                if low[node] == index[node]:
+                    component = set()
+                    while True:
+                        x = stack.pop()
+                        on_stack.remove(x)
+                        component.add(x)
+                        if x == node:
+                            break
+                    components.append(component)
+                if len(work) > 0:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+        return components
+
+    def __get_reachable_blocks(self, entry: int) -> Set[int]:
+        reachable = {entry}
+        stack = [entry]
+        while len(stack) > 0:
+            for successor, _ in self.__blocks[stack.pop()].successors:
+                if successor is not None and successor not in reachable:
+                    reachable.add(successor)
+                    stack.append(successor)
+        return reachable
+
+    def __get_calls(self, entry: int) -> Set[str]:
+        return {callee for block in self.__get_reachable_blocks(entry)
+                for _, callee in self.__blocks[block].successors if callee is not None}
+
+    @staticmethod
+    def __get_reachable(start: Set[str], calls: Dict[Optional[str], Set[str]]) -> Set[str]:
+        reachable = set(start)
+        stack = list(start)
+        while len(stack) > 0:
+            for callee in calls.get(stack.pop(), set()):
+                if callee not in reachable:
+                    reachable.add(callee)
+                    stack.append(callee)
+        return reachable
+
+    @staticmethod
+    def __has_cycle(nodes: Set[int], get_successors) -> bool:
+        # 1 - on the way from root, 2 - done
+        state: Dict[int, int] = {}
+        for root in nodes:
+            if root in state:
+                continue
+            work = [(root, iter(get_successors(root)))]
+            state[root] = 1
+            while len(work) > 0:
+                node, successors = work[-1]
+                successor = next(successors, None)
+                if successor is None:
+                    state[node] = 2
+                    work.pop()
+                elif successor in nodes and state.get(successor) == 1:
+                    return True
+                elif successor in nodes and successor not in state:
+                    state[successor] = 1
+                    work.append((successor, iter(get_successors(successor))))
+        return False
+
+    @staticmethod
+    def __get_stack_effect(name: str) -> Tuple[int, int]:
+        """
+        Numbers of values taken from stack and put on it by instruction
+        """
+        if name.startswith('DUP'):
+            return int(name[3:]), int(name[3:]) + 1
+        if name.startswith('SWAP'):
+            return int(name[4:]) + 1, int(name[4:]) + 1
+        if name in STACK_EFFECTS:
+            return STACK_EFFECTS[name]
+        return OPERATION_ARITY[name], 1
+
+    def __get_size(self, name: str) -> int:
+        return 1 + self.__opcodes.address_length if name == 'PUSH' else 1
@@ -0,0 +1,272 @@
+from typing import Callable, Dict, List, Optional
+
+from AST import AST, AstNode, AstNodeType
+from optimizer.ast_utils import is_boolean
+
+WORD_MASK = 2 ** 256 - 1
+
+# Compiled forms take frame (list of atom values) and calldata
+Value = Callable[[List[int], bytes], int]
+# Statements return None to continue, BREAK or instance of Returned
+Statement = Callable[[List[int], bytes], object]
+
+
+class InterpreterError(Exception):
+    pass
+
+
+class Returned:
+    __slots__ = ('value',)
+
+    def __init__(self, value: int):
+        self.value = value
+
+
+BREAK = object()
+
+
+class _Function:
+    """
+    Function compiled into closures, atoms are numbered in order of appearance like in Context
+    """
+    name: str
+    arg_count: int
+    frame_size: int
+    body: Optional[Statement]
+
+    def __init__(self, name: str, arg_count: int):
+        self.name = name
+        self.arg_count = arg_count
+        self.frame_size = arg_count
+        self.body = None
+
+
+class Interpreter:
+    """
+    Executes F-Stroke program without compilation to EVM: AST is turned once into a tree of Python closures.
+    Semantics follow the generator: 256-bit wraparound, division by zero gives zero, read takes a word of calldata,
+    not and and/or of 0/1 values are lazy in conditions of cond and while. Atoms not assigned yet are zero,
+    function ending without return gives zero.
+    """
+    __functions: Dict[str, _Function]
+    __prog: Optional[_Function]
+
+    def __init__(self, ast: AST):
+        # Like in the generator, form sees functions declared before it and itself, the latest one of the same name
+        self.__functions = {}
+        self.__prog = None
+        for el in ast.root.child_nodes:
+            if el.child_nodes[0].value == 'prog':
+                self.__prog = _Function('prog', 0)
+                atoms = {}
+                self.__prog.body = self.__compile_statement(el.child_nodes[1], atoms)
+                self.__prog.frame_size = len(atoms)
+            else:
+                args = el.child_nodes[2].child_nodes
+                func = _Function(el.child_nodes[1].value, len(args))
+                self.__functions[func.name] = func
+                atoms = {arg.value: i for i, arg in enumerate(args)}
+                func.body = self.__compile_statement(el.child_nodes[3], atoms)
+                func.frame_size = len(atoms)
+
+    def run(self, calldata: bytes = b'') -> Optional[int]:
+        """
+        Returns value passed to return of prog, None if prog ends without it
+        """
+        if self.__prog is None:
+            raise InterpreterError('Program has no prog')
+        try:
+            result = self.__prog.body([0] * self.__prog.frame_size, calldata)
+        except RecursionError:
+            raise InterpreterError('Recursion is too deep')
+        if result is BREAK:
+            raise InterpreterError('break outside of while')
+        return result.value if result is not None else None
+
+    def __compile_statement(self, node: AstNode, atoms: Dict[str, int]) -> Statement:
+        if node.type != AstNodeType.List:
+            return Interpreter.__drop_value(self.__compile_value(node, atoms))
+
+        if len(node.child_nodes) == 0:
+            return lambda frame, calldata: None
+
+        if node.child_nodes[0].type == AstNodeType.List:
+            return Interpreter.__block([self.__compile_statement(x, atoms) for x in node.child_nodes])
+
+        name = node.child_nodes[0].value
+        args = node.child_nodes[1:]
+        if name == 'setq':
+            Interpreter.__check_arity(node, 2)
+            index = Interpreter.__get_atom_index(args[0].value, atoms)
+            value = self.__compile_value(args[1], atoms)
+
+            def setq(frame, calldata):
+                frame[index] = value(frame, calldata)
+            return setq
+
+        if name == 'return':
+            Interpreter.__check_arity(node, 1)
+            value = self.__compile_value(args[0], atoms)
+            return lambda frame, calldata: Returned(value(frame, calldata))
+
+        if name == 'break':
+            Interpreter.__check_arity(node, 0)
+            return lambda frame, calldata: BREAK
+
+        if name == 'cond':
+            if len(args) != 2 and len(args) != 3:
+                raise InterpreterError(f'cond expects 2 or 3 arguments, got {len(args)}')
+            test = self.__compile_test(args[0], atoms)
+            then_branch = self.__compile_statement(args[1], atoms)
+            if len(args) == 2:
+                return lambda frame, calldata: then_branch(frame, calldata) if test(frame, calldata) else None
+            else_branch = self.__compile_statement(args[2], atoms)
+            return lambda frame, calldata: then_branch(frame, calldata) if test(frame, calldata) \
+                else else_branch(frame, calldata)
+
+        if name == 'while':
+            Interpreter.__check_arity(node, 2)
+            test = self.__compile_test(args[0], atoms)
+            body = self.__compile_statement(args[1], atoms)
+
+            def loop(frame, calldata):
+                while test(frame, calldata):
+                    result = body(frame, calldata)
+                    if result is BREAK:
+                        return None
+                    if result is not None:
+                        return result
+                return None
+            return loop
+
+        # Value of expression used as statement is dropped
+        return Interpreter.__drop_value(self.__compile_value(node, atoms))
+
+    @staticmethod
+    def __drop_value(value: Value) -> Statement:
+        def statement(frame, calldata):
+            value(frame, calldata)
+        return statement
+
+    @staticmethod
+    def __block(statements: List[Statement]) -> Statement:
+        def block(frame, calldata):
+            for statement in statements:
+                result = statement(frame, calldata)
+                if result is not None:
+                    return result
+            return None
+        return block
+
+    def __compile_test(self, node: AstNode, atoms: Dict[str, int]) -> Callable[[List[int], bytes], bool]:
+        # Same as branch lowering of the generator: operands of not, and, or are lazy in conditions
+        if node.type == AstNodeType.List and len(node.child_nodes) > 0 and \
+                node.child_nodes[0].type == AstNodeType.Atom:
+            name = node.child_nodes[0].value
+            args = node.child_nodes[1:]
+            if name == 'not' and len(args) == 1:
+                inner = self.__compile_test(args[0], atoms)
+                return lambda frame, calldata: not inner(frame, calldata)
+            if name == 'and' and len(args) == 2 and is_boolean(node):
+                left, right = self.__compile_test(args[0], atoms), self.__compile_test(args[1], atoms)
+                return lambda frame, calldata: left(frame, calldata) and right(frame, calldata)
+            if name == 'and' and len(args) == 2:
+                # Bitwise and of other values, which is zero if the first one is zero
+                left, right = self.__compile_value(args[0], atoms), self.__compile_value(args[1], atoms)
+
+                def test(frame, calldata):
+                    value = left(frame, calldata)
+                    return value != 0 and value & right(frame, calldata) != 0
+                return test
+            if name == 'or' and len(args) == 2:
+                left, right = self.__compile_test(args[0], atoms), self.__compile_test(args[1], atoms)
+                return lambda frame, calldata: left(frame, calldata) or right(frame, calldata)
+        value = self.__compile_value(node, atoms)
+        return lambda frame, calldata: value(frame, calldata) != 0
+
+    def __compile_value(self, node: AstNode, atoms: Dict[str, int]) -> Value:
+        if node.type == AstNodeType.Literal:
+            literal = node.value & WORD_MASK
+            return lambda frame, calldata: literal
+
+        if node.type == AstNodeType.Atom:
+            index = Interpreter.__get_atom_index(node.value, atoms)
+            return lambda frame, calldata: frame[index]
+
+        if len(node.child_nodes) == 0 or node.child_nodes[0].type != AstNodeType.Atom:
+            raise InterpreterError('Block of code can not be used as value')
+
+        name = node.child_nodes[0].value
+        args = [self.__compile_value(x, atoms) for x in node.child_nodes[1:]]
+        if name in BINARY_OPERATIONS:
+            Interpreter.__check_arity(node, 2)
+            return BINARY_OPERATIONS[name](args[0], args[1])
+
+        if name == 'not':
+            Interpreter.__check_arity(node, 1)
+            operand = args[0]
+            return lambda frame, calldata: int(operand(frame, calldata) == 0)
+
+        if name == 'read':
+            Interpreter.__check_arity(node, 1)
+            index = args[0]
+
+            def read(frame, calldata):
+                offset = (index(frame, calldata) << 5) & WORD_MASK
+                return int.from_bytes(calldata[offset:offset + 32].ljust(32, b'\x00'), 'big')
+            return read
+
+        if name in self.__functions:
+            return self.__compile_call(self.__functions[name], args)
+
+        raise InterpreterError(f'Unknown function {name}')
+
+    @staticmethod
+    def __compile_call(func: _Function, args: List[Value]) -> Value:
+        if len(args) != func.arg_count:
+            raise InterpreterError(f'{func.name} expects {func.arg_count} arguments, got {len(args)}')
+
+        def call(frame, calldata):
+            callee_frame = [arg(frame, calldata) for arg in args]
+            callee_frame.extend([0] * (func.frame_size - func.arg_count))
+            result = func.body(callee_frame, calldata)
+            if result is BREAK:
+                raise InterpreterError(f'break outside of while in {func.name}')
+            # Like compiled function, the one ending without return gives zero
+            if result is None:
+                return 0
+            return result.value
+        return call
+
+    @staticmethod
+    def __get_atom_index(name: str, atoms: Dict[str, int]) -> int:
+        if name not in atoms:
+            atoms[name] = len(atoms)
+        return atoms[name]
+
+    @staticmethod
+    def __check_arity(node: AstNode, arg_count: int):
+        if len(node.child_nodes) - 1 != arg_count:
+            raise InterpreterError(f'{node.child_nodes[0].value} expects {arg_count} arguments, '
+                                   f'got {len(node.child_nodes) - 1}')
+
+
+# Operations take compiled operands and return compiled expression
+BINARY_OPERATIONS = {
+    'plus': lambda left, right: lambda frame, calldata: (left(frame, calldata) + right(frame, calldata)) & WORD_MASK,
+    'minus': lambda left, right: lambda frame, calldata: (left(frame, calldata) - right(frame, calldata)) & WORD_MASK,
+    'times': lambda left, right: lambda frame, calldata: (left(frame, calldata) * right(frame, calldata)) & WORD_MASK,
+    'divide': lambda left, right: lambda frame, calldata: _divide(left(frame, calldata), right(frame, calldata)),
+    'equal': lambda left, right: lambda frame, calldata: int(left(frame, calldata) == right(frame, calldata)),
+    'nonequal': lambda left, right: lambda frame, calldata: int(left(frame, calldata) != right(frame, calldata)),
+    'less': lambda left, right: lambda frame, calldata: int(left(frame, calldata) < right(frame, calldata)),
+    'lesseq': lambda left, right: lambda frame, calldata: int(left(frame, calldata) <= right(frame, calldata)),
+    'greater': lambda left, right: lambda frame, calldata: int(left(frame, calldata) > right(frame, calldata)),
+    'greatereq': lambda left, right: lambda frame, calldata: int(left(frame, calldata) >= right(frame, calldata)),
+    'and': lambda left, right: lambda frame, calldata: left(frame, calldata) & right(frame, calldata),
+    'or': lambda left, right: lambda frame, calldata: left(frame, calldata) | right(frame, calldata)
+}
+
+
+def _divide(a: int, b: int) -> int:
+    return a // b if b != 0 else 0
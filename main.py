@@ -1,23 +1,157 @@
 import sys
 import argparse
+import json
 import logging
+from typing import Optional
 
 from AST import AST
+from ast_binary import AstFormatError, load_ast, save_ast
+from batch import BatchError, BatchRunner, read_vectors
 from code_generator import Generator
+from evm import MAX_STACK_SIZE, Evm, EvmError, Program
+from fst_functions.memoization import MemoizationError
+from gas_estimator import GasEstimator
+from interpreter import Interpreter, InterpreterError
+from profiler import Profiler
+from source_map import SourceMap
 from tokenizer import TokenList
 
 
+def parse_calldata(value: str) -> bytes:
+    value = value[2:] if value.startswith('0x') else value
+    return bytes.fromhex(value)
+
+
+def get_tree(path: str, is_binary: bool, code: Optional[str]) -> AST:
+    """
+    New tree for every use, optimizer changes it
+    """
+    return load_ast(path) if is_binary else AST(TokenList(code))
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='F-Stroke Language Compiler')
     parser.add_argument('input', type=str, help='File to input with F-Stroke code', default='input.fst')
     parser.add_argument('-o', type=str, help='File to output with Ethereum Byte Code', default='output.ebc')
     parser.add_argument('--hex-size', type=int, help='Size of hex numbers in bytes (max 32)', default=32)
+    parser.add_argument('--no-fold', action='store_true',
+                        help='Keep duplicated code instead of jumping to one shared copy (bigger, but cheaper to run)')
+    parser.add_argument('--unroll-budget', type=int, default=64, metavar='NODES',
+                        help='Max AST nodes of unrolled copies of loop with known number of iterations '
+                             '(default 64, 0 disables unrolling)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of processes compiling functions in parallel (default 1)')
+    parser.add_argument('--source-map', type=str, help='File to output with source map (JSON)')
+    parser.add_argument('--profile', type=parse_calldata, metavar='CALLDATA',
+                        help='Run compiled program with hex calldata and print gas per source form (JSON)')
+    parser.add_argument('--flame-graph', type=str, help='File to output with folded stacks of profiled run')
+    parser.add_argument('--interpret', type=parse_calldata, metavar='CALLDATA',
+                        help='Execute program with hex calldata without compilation and print result')
+    parser.add_argument('--cross-check', action='store_true',
+                        help='With --interpret: also run compiled program in EVM and compare results')
+    parser.add_argument('--estimate', type=str, metavar='FILE',
+                        help='File to output with static size and gas bounds of functions (JSON, - for stdout)')
+    parser.add_argument('--gas-budget', type=int, help='With --estimate: max gas allowed for one function call')
+    parser.add_argument('--size-budget', type=int, help='With --estimate: max size of one function in bytes')
+    parser.add_argument('--stack-budget', type=int, default=MAX_STACK_SIZE,
+                        help=f'With --estimate: max depth of EVM stack (default {MAX_STACK_SIZE})')
+    parser.add_argument('--batch', type=str, metavar='VECTORS',
+                        help='Run compiled program with every hex calldata of file (one per line), '
+                             'using --jobs processes')
+    parser.add_argument('--batch-output', type=str, metavar='FILE', default='-',
+                        help='With --batch: file to output with value and gas of every vector (JSON lines, '
+                             'default - for stdout)')
+    parser.add_argument('--memoize', type=str, action='append', metavar='FUNC',
+                        help='Keep results of function of one argument in table in memory (repeat for several)')
+    parser.add_argument('--memo-slots', type=int, default=256,
+                        help='With --memoize: number of slots in table of every function, power of two (default 256)')
+    parser.add_argument('--save-ast', type=str, metavar='FILE', help='File to output with parsed AST in binary format')
+    parser.add_argument('--load-ast', action='store_true',
+                        help='Input is AST in binary format made by --save-ast instead of F-Stroke code')
     args = parser.parse_args()
 
-    code = open(args.input).read()
-    tokens = TokenList(code)
-    tree = AST(tokens)
+    # Source code is not known for binary AST, source map and estimate have no lines then
+    code = open(args.input).read() if not args.load_ast else None
+    try:
+        tree = get_tree(args.input, args.load_ast, code)
+    except AstFormatError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        sys.exit(1)
+    if args.save_ast is not None:
+        save_ast(tree, args.save_ast)
+
+    if args.interpret is not None:
+        try:
+            result = Interpreter(tree).run(args.interpret)
+        except InterpreterError as e:
+            print(f'Error: {e}', file=sys.stderr)
+            sys.exit(1)
+        print(result)
+        if not args.cross_check:
+            sys.exit(0)
+        try:
+            compiled_result = Evm().run(Program(str(Generator(get_tree(args.input, args.load_ast, code), args.hex_size,
+                                                              fold_code=not args.no_fold, jobs=args.jobs,
+                                                              memoize=args.memoize, memo_slots=args.memo_slots,
+                                                              unroll_budget=args.unroll_budget).run())),
+                                        args.interpret).value
+        except MemoizationError as e:
+            print(f'Error: {e}', file=sys.stderr)
+            sys.exit(1)
+        except EvmError as e:
+            print(f'Error: compiled program failed: {e}', file=sys.stderr)
+            sys.exit(1)
+        if compiled_result != result:
+            print(f'Compiled program returned {compiled_result}', file=sys.stderr)
+            sys.exit(1)
+        sys.exit(0)
+
+    try:
+        generator = Generator(tree, args.hex_size, fold_code=not args.no_fold, jobs=args.jobs, memoize=args.memoize,
+                              memo_slots=args.memo_slots, unroll_budget=args.unroll_budget).run()
+    except MemoizationError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        sys.exit(1)
+    byte_code = str(generator)
     output = open(args.o, 'w+')
-    output.write(str(Generator(tree, args.hex_size).run()))
+    output.write(byte_code)
     output.flush()
     output.close()
+
+    if args.source_map is not None:
+        with open(args.source_map, 'w') as f:
+            json.dump(SourceMap(generator.get_opcodes(), code).to_json(), f)
+
+    if args.profile is not None:
+        profile = Profiler(SourceMap(generator.get_opcodes(), code)).run(byte_code, args.profile)
+        json.dump(profile.to_json(), sys.stdout, indent=2)
+        print()
+        if args.flame_graph is not None:
+            with open(args.flame_graph, 'w') as f:
+                f.write(profile.to_folded())
+
+    if args.batch is not None:
+        try:
+            vectors = read_vectors(args.batch)
+        except BatchError as e:
+            print(f'Error: {e}', file=sys.stderr)
+            sys.exit(1)
+        output = open(args.batch_output, 'w') if args.batch_output != '-' else sys.stdout
+        for result in BatchRunner(byte_code, args.jobs).run(vectors):
+            output.write(json.dumps(result.to_json()) + '\n')
+        if output is not sys.stdout:
+            output.close()
+
+    if args.estimate is not None:
+        estimate = GasEstimator(generator.get_opcodes(), code).run()
+        fits = estimate.check_budget(args.gas_budget, args.size_budget, args.stack_budget)
+        for warning in estimate.warnings:
+            print(f'Warning: {warning}', file=sys.stderr)
+        if args.estimate == '-':
+            json.dump(estimate.to_json(), sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.estimate, 'w') as f:
+                json.dump(estimate.to_json(), f, indent=2)
+        if not fits:
+            sys.exit(1)
@@ -6,7 +6,8 @@ from singleton import Singleton
 Global memory description:
 0x00: Start of current frame AKA CURRENT GAP
 0x20: Temporary register (eg. for swaps)
-0x40: Start of ZERO FRAME
+0x40: Reserved memory (tables of memoized functions), empty by default
+0x40 + reserved size: Start of ZERO FRAME
 
 Frame memory description:
 GAP + 0x00: Start of previout frame
@@ -18,6 +19,8 @@ Symbols:
 EoS - End of Stack
 '''
 
+RESERVED_MEMORY_START = 0x40
+
 
 class VirtualStackHelper(metaclass=Singleton):
     __address_length: int
@@ -27,25 +30,26 @@ class VirtualStackHelper(metaclass=Singleton):
         self.__address_length = address_length
         self.__frame_service_atoms = frame_service_atoms
 
-    def init_stack(self, opcodes: OpcodeList):
+    def init_stack(self, opcodes: OpcodeList, reserved_size: int = 0):
         """
         NO SIDE EFFECTS
         """
-        # Set ZERO FRAME (prog frame) gap = 0x40
-        opcodes.add('PUSH', dec_to_hex(0x40, 2 * self.__address_length))
+        zero_frame = RESERVED_MEMORY_START + reserved_size
+        # Set ZERO FRAME (prog frame) gap
+        opcodes.add('PUSH', dec_to_hex(zero_frame, 2 * self.__address_length))
         opcodes.add('PUSH', dec_to_hex(0, 2 * self.__address_length))
         opcodes.add('MSTORE')
         # Init zero frame
         # Set start of previous frame and back address as 0x00
         opcodes.add('PUSH', dec_to_hex(0x0, 2 * self.__address_length))
         opcodes.add('DUP1')
-        opcodes.add('PUSH', dec_to_hex(0x40, 2 * self.__address_length))
+        opcodes.add('PUSH', dec_to_hex(zero_frame, 2 * self.__address_length))
         opcodes.add('MSTORE')
-        opcodes.add('PUSH', dec_to_hex(0x40 + 0x40, 2 * self.__address_length))
+        opcodes.add('PUSH', dec_to_hex(zero_frame + 0x40, 2 * self.__address_length))
         opcodes.add('MSTORE')
         # Set counter of atoms as 0x00
         opcodes.add('PUSH', dec_to_hex(0x0, 2 * self.__address_length))
-        opcodes.add('PUSH', dec_to_hex(0x40 + 0x20, 2 * self.__address_length))
+        opcodes.add('PUSH', dec_to_hex(zero_frame + 0x20, 2 * self.__address_length))
         opcodes.add('MSTORE')
 
     def store_atom_value(self, opcodes: OpcodeList, atom_address: int):
@@ -146,9 +150,10 @@ class VirtualStackHelper(metaclass=Singleton):
         """
         opcodes.add('PUSH', dec_to_hex(self.__frame_service_atoms * 0x20, 2 * self.__address_length))
 
+        # Atom counter * 0x20
         self.load_cur_atom_counter(opcodes)
-        opcodes.add('PUSH', dec_to_hex(32, 2 * self.__address_length))
-        opcodes.add('MUL')
+        opcodes.add('PUSH', dec_to_hex(5, 2 * self.__address_length))
+        opcodes.add('SHL')
 
         opcodes.add('ADD')
 
@@ -1,4 +1,5 @@
-from typing import Any, List
+from contextlib import contextmanager
+from typing import Any, FrozenSet, List, Optional
 
 from utils import dec_to_hex
 
@@ -7,6 +8,17 @@ class Opcode:
     id: int
     name: str
     extra_value: Any
+    # Innermost source form and function, which code contains the opcode
+    source: Any = None
+    function: Optional[str] = None
+    # Functions running the opcode, when code folding made it shared by several of them
+    shared_by: Optional[FrozenSet[str]] = None
+    # JUMPDEST, which address is pushed by PUSH, kept up to date by OpcodeList.relocate
+    target: Optional['Opcode'] = None
+    # Index of top level form, which entry address is pushed, linker replaces it with target
+    symbol: Optional[int] = None
+    # Possible destinations of computed JUMP, which address is not pushed right before it
+    jump_targets: Optional[List['Opcode']] = None
     __counter = 0
     __instruction_set: dict = None
 
@@ -35,10 +47,14 @@ class Opcode:
 class OpcodeList:
     list: List[Opcode]
     address_length: int
+    current_source: Any
+    current_function: Optional[str]
 
     def __init__(self, address_length):
         self.list = []
         self.address_length = address_length
+        self.current_source = None
+        self.current_function = None
         self.getInstructionCode = {
         'STOP': '00',
         'ADD': '01',
@@ -59,7 +75,10 @@ class OpcodeList:
         'OR': '17',
         'XOR': '18',
         'NOT': '19',
+        'SHL': '1b',
+        'SHR': '1c',
         'CALLDATALOAD': '35',
+        'POP': '50',
         'MLOAD': '51',
         'MSTORE': '52',
         'JUMP': '56',
@@ -71,12 +90,95 @@ class OpcodeList:
         'SWAP1': '90',
         'RETURN': 'f3'
     }
+        for i in range(1, 17):
+            self.getInstructionCode[f'DUP{i}'] = hex(0x80 + i - 1)[2:]
+            self.getInstructionCode[f'SWAP{i}'] = hex(0x90 + i - 1)[2:]
 
     def add(self, name: str, extra_value=None):
         self.list.append(Opcode(name, self.address_length, extra_value, self.getInstructionCode))
+        self.list[-1].source = self.current_source
+        self.list[-1].function = self.current_function
+
+    def set_target(self, index: int, target: Opcode):
+        """
+        Makes PUSH at index push address of target JUMPDEST
+        """
+        self.list[index].target = target
+        self.list[index].extra_value = dec_to_hex(target.id, 2 * self.address_length)
+
+    def relocate(self):
+        """
+        Renumbers opcodes after some of them were removed or inserted and updates pushed addresses of targets
+        """
+        offset = 0
+        for opcode in self.list:
+            opcode.id = offset
+            offset += 1 + self.address_length if opcode.name == 'PUSH' else 1
+        for opcode in self.list:
+            if opcode.target is not None:
+                opcode.extra_value = dec_to_hex(opcode.target.id, 2 * self.address_length)
+
+    def pack(self, root) -> tuple:
+        """
+        Compact copy of list, which is fast to send between processes. Opcodes refer to each other by indexes
+        and to source forms by numbers in preorder traversal of root, see unpack.
+        """
+        numbers = {id(node): i for i, node in enumerate(_preorder(root))}
+        indexes = {id(opcode): i for i, opcode in enumerate(self.list)}
+        return self.current_function, [(
+            opcode.name,
+            opcode.extra_value,
+            numbers.get(id(opcode.source), -1),
+            indexes[id(opcode.target)] if opcode.target is not None else -1,
+            opcode.symbol,
+            [indexes[id(x)] for x in opcode.jump_targets] if opcode.jump_targets is not None else None,
+            opcode.function
+        ) for opcode in self.list]
+
+    @staticmethod
+    def unpack(packed: tuple, root, address_length: int) -> 'OpcodeList':
+        """
+        Restores list made by pack, root must be a copy of the one passed to pack
+        """
+        opcodes = OpcodeList(address_length)
+        nodes = _preorder(root)
+        opcodes.current_function, items = packed
+        for name, extra_value, source, target, symbol, jump_targets, function in items:
+            opcode = Opcode(name, address_length, extra_value, opcodes.getInstructionCode)
+            opcode.source = nodes[source] if source >= 0 else None
+            opcode.symbol = symbol
+            opcode.function = function
+            opcodes.list.append(opcode)
+        for opcode, (_, _, _, target, _, jump_targets, _) in zip(opcodes.list, items):
+            if target >= 0:
+                opcode.target = opcodes.list[target]
+            if jump_targets is not None:
+                opcode.jump_targets = [opcodes.list[x] for x in jump_targets]
+        return opcodes
+
+    @contextmanager
+    def source(self, node):
+        """
+        Marks opcodes added inside of the block as generated for provided AST node.
+        Nodes made by optimizer without position in source code keep the enclosing one.
+        """
+        previous = self.current_source
+        if node.start is not None:
+            self.current_source = node
+        try:
+            yield
+        finally:
+            self.current_source = previous
 
     def get_str(self):
-        res = ''
-        for oc in self.list:
-            res += oc.get_str()
-        return res
\ No newline at end of file
+        return ''.join(oc.get_str() for oc in self.list)
+
+
+def _preorder(root) -> list:
+    nodes = []
+    stack = [root]
+    while len(stack) > 0:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(reversed(node.child_nodes))
+    return nodes
@@ -0,0 +1,64 @@
+from typing import Dict
+
+from AST import AstNode, AstNodeType
+
+
+# Builtins, which result depends only on arguments (calldata does not change during execution)
+PURE_FUNCTIONS = {
+    'plus', 'minus', 'times', 'divide',
+    'equal', 'nonequal', 'less', 'lesseq', 'greater', 'greatereq',
+    'and', 'or', 'not',
+    'read'
+}
+
+# Builtins, which result is always 0 or 1
+BOOLEAN_FUNCTIONS = {'equal', 'nonequal', 'less', 'lesseq', 'greater', 'greatereq', 'not'}
+
+
+def is_call(node: AstNode, name: str) -> bool:
+    return node.type == AstNodeType.List and len(node.child_nodes) > 0 and \
+           node.child_nodes[0].type == AstNodeType.Atom and node.child_nodes[0].value == name
+
+
+def is_pure(node: AstNode) -> bool:
+    if node.type != AstNodeType.List:
+        return True
+    if len(node.child_nodes) == 0 or node.child_nodes[0].type != AstNodeType.Atom or \
+            node.child_nodes[0].value not in PURE_FUNCTIONS:
+        return False
+    return all(is_pure(x) for x in node.child_nodes[1:])
+
+
+def is_boolean(node: AstNode) -> bool:
+    """
+    Whether value of expression is always 0 or 1, so bitwise and of such values is logical one
+    and both its operands may be branched on in conditions
+    """
+    if node.type == AstNodeType.Literal:
+        return node.value in (0, 1)
+    if node.type != AstNodeType.List or len(node.child_nodes) == 0 or node.child_nodes[0].type != AstNodeType.Atom:
+        return False
+    name = node.child_nodes[0].value
+    if name == 'and' or name == 'or':
+        return len(node.child_nodes) == 3 and all(is_boolean(x) for x in node.child_nodes[1:])
+    return name in BOOLEAN_FUNCTIONS
+
+
+def make_call(name: str, *args: AstNode) -> AstNode:
+    node = AstNode(AstNodeType.List, None)
+    node.add_child(AstNode(AstNodeType.Atom, name))
+    for arg in args:
+        node.add_child(arg)
+    return node
+
+
+def to_key(node: AstNode, atom_versions: Dict[str, int] = None) -> str:
+    """
+    Textual form of expression, equal for structurally equal expressions.
+    If atom versions are provided, atoms reassigned in between give different keys.
+    """
+    if node.type == AstNodeType.Atom and atom_versions is not None:
+        return f'{node.value}@{atom_versions.get(node.value, 0)}'
+    if node.type != AstNodeType.List:
+        return str(node.value)
+    return '(' + ' '.join(to_key(x, atom_versions) for x in node.child_nodes) + ')'
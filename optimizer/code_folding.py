@@ -0,0 +1,248 @@
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from opcodes import Opcode, OpcodeList
+
+TERMINATORS = ('JUMP', 'RETURN', 'STOP')
+
+
+class CodeFolding:
+    """
+    Removes duplicated byte code after generation, jumps refer to JUMPDEST labels and are relocated at the end.
+    Functions with the same code are folded into one, calls of the others go to it.
+    Blocks ending with the same instructions before leaving (JUMP, RETURN, STOP) share one copy of the tail,
+    the others jump to it (cross-jumping), when it makes code shorter.
+    Stubs of jump tables are never changed, they must stay equally sized.
+    Code left for several functions lists all of them in shared_by, its function is the one it was taken from.
+    """
+    __opcodes: OpcodeList
+
+    def __init__(self, opcodes: OpcodeList):
+        self.__opcodes = opcodes
+
+    def run(self):
+        while self.__fold_functions():
+            pass
+        while self.__merge_tails():
+            pass
+        self.__opcodes.relocate()
+
+    def __fold_functions(self) -> bool:
+        """
+        Removes all copies of duplicated functions but the first ones, returns False if there are no duplicates
+        """
+        opcodes = self.__opcodes.list
+        extents: List[Tuple[int, int]] = []
+        for i, opcode in enumerate(opcodes):
+            if opcode.function is None or opcode.function == 'prog':
+                continue
+            if len(extents) > 0 and extents[-1][1] == i and opcodes[i - 1].function == opcode.function:
+                extents[-1] = (extents[-1][0], i + 1)
+            else:
+                extents.append((i, i + 1))
+
+        seen: Dict[tuple, Opcode] = {}
+        kept: Dict[tuple, List[Opcode]] = {}
+        # Entry of duplicate -> entry of the first copy
+        replaced: Dict[int, Opcode] = {}
+        duplicates: List[Tuple[int, int]] = []
+        for start, end in extents:
+            key = self.__get_function_key(start, end)
+            if key in seen:
+                replaced[id(opcodes[start])] = seen[key]
+                duplicates.append((start, end))
+                CodeFolding.__share(kept[key], opcodes[start:end])
+            else:
+                seen[key] = opcodes[start]
+                kept[key] = opcodes[start:end]
+        if len(duplicates) == 0:
+            return False
+
+        # Calls of duplicates go to the first copies, callers may become equal in the next pass
+        for opcode in opcodes:
+            if opcode.target is not None and id(opcode.target) in replaced:
+                opcode.target = replaced[id(opcode.target)]
+        for start, end in reversed(duplicates):
+            del opcodes[start:end]
+        return True
+
+    def __get_function_key(self, start: int, end: int) -> tuple:
+        # Labels inside of function are replaced with their positions, so copies get equal keys
+        local = {id(opcode): i - start for i, opcode in enumerate(self.__opcodes.list[start:end], start)}
+        key = []
+        for opcode in self.__opcodes.list[start:end]:
+            if opcode.target is not None:
+                value = ('local', local[id(opcode.target)]) if id(opcode.target) in local \
+                    else ('label', id(opcode.target))
+            else:
+                value = opcode.extra_value if opcode.name == 'PUSH' else None
+            targets = tuple(local.get(id(x), id(x)) for x in opcode.jump_targets) \
+                if opcode.jump_targets is not None else None
+            key.append((opcode.name, value, targets))
+        return tuple(key)
+
+    def __merge_tails(self) -> bool:
+        """
+        Makes one pass over blocks: block either keeps its tail (and may share it with several others)
+        or jumps to the longest equal tail of another block. Returns False if nothing is merged.
+        """
+        opcodes = self.__opcodes.list
+        pinned: Set[int] = set()
+        pushed_as_data: Set[int] = set()
+        # Entry points of functions stay where calls expect them
+        entries: Set[int] = set()
+        # JUMPDEST -> opcodes pushing its address
+        references: Dict[int, List[Opcode]] = {}
+        for i, opcode in enumerate(opcodes):
+            if opcode.target is not None:
+                references.setdefault(id(opcode.target), []).append(opcode)
+            if opcode.function is not None and (i == 0 or opcodes[i - 1].function != opcode.function):
+                entries.add(id(opcode))
+            if opcode.jump_targets is not None:
+                pinned.update(id(x) for x in opcode.jump_targets)
+            # Back addresses are compared with offsets of the calls by profiler and estimator
+            if opcode.target is not None and (i + 1 == len(opcodes) or opcodes[i + 1].name not in ('JUMP', 'JUMPI')):
+                pushed_as_data.add(id(opcode.target))
+
+        # Bodies of blocks without leading JUMPDEST
+        blocks = [(x[0] + (opcodes[x[0]].name == 'JUMPDEST'), x[1]) for x in self.__get_blocks()
+                  if opcodes[x[1] - 1].name in TERMINATORS and id(opcodes[x[0]]) not in pinned]
+        # Trie of reversed bodies: node is [children by key, blocks passing through it, index of first usable one]
+        root = [{}, [], 0]
+        paths: List[List[list]] = []
+        for b, (start, end) in enumerate(blocks):
+            node = root
+            paths.append([])
+            for i in range(end - 1, start - 1, -1):
+                key = self.__get_key(i)
+                if key not in node[0]:
+                    node[0][key] = [{}, [], 0]
+                node = node[0][key]
+                node[1].append(b)
+                paths[-1].append(node)
+
+        # Cheapest way of reaching tail is PUSH with JUMP
+        jump_size = self.__opcodes.address_length + 2
+        # Blocks which tails are jumped to are never replaced themselves and vice versa
+        keeping: Set[int] = set()
+        replaced: Set[int] = set()
+        # Index of the first opcode of tail in the kept block -> label
+        labels: Dict[int, Opcode] = {}
+        edits: List[Tuple[int, int, List[Opcode]]] = []
+        for b, (b_start, b_end) in enumerate(blocks):
+            if b in keeping:
+                continue
+            tail_size = [0]
+            for i in range(b_end - 1, b_start - 1, -1):
+                tail_size.append(tail_size[-1] + self.__get_size(opcodes[i]))
+
+            for length in range(len(paths[b]), 0, -1):
+                if tail_size[length] <= jump_size:
+                    break
+                a = self.__find_kept_block(paths[b][length - 1], b, replaced)
+                if a is None:
+                    continue
+                a_start, a_end = blocks[a]
+                tail_start = a_end - length
+                has_label = tail_start in labels or (tail_start == a_start and a_start > 0 and
+                                                     opcodes[a_start - 1].name == 'JUMPDEST' and
+                                                     id(opcodes[a_start - 1]) not in entries)
+                if tail_size[length] - jump_size - (0 if has_label else 1) <= 0:
+                    break
+
+                keeping.add(a)
+                replaced.add(b)
+                if tail_start not in labels:
+                    if has_label:
+                        labels[tail_start] = opcodes[a_start - 1]
+                    else:
+                        labels[tail_start] = self.__make('JUMPDEST', opcodes[tail_start])
+                        edits.append((tail_start, tail_start, [labels[tail_start]]))
+                CodeFolding.__share([labels[tail_start]] + opcodes[tail_start:a_end], opcodes[b_end - length:b_end])
+                self.__jump_to_tail(b_end - length, b_end, labels[tail_start], pushed_as_data, entries, references,
+                                    edits)
+                break
+
+        if len(edits) == 0:
+            return False
+        # Edits go from the end, so indexes of the following ones stay valid
+        for start, end, replacement in sorted(edits, key=lambda x: (x[0], x[1]), reverse=True):
+            opcodes[start:end] = replacement
+        return True
+
+    @staticmethod
+    def __share(kept: List[Opcode], removed: List[Opcode]):
+        """
+        Kept copy of code runs for functions of both copies, profiler charges it to the calling one.
+        Opcodes of one tail refer to the same set of names, so it is joined once per distinct set.
+        """
+        groups: Dict[int, FrozenSet[str]] = {}
+        functions: Set[str] = set()
+        for opcode in kept + removed:
+            if opcode.shared_by is not None:
+                groups.setdefault(id(opcode.shared_by), opcode.shared_by)
+            elif opcode.function is not None:
+                functions.add(opcode.function)
+        names = frozenset(functions).union(*groups.values())
+        if len(names) < 2:
+            return
+        for opcode in kept:
+            opcode.shared_by = names
+
+    @staticmethod
+    def __find_kept_block(node: list, b: int, replaced: Set[int]) -> Optional[int]:
+        # Replaced blocks stay so till the end of the pass, so they are skipped for good
+        while node[2] < len(node[1]) and node[1][node[2]] in replaced:
+            node[2] += 1
+        for a in node[1][node[2]:]:
+            if a != b and a not in replaced:
+                return a
+        return None
+
+    def __jump_to_tail(self, start: int, end: int, label: Opcode, pushed_as_data: Set[int], entries: Set[int],
+                       references: Dict[int, List[Opcode]], edits: List[Tuple[int, int, List[Opcode]]]):
+        opcodes = self.__opcodes.list
+        whole_block = start > 0 and opcodes[start - 1].name == 'JUMPDEST' and \
+            id(opcodes[start - 1]) not in pushed_as_data and id(opcodes[start - 1]) not in entries and \
+            (start == 1 or opcodes[start - 2].name in TERMINATORS)
+        if whole_block:
+            # Nothing falls through into the block, so it is removed and its label is replaced
+            for opcode in references.get(id(opcodes[start - 1]), []):
+                opcode.target = label
+            edits.append((start - 1, end, []))
+        else:
+            jump = [self.__make('PUSH', opcodes[end - 1]), self.__make('JUMP', opcodes[end - 1])]
+            jump[0].target = label
+            edits.append((start, end, jump))
+
+    def __get_blocks(self) -> List[Tuple[int, int]]:
+        blocks = []
+        start = 0
+        for i, opcode in enumerate(self.__opcodes.list):
+            if opcode.name == 'JUMPDEST' and i > start:
+                blocks.append((start, i))
+                start = i
+            if opcode.name in TERMINATORS or opcode.name == 'JUMPI':
+                blocks.append((start, i + 1))
+                start = i + 1
+        if start < len(self.__opcodes.list):
+            blocks.append((start, len(self.__opcodes.list)))
+        return blocks
+
+    def __get_key(self, i: int) -> tuple:
+        opcode = self.__opcodes.list[i]
+        if opcode.target is not None:
+            value = ('label', id(opcode.target))
+        else:
+            value = opcode.extra_value if opcode.name == 'PUSH' else None
+        targets = tuple(id(x) for x in opcode.jump_targets) if opcode.jump_targets is not None else None
+        return opcode.name, value, targets
+
+    def __make(self, name: str, like: Opcode) -> Opcode:
+        opcode = Opcode(name, self.__opcodes.address_length, None, self.__opcodes.getInstructionCode)
+        opcode.source = like.source
+        opcode.function = like.function
+        opcode.shared_by = like.shared_by
+        return opcode
+
+    def __get_size(self, opcode: Opcode) -> int:
+        return 1 + self.__opcodes.address_length if opcode.name == 'PUSH' else 1
@@ -0,0 +1,162 @@
+from typing import Dict, List, Set, Tuple
+
+from AST import AstNode, AstNodeType
+from context import Context
+from fst_functions.builtin import BuiltIns
+from memory_stack import VirtualStackHelper
+from opcodes import OpcodeList
+from optimizer.ast_utils import is_call, is_pure, to_key
+from optimizer.stack_scheduling import StackScheduling
+
+MAX_DUP_DEPTH = 16
+
+
+class CommonSubexpressions:
+    """
+    Evaluates straight-line run of assignments (optionally ended with return) so that every pure subexpression,
+    repeated in the run, is computed once and then copied with DUP.
+    Copies are pushed before the statement where subexpression occurs first, live on EVM stack under values
+    of the following statements and are popped at the end of the run.
+    Every setq bumps version of its atom, so values computed before assignment are never reused after it.
+    Function calls, branches and loops are not allowed inside of run, so they invalidate all copies.
+    """
+    __ctx: Context
+    __opcodes: OpcodeList
+    __atom_versions: Dict[str, int]
+    __stack_positions: Dict[str, int]
+    __height: int
+
+    def __init__(self, generator, ctx: Context, opcodes: OpcodeList):
+        self.__generator = generator
+        self.__ctx = ctx
+        self.__opcodes = opcodes
+        self.__atom_versions = {}
+        # Position of copy on EVM stack counting from the start of the run
+        self.__stack_positions = {}
+        self.__height = 0
+
+    @staticmethod
+    def get_run_length(statements: List[AstNode], start: int) -> int:
+        length = 0
+        for statement in statements[start:]:
+            if is_call(statement, 'setq') and len(statement.child_nodes) == 3 and \
+                    statement.child_nodes[1].type == AstNodeType.Atom and is_pure(statement.child_nodes[2]):
+                length += 1
+            elif is_call(statement, 'return') and len(statement.child_nodes) == 2 and \
+                    is_pure(statement.child_nodes[1]):
+                return length + 1
+            else:
+                break
+        return length
+
+    def process_run(self, statements: List[AstNode]):
+        """
+        INPUT  (0): | EoS |
+        OUTPUT (0): | EoS |
+        """
+        prepared = self.__find_reused(statements)
+        if not any(prepared):
+            for statement in statements:
+                self.__generator.process_call(statement, self.__ctx, self.__opcodes)
+            return
+
+        for statement, subexpressions in zip(statements, prepared):
+            with self.__opcodes.source(statement):
+                self.__process_statement(statement, subexpressions)
+            if is_call(statement, 'return'):
+                return
+
+        for _ in range(len(self.__stack_positions)):
+            self.__opcodes.add('POP')
+
+    def __process_statement(self, statement: AstNode, subexpressions: List[Tuple[str, AstNode]]):
+        """
+        INPUT  (0): | EoS | Copies
+        OUTPUT (0): | EoS | Copies
+        """
+        for key, node in subexpressions:
+            self.__process_value(node)
+            self.__stack_positions[key] = self.__height
+        self.__process_value(statement.child_nodes[-1])
+
+        if is_call(statement, 'return'):
+            if not self.__ctx.is_prog:
+                # Remove copies under the returned value
+                for _ in range(len(self.__stack_positions)):
+                    self.__opcodes.add('SWAP1')
+                    self.__opcodes.add('POP')
+            BuiltIns().call(statement, self.__ctx, self.__opcodes)
+            return
+
+        atom_name = statement.child_nodes[1].value
+        address, is_new = self.__ctx.get_atom_addr(atom_name)
+        VirtualStackHelper().store_atom_value(self.__opcodes, address)
+        self.__height -= 1
+        self.__atom_versions[atom_name] = self.__atom_versions.get(atom_name, 0) + 1
+
+    def __find_reused(self, statements: List[AstNode]) -> List[List[Tuple[str, AstNode]]]:
+        """
+        Returns subexpressions to be computed before every statement, inner ones go first
+        """
+        seen: Set[str] = set()
+        reused: Set[str] = set()
+        first_occurrences: List[List[Tuple[str, AstNode]]] = []
+        atom_versions: Dict[str, int] = {}
+        for statement in statements:
+            first_occurrences.append([])
+            CommonSubexpressions.__visit(statement.child_nodes[-1], atom_versions, seen, reused, first_occurrences[-1])
+            if is_call(statement, 'setq'):
+                atom_name = statement.child_nodes[1].value
+                atom_versions[atom_name] = atom_versions.get(atom_name, 0) + 1
+        return [[x for x in occurrences if x[0] in reused] for occurrences in first_occurrences]
+
+    @staticmethod
+    def __visit(node: AstNode, atom_versions: Dict[str, int], seen: Set[str], reused: Set[str],
+                first_occurrences: List[Tuple[str, AstNode]]):
+        if node.type == AstNodeType.Literal:
+            return
+        key = to_key(node, atom_versions)
+        if key in seen:
+            # Copy will be used here, so subexpressions are not evaluated again
+            reused.add(key)
+            return
+        seen.add(key)
+        for child in node.child_nodes[1:]:
+            CommonSubexpressions.__visit(child, atom_versions, seen, reused, first_occurrences)
+        first_occurrences.append((key, node))
+
+    def __process_value(self, node: AstNode):
+        """
+        INPUT  (0): | EoS |
+        OUTPUT (1): | EoS | Value of expression
+        """
+        with self.__opcodes.source(node):
+            self.__process_value_of(node)
+
+    def __process_value_of(self, node: AstNode):
+        start_height = self.__height
+        if node.type == AstNodeType.Literal:
+            self.__generator.process_literal(node, self.__opcodes)
+            self.__height += 1
+            return
+
+        key = to_key(node, self.__atom_versions)
+        if key in self.__stack_positions and self.__height - self.__stack_positions[key] < MAX_DUP_DEPTH:
+            self.__opcodes.add(f'DUP{self.__height - self.__stack_positions[key] + 1}')
+            self.__height += 1
+            return
+
+        if node.type == AstNodeType.Atom:
+            self.__generator.process_atom(node, self.__ctx, self.__opcodes)
+        else:
+            shift = BuiltIns().get_shift(node)
+            if shift is not None:
+                self.__process_value(shift[0])
+                BuiltIns().call_shift(node, shift[1], self.__ctx, self.__opcodes)
+            else:
+                mirrored = StackScheduling.is_mirrored(node)
+                args = node.child_nodes[1:]
+                for arg in (reversed(args) if mirrored else args):
+                    self.__process_value(arg)
+                BuiltIns().call(node, self.__ctx, self.__opcodes, mirrored)
+        self.__height = start_height + 1
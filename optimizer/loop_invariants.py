@@ -0,0 +1,109 @@
+from typing import Dict, Set, Tuple
+
+from AST import AST, AstNode, AstNodeType
+from optimizer.ast_utils import PURE_FUNCTIONS, is_call, make_call, to_key
+
+LOGIC_FUNCTIONS = {'and', 'or', 'not'}
+CONDITION_FUNCTIONS = {'equal', 'nonequal', 'less', 'lesseq', 'greater', 'greatereq'} | LOGIC_FUNCTIONS
+
+
+class LoopInvariantMotion:
+    """
+    Moves expressions, which do not change inside of while loop, into atoms assigned right before the loop:
+        (while (less i (plus n 1)) (...))  ->  ((setq licm#0 (plus n 1)) (while (less i licm#0) (...)))
+    Hoisted expressions are pure and never fail, so evaluating them once even if loop does not run is safe.
+    """
+    __counter: int = 0
+
+    def run(self, ast: AST):
+        for el in ast.root.child_nodes:
+            for i in range(1, len(el.child_nodes)):
+                el.child_nodes[i] = self.__process(el.child_nodes[i])
+        return ast
+
+    def __process(self, node: AstNode) -> AstNode:
+        if node.type != AstNodeType.List:
+            return node
+        # Inner loops go first, their hoisted code becomes a part of outer loop body
+        for i in range(len(node.child_nodes)):
+            node.child_nodes[i] = self.__process(node.child_nodes[i])
+        if is_call(node, 'while') and len(node.child_nodes) == 3:
+            return self.__hoist(node)
+        return node
+
+    def __hoist(self, loop: AstNode) -> AstNode:
+        assigned = set()
+        LoopInvariantMotion.__collect_assigned(loop, assigned)
+
+        hoisted: Dict[str, Tuple[str, AstNode]] = {}
+        for i in range(1, len(loop.child_nodes)):
+            loop.child_nodes[i] = self.__replace_invariants(loop.child_nodes[i], assigned, hoisted, False)
+        if len(hoisted) == 0:
+            return loop
+
+        # Block of code: (setq atom expression) for every hoisted expression, then the loop itself
+        block = AstNode(AstNodeType.List, None)
+        for atom_name, expression in hoisted.values():
+            setq = make_call('setq', AstNode(AstNodeType.Atom, atom_name), expression)
+            setq.start, setq.end = expression.start, expression.end
+            block.add_child(setq)
+        block.add_child(loop)
+        return block
+
+    def __replace_invariants(self, node: AstNode, assigned: Set[str], hoisted: Dict[str, Tuple[str, AstNode]],
+                             is_value: bool, is_condition: bool = False) -> AstNode:
+        if node.type != AstNodeType.List or len(node.child_nodes) == 0:
+            return node
+
+        # Conditions of cond and while are lowered into jumps directly, only their operands are worth hoisting
+        is_test = is_condition and node.child_nodes[0].type == AstNodeType.Atom and \
+            node.child_nodes[0].value in CONDITION_FUNCTIONS
+        if is_value and not is_test and LoopInvariantMotion.__is_invariant(node, assigned) and \
+                LoopInvariantMotion.__is_worth_hoisting(node):
+            key = to_key(node)
+            if key not in hoisted:
+                hoisted[key] = (f'licm#{LoopInvariantMotion.__counter}', node)
+                LoopInvariantMotion.__counter += 1
+            return AstNode(AstNodeType.Atom, hoisted[key][0], node.start, node.end)
+
+        children = node.child_nodes
+        if children[0].type == AstNodeType.List:
+            # Block of code: every element is a statement
+            for i in range(len(children)):
+                children[i] = self.__replace_invariants(children[i], assigned, hoisted, False)
+            return node
+
+        name = children[0].value
+        for i in range(1, len(children)):
+            if name == 'setq' and i == 1:
+                continue
+            # Branches of cond and body of while are statements, everything else is evaluated to a value
+            child_is_value = not ((name == 'cond' and i >= 2) or (name == 'while' and i == 2))
+            child_is_condition = ((name == 'cond' or name == 'while') and i == 1) or \
+                                 (is_test and name in LOGIC_FUNCTIONS)
+            children[i] = self.__replace_invariants(children[i], assigned, hoisted, child_is_value, child_is_condition)
+        return node
+
+    @staticmethod
+    def __is_invariant(node: AstNode, assigned: Set[str]) -> bool:
+        if node.type == AstNodeType.Literal:
+            return True
+        if node.type == AstNodeType.Atom:
+            return node.value not in assigned
+        if node.child_nodes[0].type != AstNodeType.Atom or node.child_nodes[0].value not in PURE_FUNCTIONS:
+            return False
+        return all(LoopInvariantMotion.__is_invariant(x, assigned) for x in node.child_nodes[1:])
+
+    @staticmethod
+    def __is_worth_hoisting(node: AstNode) -> bool:
+        # Loading an atom costs more than reading calldata or combining literals
+        return any(x.type != AstNodeType.Literal for x in node.child_nodes[1:])
+
+    @staticmethod
+    def __collect_assigned(node: AstNode, assigned: Set[str]):
+        if node.type != AstNodeType.List:
+            return
+        if is_call(node, 'setq') and len(node.child_nodes) == 3:
+            assigned.add(node.child_nodes[1].value)
+        for child in node.child_nodes:
+            LoopInvariantMotion.__collect_assigned(child, assigned)
@@ -0,0 +1,198 @@
+from typing import Dict, List, Optional, Tuple
+
+from AST import AST, AstNode, AstNodeType
+from optimizer.ast_utils import is_call, make_call
+from optimizer.partial_evaluation import BINARY_OPERATIONS, WORD_MODULO
+
+# Comparison of literal with atom -> the same comparison with atom first
+MIRRORED_COMPARISONS = {'less': 'greater', 'lesseq': 'greatereq', 'greater': 'less', 'greatereq': 'lesseq',
+                        'nonequal': 'nonequal'}
+MAX_FACTOR = 8
+
+
+class LoopUnrolling:
+    """
+    Unrolls while loops counting an atom from literal with literal step up or down to literal bound:
+        (setq i 0) (while (less i 3) (body (setq i (plus i 1))))  ->  (setq i 0) (body ...) (body ...) (body ...)
+    Loop is unrolled fully if all copies of body fit into budget (in AST nodes), otherwise its body is repeated
+    factor times and the remainder of iterations goes before the loop, so the condition is checked once per factor.
+    Copies outside of loop which may break are wrapped into (while 1 (... (break))), so break still leaves all of them.
+    Step must be a statement of the body itself, which is the only assignment of the atom, frames of called functions
+    are private, so the number of iterations is known before the loop.
+    """
+    __budget: int
+
+    def __init__(self, budget: int = 64):
+        self.__budget = budget
+
+    def run(self, ast: AST):
+        if self.__budget <= 0:
+            return ast
+        for el in ast.root.child_nodes:
+            for i in range(1, len(el.child_nodes)):
+                el.child_nodes[i] = self.__process(el.child_nodes[i], {})
+        return ast
+
+    def __process(self, node: AstNode, known: Dict[str, int]) -> AstNode:
+        """
+        Known maps atoms to literals assigned to them by the preceding statements of the same frame
+        """
+        if node.type != AstNodeType.List or len(node.child_nodes) == 0:
+            return node
+        children = node.child_nodes
+        if children[0].type == AstNodeType.List:
+            # Block of code: statements run one after another, so values of atoms pass to the next ones
+            for i in range(len(children)):
+                children[i] = self.__process(children[i], known)
+            return node
+
+        if is_call(node, 'setq') and len(children) == 3:
+            if children[2].type == AstNodeType.Literal:
+                known[children[1].value] = children[2].value % WORD_MODULO
+            else:
+                children[2] = self.__process(children[2], {})
+                known.pop(children[1].value, None)
+            return node
+
+        # Inner loops go first, their copies become a part of outer loop body
+        for i in range(1, len(children)):
+            children[i] = self.__process(children[i], {})
+        if is_call(node, 'while') and len(children) == 3:
+            node = self.__unroll(node, known)
+        for atom in LoopUnrolling.__count_assigned(node):
+            known.pop(atom, None)
+        return node
+
+    def __unroll(self, loop: AstNode, known: Dict[str, int]) -> AstNode:
+        induction = LoopUnrolling.__find_induction(loop, known)
+        if induction is None:
+            return loop
+        atom, trips = induction
+        body = loop.child_nodes[2]
+        size = LoopUnrolling.__get_size(body)
+        has_break = LoopUnrolling.__has_break(body)
+
+        if trips * size <= self.__budget:
+            copies = [LoopUnrolling.__copy(body) for _ in range(trips)]
+            return LoopUnrolling.__make_block(copies, has_break, loop)
+
+        factor = next((x for x in range(min(MAX_FACTOR, self.__budget // size, trips), 1, -1)
+                       if (x + trips % x) * size <= self.__budget), None)
+        if factor is None:
+            return loop
+        loop.child_nodes[2] = LoopUnrolling.__make_block([LoopUnrolling.__copy(body) for _ in range(factor)], False,
+                                                         body)
+        if trips % factor == 0:
+            return loop
+        copies = [LoopUnrolling.__copy(body) for _ in range(trips % factor)]
+        return LoopUnrolling.__make_block(copies + [loop], has_break, loop)
+
+    @staticmethod
+    def __find_induction(loop: AstNode, known: Dict[str, int]) -> Optional[Tuple[str, int]]:
+        """
+        Returns atom and number of iterations, or None if loop does not count from known value to literal
+        """
+        condition = loop.child_nodes[1]
+        if condition.type != AstNodeType.List or len(condition.child_nodes) != 3 or \
+                condition.child_nodes[0].type != AstNodeType.Atom or \
+                condition.child_nodes[0].value not in MIRRORED_COMPARISONS:
+            return None
+        name, left, right = [x for x in condition.child_nodes]
+        comparison = name.value
+        if left.type == AstNodeType.Literal and right.type == AstNodeType.Atom:
+            comparison = MIRRORED_COMPARISONS[comparison]
+            left, right = right, left
+        if left.type != AstNodeType.Atom or right.type != AstNodeType.Literal or left.value not in known:
+            return None
+        atom, bound = left.value, right.value % WORD_MODULO
+
+        assigned = LoopUnrolling.__count_assigned(loop.child_nodes[2])
+        if assigned.get(atom, 0) != 1:
+            return None
+        body = loop.child_nodes[2]
+        statements = body.child_nodes if body.child_nodes[0].type == AstNodeType.List else [body]
+        step = next((LoopUnrolling.__get_step(x, atom) for x in statements
+                     if is_call(x, 'setq') and len(x.child_nodes) == 3 and x.child_nodes[1].value == atom), None)
+        if step is None or step == 0:
+            return None
+
+        start = known[atom]
+        test = BINARY_OPERATIONS[comparison]
+        if step > 0 and comparison in ('less', 'lesseq', 'nonequal') and start <= bound:
+            trips = -(-(bound - start) // step) if comparison != 'lesseq' else (bound - start) // step + 1
+        elif step < 0 and comparison in ('greater', 'greatereq', 'nonequal') and start >= bound:
+            trips = -(-(start - bound) // -step) if comparison != 'greatereq' else (start - bound) // -step + 1
+        else:
+            return None
+        # Counter never wraps around, so it passes every value between the start and the end once
+        end = start + trips * step
+        if trips == 0 or not 0 <= end < WORD_MODULO or test(end, bound) or \
+                not test(start + (trips - 1) * step, bound):
+            return None
+        return atom, trips
+
+    @staticmethod
+    def __get_step(statement: AstNode, atom: str) -> Optional[int]:
+        """
+        Step of (setq atom (plus atom step)), (setq atom (plus step atom)) or (setq atom (minus atom step))
+        """
+        value = statement.child_nodes[2]
+        if value.type != AstNodeType.List or len(value.child_nodes) != 3:
+            return None
+        args = value.child_nodes[1:]
+        is_atom = [x.type == AstNodeType.Atom and x.value == atom for x in args]
+        is_literal = [x.type == AstNodeType.Literal for x in args]
+        if is_call(value, 'plus') and (is_atom[0] and is_literal[1] or is_literal[0] and is_atom[1]):
+            return (args[1].value if is_atom[0] else args[0].value) % WORD_MODULO
+        if is_call(value, 'minus') and is_atom[0] and is_literal[1]:
+            return -(args[1].value % WORD_MODULO)
+        return None
+
+    @staticmethod
+    def __count_assigned(node: AstNode, assigned: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        assigned = {} if assigned is None else assigned
+        if node.type != AstNodeType.List:
+            return assigned
+        if is_call(node, 'setq') and len(node.child_nodes) == 3:
+            assigned[node.child_nodes[1].value] = assigned.get(node.child_nodes[1].value, 0) + 1
+        for child in node.child_nodes:
+            LoopUnrolling.__count_assigned(child, assigned)
+        return assigned
+
+    @staticmethod
+    def __has_break(node: AstNode) -> bool:
+        # Break of inner loop leaves only the inner loop
+        if node.type != AstNodeType.List or is_call(node, 'while'):
+            return False
+        if is_call(node, 'break'):
+            return True
+        return any(LoopUnrolling.__has_break(x) for x in node.child_nodes)
+
+    @staticmethod
+    def __get_size(node: AstNode) -> int:
+        return 1 + sum(LoopUnrolling.__get_size(x) for x in node.child_nodes)
+
+    @staticmethod
+    def __copy(node: AstNode) -> AstNode:
+        copy = AstNode(node.type, node.value, node.start, node.end)
+        copy.child_nodes = [LoopUnrolling.__copy(x) for x in node.child_nodes]
+        return copy
+
+    @staticmethod
+    def __make_block(statements: List[AstNode], has_break: bool, like: AstNode) -> AstNode:
+        """
+        Block of code with statements, which is wrapped into loop running once, if they may break
+        """
+        block = AstNode(AstNodeType.List, None, like.start, like.end)
+        for statement in statements:
+            if statement.type == AstNodeType.List and len(statement.child_nodes) > 0 and \
+                    statement.child_nodes[0].type == AstNodeType.List:
+                block.child_nodes.extend(statement.child_nodes)
+            else:
+                block.add_child(statement)
+        if not has_break:
+            return block
+        block.add_child(make_call('break'))
+        loop = make_call('while', AstNode(AstNodeType.Literal, 1), block)
+        loop.start, loop.end = like.start, like.end
+        return loop
@@ -0,0 +1,219 @@
+from bisect import bisect_right
+from typing import Dict, List, Optional, Set
+
+from AST import AST, AstNode, AstNodeType
+from optimizer.ast_utils import PURE_FUNCTIONS, is_boolean, is_call
+
+WORD_MODULO = 2 ** 256
+
+SPECIAL_FORMS = {'setq', 'return', 'break', 'cond', 'while'}
+
+BINARY_OPERATIONS = {
+    'plus': lambda a, b: a + b,
+    'minus': lambda a, b: a - b,
+    'times': lambda a, b: a * b,
+    'divide': lambda a, b: a // b if b != 0 else 0,
+    'equal': lambda a, b: int(a == b),
+    'nonequal': lambda a, b: int(a != b),
+    'less': lambda a, b: int(a < b),
+    'lesseq': lambda a, b: int(a <= b),
+    'greater': lambda a, b: int(a > b),
+    'greatereq': lambda a, b: int(a >= b),
+    'and': lambda a, b: a & b,
+    'or': lambda a, b: a | b
+}
+
+
+class EvaluationFailed(Exception):
+    pass
+
+
+class _Return(Exception):
+    def __init__(self, value: int):
+        self.value = value
+
+
+class _Break(Exception):
+    pass
+
+
+class PartialEvaluator:
+    """
+    Replaces calls of pure declared functions with all-literal arguments by the literal result:
+        (func pow (b e) (...))  (prog ((setq x (pow 2 10))))  ->  (prog ((setq x 1024)))
+    Function is pure if it does not read calldata and calls only pure functions (setq always changes own frame).
+    Evaluation is limited by amount of evaluated nodes and call depth, call is compiled as usual if limit is hit.
+    Functions are referred to by index of top level form declaring them and resolved like generator does it.
+    """
+    __forms: List[AstNode]
+    __functions: Dict[str, List[int]]
+    __pure: Set[int]
+    __steps_left: int
+
+    def __init__(self, address_length: int = 32, max_steps: int = 100000, max_depth: int = 100):
+        self.__max_value = 2 ** (8 * address_length)
+        self.__max_steps = max_steps
+        self.__max_depth = max_depth
+        self.__forms = []
+        self.__functions = {}
+        self.__pure = set()
+        self.__steps_left = 0
+
+    def run(self, ast: AST):
+        self.__forms = ast.root.child_nodes
+        self.__functions = {}
+        for i, el in enumerate(self.__forms):
+            if el.child_nodes[0].value == 'func':
+                self.__functions.setdefault(el.child_nodes[1].value, []).append(i)
+        self.__pure = self.__find_pure_functions()
+        for position, el in enumerate(self.__forms):
+            for i in range(1, len(el.child_nodes)):
+                el.child_nodes[i] = self.__process(el.child_nodes[i], position)
+        return ast
+
+    def __find(self, name: str, position: int) -> Optional[int]:
+        """
+        Index of the latest form declaring function before the form at position or the form itself
+        """
+        indexes = self.__functions.get(name, [])
+        i = bisect_right(indexes, position)
+        return indexes[i - 1] if i > 0 else None
+
+    def __find_pure_functions(self) -> Set[int]:
+        pure = {i for indexes in self.__functions.values() for i in indexes}
+        changed = True
+        while changed:
+            changed = False
+            for index in list(pure):
+                if not self.__is_pure_body(self.__forms[index].child_nodes[3], index, pure):
+                    pure.remove(index)
+                    changed = True
+        return pure
+
+    def __is_pure_body(self, node: AstNode, position: int, pure: Set[int]) -> bool:
+        if node.type != AstNodeType.List:
+            return True
+        if is_call(node, 'read'):
+            return False
+        if len(node.child_nodes) > 0 and node.child_nodes[0].type == AstNodeType.Atom:
+            name = node.child_nodes[0].value
+            if name not in PURE_FUNCTIONS and name not in SPECIAL_FORMS and self.__find(name, position) not in pure:
+                return False
+        return all(self.__is_pure_body(x, position, pure) for x in node.child_nodes)
+
+    def __process(self, node: AstNode, position: int) -> AstNode:
+        if node.type != AstNodeType.List:
+            return node
+        # Arguments are folded first, so nested calls become literals
+        for i in range(len(node.child_nodes)):
+            node.child_nodes[i] = self.__process(node.child_nodes[i], position)
+
+        if len(node.child_nodes) == 0 or node.child_nodes[0].type != AstNodeType.Atom:
+            return node
+        index = self.__find(node.child_nodes[0].value, position)
+        args = node.child_nodes[1:]
+        if index not in self.__pure or any(x.type != AstNodeType.Literal for x in args):
+            return node
+
+        self.__steps_left = self.__max_steps
+        try:
+            value = self.__call(index, [x.value % WORD_MODULO for x in args], 0)
+        except (EvaluationFailed, RecursionError):
+            return node
+        if value >= self.__max_value:
+            # Result does not fit into PUSH
+            return node
+        return AstNode(AstNodeType.Literal, value, node.start, node.end)
+
+    def __call(self, index: int, args: List[int], depth: int) -> int:
+        func = self.__forms[index]
+        params = func.child_nodes[2].child_nodes
+        if depth >= self.__max_depth or len(params) != len(args):
+            raise EvaluationFailed()
+
+        atoms = {param.value: value for param, value in zip(params, args)}
+        try:
+            self.__execute(func.child_nodes[3], atoms, index, depth)
+        except _Return as result:
+            return result.value
+        except _Break:
+            raise EvaluationFailed()
+        # Compiled function ending without return gives zero
+        return 0
+
+    def __execute(self, node: AstNode, atoms: Dict[str, int], position: int, depth: int):
+        self.__steps_left -= 1
+        if self.__steps_left < 0:
+            raise EvaluationFailed()
+
+        if node.type != AstNodeType.List:
+            self.__evaluate(node, atoms, position, depth)
+            return
+        if len(node.child_nodes) > 0 and node.child_nodes[0].type == AstNodeType.List:
+            for statement in node.child_nodes:
+                self.__execute(statement, atoms, position, depth)
+            return
+
+        args = node.child_nodes[1:]
+        name = node.child_nodes[0].value
+        if name == 'setq' and len(args) == 2:
+            atoms[args[0].value] = self.__evaluate(args[1], atoms, position, depth)
+        elif name == 'return' and len(args) == 1:
+            raise _Return(self.__evaluate(args[0], atoms, position, depth))
+        elif name == 'break' and len(args) == 0:
+            raise _Break()
+        elif name == 'cond' and (len(args) == 2 or len(args) == 3):
+            if self.__test(args[0], atoms, position, depth):
+                self.__execute(args[1], atoms, position, depth)
+            elif len(args) == 3:
+                self.__execute(args[2], atoms, position, depth)
+        elif name == 'while' and len(args) == 2:
+            try:
+                while self.__test(args[0], atoms, position, depth):
+                    self.__execute(args[1], atoms, position, depth)
+            except _Break:
+                pass
+        else:
+            self.__evaluate(node, atoms, position, depth)
+
+    def __test(self, node: AstNode, atoms: Dict[str, int], position: int, depth: int) -> bool:
+        # Same as branch lowering of the generator: operands of not, and, or are lazy
+        if is_call(node, 'not') and len(node.child_nodes) == 2:
+            return not self.__test(node.child_nodes[1], atoms, position, depth)
+        if is_call(node, 'and') and is_boolean(node):
+            return self.__test(node.child_nodes[1], atoms, position, depth) and \
+                self.__test(node.child_nodes[2], atoms, position, depth)
+        if is_call(node, 'and') and len(node.child_nodes) == 3:
+            value = self.__evaluate(node.child_nodes[1], atoms, position, depth)
+            return value != 0 and value & self.__evaluate(node.child_nodes[2], atoms, position, depth) != 0
+        if is_call(node, 'or') and len(node.child_nodes) == 3:
+            return self.__test(node.child_nodes[1], atoms, position, depth) or \
+                self.__test(node.child_nodes[2], atoms, position, depth)
+        return self.__evaluate(node, atoms, position, depth) != 0
+
+    def __evaluate(self, node: AstNode, atoms: Dict[str, int], position: int, depth: int) -> int:
+        self.__steps_left -= 1
+        if self.__steps_left < 0:
+            raise EvaluationFailed()
+
+        if node.type == AstNodeType.Literal:
+            return node.value % WORD_MODULO
+        if node.type == AstNodeType.Atom:
+            if node.value not in atoms:
+                # Value of not assigned atom is whatever left in memory
+                raise EvaluationFailed()
+            return atoms[node.value]
+        if len(node.child_nodes) == 0 or node.child_nodes[0].type != AstNodeType.Atom:
+            raise EvaluationFailed()
+
+        name = node.child_nodes[0].value
+        args = [self.__evaluate(x, atoms, position, depth) for x in node.child_nodes[1:]]
+        if name in BINARY_OPERATIONS and len(args) == 2:
+            return BINARY_OPERATIONS[name](args[0], args[1]) % WORD_MODULO
+        if name == 'not' and len(args) == 1:
+            return int(args[0] == 0)
+        index = self.__find(name, position)
+        if index in self.__pure:
+            return self.__call(index, args, depth + 1)
+        raise EvaluationFailed()
+
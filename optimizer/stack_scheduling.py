@@ -0,0 +1,76 @@
+from typing import List
+
+from AST import AstNode, AstNodeType
+from fst_functions.builtin import BuiltIns
+from fst_functions.declared import Declared
+from optimizer.ast_utils import PURE_FUNCTIONS
+
+# Operations which need SWAP1 when operands are evaluated in order of source
+SWAPPING_OPERATIONS = {'minus', 'divide'}
+# Expressions within reach of DUP16 are ordered to save SWAP1, deeper ones to save stack
+SHALLOW_NEED = 16
+
+
+class StackScheduling:
+    """
+    Sethi-Ullman order of operands of binary builtins: operand needing more EVM stack is evaluated first,
+    so the other one is computed on top of one value instead of needing its own slots above it.
+    Operands in reversed order are taken by mirrored operation (greater instead of less, SUB without SWAP1
+    for minus), so reordering is free. Minus and divide drop SWAP1 unless it makes deep expression deeper.
+    Only expressions without statements are reordered: frames of called functions are private,
+    so the order of their evaluation is not visible.
+    """
+    @staticmethod
+    def is_mirrored(node: AstNode) -> bool:
+        """
+        Whether operands of binary builtin call are evaluated from right to left
+        """
+        if len(node.child_nodes) != 3 or not BuiltIns().has_mirrored(node.child_nodes[0].value):
+            return False
+        return StackScheduling.__is_mirrored(node, [StackScheduling.get_need(x) for x in node.child_nodes[1:]])
+
+    @staticmethod
+    def get_need(node: AstNode) -> int:
+        """
+        Height of EVM stack reached while value of expression is computed, not counting functions it calls
+        """
+        if node.type == AstNodeType.Literal:
+            return 1
+        if node.type == AstNodeType.Atom:
+            # Gap of frame and address of atom
+            return 2
+        if len(node.child_nodes) == 0 or node.child_nodes[0].type != AstNodeType.Atom:
+            return 1
+
+        name = node.child_nodes[0].value
+        if BuiltIns().has(name):
+            shift = BuiltIns().get_shift(node)
+            if shift is not None:
+                return max(StackScheduling.get_need(shift[0]), 2)
+        needs = [StackScheduling.get_need(x) for x in node.child_nodes[1:]]
+        if BuiltIns().has_mirrored(name) and len(needs) == 2 and StackScheduling.__is_mirrored(node, needs):
+            needs.reverse()
+        need = max([i + x for i, x in enumerate(needs)], default=0)
+        # Call pushes back address and address of function above the arguments, builtin may push one constant
+        return max(need, len(needs) + 2 if Declared().has(name) and not BuiltIns().has(name) else 2)
+
+    @staticmethod
+    def __is_mirrored(node: AstNode, needs: List[int]) -> bool:
+        if not all(StackScheduling.__is_movable(x) for x in node.child_nodes[1:]):
+            return False
+        in_order_need = max(needs[0], needs[1] + 1)
+        mirrored_need = max(needs[1], needs[0] + 1)
+        if node.child_nodes[0].value in SWAPPING_OPERATIONS and mirrored_need <= max(in_order_need, SHALLOW_NEED):
+            return True
+        return mirrored_need < in_order_need
+
+    @staticmethod
+    def __is_movable(node: AstNode) -> bool:
+        if node.type != AstNodeType.List:
+            return True
+        if len(node.child_nodes) == 0 or node.child_nodes[0].type != AstNodeType.Atom:
+            return False
+        name = node.child_nodes[0].value
+        if name not in PURE_FUNCTIONS and not Declared().has(name):
+            return False
+        return all(StackScheduling.__is_movable(x) for x in node.child_nodes[1:])
@@ -0,0 +1,121 @@
+from typing import Dict, List, Optional, Tuple
+
+from evm import Evm, ExecutionResult, Instruction, Program
+from source_map import SourceMap, SourceMapEntry
+
+INIT_FRAME = '<init>'
+
+
+class FormProfile:
+    entry: SourceMapEntry
+    function: Optional[str]
+    gas: int
+    instructions: int
+
+    def __init__(self, entry: SourceMapEntry, function: Optional[str]):
+        self.entry = entry
+        self.function = function
+        self.gas = 0
+        self.instructions = 0
+
+
+class Profile:
+    """
+    Gas and instruction counts of one execution per source form, per function and per call stack
+    """
+    result: Optional[ExecutionResult]
+    forms: Dict[Tuple[Optional[str], Optional[int], Optional[int]], FormProfile]
+    functions: Dict[str, List[int]]
+    # Call stack with the source form on top -> gas
+    stacks: Dict[Tuple[str, ...], int]
+
+    def __init__(self):
+        self.result = None
+        self.forms = {}
+        self.functions = {}
+        self.stacks = {}
+
+    def add(self, entry: SourceMapEntry, call_stack: List[str], gas: int):
+        # Shared code is charged to the running function, its form keeps span of the kept copy
+        function = call_stack[-1] if entry.shared_by is not None else entry.function
+        key = (function, entry.start, entry.end)
+        if key not in self.forms:
+            self.forms[key] = FormProfile(entry, function)
+        self.forms[key].gas += gas
+        self.forms[key].instructions += 1
+
+        function = function if function is not None else INIT_FRAME
+        if function not in self.functions:
+            self.functions[function] = [0, 0]
+        self.functions[function][0] += gas
+        self.functions[function][1] += 1
+
+        stack = tuple(call_stack) + (entry.get_label(),)
+        self.stacks[stack] = self.stacks.get(stack, 0) + gas
+
+    def to_json(self) -> dict:
+        forms = sorted(self.forms.values(), key=lambda x: -x.gas)
+        return {
+            'value': self.result.value if self.result is not None else None,
+            'gas_used': self.result.gas_used if self.result is not None else None,
+            'functions': {name: {'gas': gas, 'instructions': count} for name, (gas, count) in self.functions.items()},
+            'forms': [{
+                'form': x.entry.form,
+                'function': x.function,
+                'start': x.entry.start,
+                'end': x.entry.end,
+                'line': x.entry.line,
+                'column': x.entry.column,
+                'gas': x.gas,
+                'instructions': x.instructions
+            } for x in forms]
+        }
+
+    def to_folded(self) -> str:
+        """
+        Folded stacks, one per line: frames separated with semicolons and gas, accepted by flamegraph.pl
+        """
+        return ''.join(f'{";".join(stack)} {gas}\n' for stack, gas in self.stacks.items() if gas > 0)
+
+
+class Profiler:
+    """
+    Replays execution of compiled program in the local EVM interpreter and attributes spent gas to source forms.
+    Call stack is restored from the source map: jump to the entry point of function pushes it,
+    reaching the instruction after the calling JUMP pops it. Folded functions share one name, e.g. sq|sq2,
+    because their calls can not be told apart.
+    """
+    __source_map: SourceMap
+    __evm: Evm
+
+    def __init__(self, source_map: SourceMap, evm: Evm = None):
+        self.__source_map = source_map
+        self.__evm = evm if evm is not None else Evm()
+
+    def run(self, byte_code: str, calldata: bytes = b'') -> Profile:
+        profile = Profile()
+        entry_functions: Dict[int, str] = {}
+        for name, offset in self.__source_map.function_offsets.items():
+            entry_functions[offset] = f'{entry_functions[offset]}|{name}' if offset in entry_functions else name
+        entry_by_offset = self.__source_map.entry_by_offset
+        # Function name and offset to return to
+        call_stack: List[Tuple[str, Optional[int]]] = []
+        previous: List[Optional[Instruction]] = [None]
+
+        def trace(instruction: Instruction, gas: int):
+            offset = instruction.offset
+            if len(call_stack) > 0 and call_stack[-1][1] == offset:
+                call_stack.pop()
+            if offset in entry_functions:
+                # prog is entered once from the header and never returns
+                return_offset = previous[0].offset + previous[0].size \
+                    if previous[0] is not None and entry_functions[offset] != 'prog' else None
+                call_stack.append((entry_functions[offset], return_offset))
+            previous[0] = instruction
+
+            entry = entry_by_offset.get(offset)
+            if entry is not None:
+                profile.add(entry, [x[0] for x in call_stack] if len(call_stack) > 0 else [INIT_FRAME], gas)
+
+        profile.result = self.__evm.run(Program(byte_code), calldata, trace)
+        return profile
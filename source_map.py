@@ -0,0 +1,112 @@
+from bisect import bisect_right
+from typing import Dict, List, Optional
+
+from AST import AstNode, AstNodeType
+from opcodes import OpcodeList
+
+
+def get_line_starts(code: str) -> List[int]:
+    """
+    Offsets of the first characters of lines
+    """
+    return [0] + [i + 1 for i, char in enumerate(code) if char == '\n']
+
+
+class SourceMapEntry:
+    offset: int
+    name: str
+    function: Optional[str]
+    # Functions running the opcode if code folding shared it
+    shared_by: Optional[List[str]]
+    form: Optional[str]
+    start: Optional[int]
+    end: Optional[int]
+    line: Optional[int]
+    column: Optional[int]
+
+    def __init__(self, offset: int, name: str, function: Optional[str], node: Optional[AstNode], code: Optional[str],
+                 line_starts: List[int] = None, shared_by: Optional[List[str]] = None):
+        self.offset = offset
+        self.name = name
+        self.function = function
+        self.shared_by = shared_by
+        self.form = SourceMapEntry.__get_form_name(node) if node is not None else None
+        self.start = node.start if node is not None else None
+        self.end = node.end if node is not None else None
+        self.line = None
+        self.column = None
+        # Without source code (AST loaded from binary format) only spans are known
+        if self.start is not None and (code is not None or line_starts is not None):
+            if line_starts is None:
+                line_starts = get_line_starts(code)
+            self.line = bisect_right(line_starts, self.start)
+            self.column = self.start - line_starts[self.line - 1] + 1
+
+    def get_label(self) -> str:
+        """
+        Short name of source form, e.g. plus@3:12
+        """
+        if self.form is None:
+            return '<init>'
+        if self.line is None:
+            return f'{self.form}@{self.start}' if self.start is not None else self.form
+        return f'{self.form}@{self.line}:{self.column}'
+
+    def to_json(self) -> dict:
+        return {
+            'offset': self.offset,
+            'opcode': self.name,
+            'function': self.function,
+            'shared_by': self.shared_by,
+            'form': self.form,
+            'start': self.start,
+            'end': self.end,
+            'line': self.line,
+            'column': self.column
+        }
+
+    @staticmethod
+    def __get_form_name(node: AstNode) -> str:
+        if node.type != AstNodeType.List:
+            return str(node.value)
+        if len(node.child_nodes) == 0 or node.child_nodes[0].type == AstNodeType.List:
+            return 'block'
+        return str(node.child_nodes[0].value)
+
+
+class SourceMap:
+    """
+    Maps every byte code offset to span of source form and function which generated the opcode.
+    Code shared by several functions after folding lists all of them, folded function has the entry of its copy.
+    """
+    entries: List[SourceMapEntry]
+    entry_by_offset: Dict[int, SourceMapEntry]
+    # Offset of the first opcode (entry point) of every function and prog
+    function_offsets: Dict[str, int]
+
+    def __init__(self, opcodes: OpcodeList, code: Optional[str]):
+        self.entries = []
+        self.entry_by_offset = {}
+        self.function_offsets = {}
+        line_starts = get_line_starts(code) if code is not None else None
+        # Opcodes of one shared tail refer to the same set of names, it is sorted once
+        names: Dict[int, List[str]] = {}
+        for opcode in opcodes.list:
+            if opcode.shared_by is not None and id(opcode.shared_by) not in names:
+                names[id(opcode.shared_by)] = sorted(opcode.shared_by)
+            shared_by = names[id(opcode.shared_by)] if opcode.shared_by is not None else None
+            entry = SourceMapEntry(opcode.id, opcode.name, opcode.function, opcode.source, code, line_starts,
+                                   shared_by)
+            self.entries.append(entry)
+            self.entry_by_offset[opcode.id] = entry
+            if opcode.function is not None and opcode.function not in self.function_offsets:
+                self.function_offsets[opcode.function] = opcode.id
+                # Tails never include entry point, so names shared here are functions folded into this one
+                for name in shared_by if shared_by is not None else []:
+                    self.function_offsets.setdefault(name, opcode.id)
+
+    def to_json(self) -> dict:
+        return {
+            'functions': self.function_offsets,
+            'opcodes': [entry.to_json() for entry in self.entries]
+        }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules of the compiler lie in the root of repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from AST import AST
+from evm import Evm, Program
+from interpreter import Interpreter
+from tokenizer import TokenList
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Generator and functions are singletons, so every compilation runs in its own process
+OPTION_SETS = [[], ['--no-fold'], ['--unroll-budget', '0'], ['-j', '2']]
+
+
+def calldata(*args: int) -> bytes:
+    return b''.join(x.to_bytes(32, 'big') for x in args)
+
+
+def compile_program(code: str, options: Sequence[str] = ()) -> str:
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'input.fst')
+        output = os.path.join(directory, 'output.ebc')
+        with open(source, 'w') as f:
+            f.write(code)
+        result = subprocess.run([sys.executable, os.path.join(ROOT, 'main.py'), source, '-o', output, *options],
+                                capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        with open(output) as f:
+            return f.read().strip()
+
+
+def run_main(code: Union[str, bytes], options: Sequence[str] = (), outputs: Sequence[str] = (),
+             files: Optional[Dict[str, str]] = None) -> Tuple[subprocess.CompletedProcess, Dict[str, bytes]]:
+    """
+    Runs compiler in temporary directory with code in input.fst and other files, options may refer to them by name.
+    Returns finished process and contents of listed output files, which were written
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, 'input.fst'), 'wb') as f:
+            f.write(code.encode() if isinstance(code, str) else code)
+        for name, text in (files if files is not None else {}).items():
+            with open(os.path.join(directory, name), 'w') as f:
+                f.write(text)
+        result = subprocess.run([sys.executable, os.path.join(ROOT, 'main.py'), 'input.fst', *options],
+                                capture_output=True, text=True, cwd=directory)
+        contents = {}
+        for name in outputs:
+            if os.path.exists(os.path.join(directory, name)):
+                with open(os.path.join(directory, name), 'rb') as f:
+                    contents[name] = f.read()
+        return result, contents
+
+
+def run_compiled(byte_code: str, *args: int) -> Optional[int]:
+    return Evm().run(Program(byte_code), calldata(*args)).value
+
+
+def interpret(code: str, *args: int) -> Optional[int]:
+    return Interpreter(AST(TokenList(code))).run(calldata(*args))
+
+
+def cross_check(code: str, vectors: List[Sequence[int]], option_sets: List[List[str]] = None) -> List[int]:
+    """
+    Compiles program with every set of options and compares results of EVM with the interpreter,
+    returns results of the interpreter
+    """
+    expected = [interpret(code, *x) for x in vectors]
+    for options in (option_sets if option_sets is not None else OPTION_SETS):
+        byte_code = compile_program(code, options)
+        for vector, value in zip(vectors, expected):
+            assert run_compiled(byte_code, *vector) == value, f'{options} {vector}'
+    return expected
@@ -0,0 +1,89 @@
+import pytest
+
+from AST import AST, AstNode, AstNodeType
+from ast_binary import MAGIC, VERSION, AstFormatError, FlatAst
+from helpers import run_main
+from optimizer.ast_utils import make_call
+from tokenizer import TokenList
+
+CODE = '''
+(func pw (b e) ((cond (equal e 0) (return 1)) (return (times b (pw b (minus e 1))))))
+(prog ((setq x 007) (setq y 123456789012345678901234567890)
+ (setq z (pw 2 x)) (return (plus (plus x y) (minus z 0)))))
+'''
+# Empty list is only parsed, generator does not take it
+EMPTY = '(prog (() (return ())))'
+
+
+def get_nodes(node: AstNode) -> list:
+    nodes = [(node.type, node.value, node.start, node.end)]
+    for child in node.child_nodes:
+        nodes.extend(get_nodes(child))
+    return nodes
+
+
+def round_trip(ast: AST) -> AST:
+    return FlatAst.from_bytes(FlatAst.from_ast(ast).to_bytes()).to_ast()
+
+
+def test_round_trip_keeps_every_node():
+    ast = AST(TokenList(CODE))
+    nodes = get_nodes(ast.root)
+    assert (AstNodeType.Literal, 7, CODE.index('007'), CODE.index('007') + 3) in nodes
+    assert any(x[1] == 123456789012345678901234567890 for x in nodes)
+    assert get_nodes(round_trip(ast).root) == nodes
+    empty = AST(TokenList(EMPTY))
+    assert (AstNodeType.List, None, 7, 9) in get_nodes(empty.root)
+    assert get_nodes(round_trip(empty).root) == get_nodes(empty.root)
+
+
+def test_nodes_without_span():
+    # Optimizer makes nodes without span, they may stand between nodes with spans
+    ast = AST(TokenList(CODE))
+    block = ast.root.child_nodes[1].child_nodes[1]
+    block.child_nodes.insert(1, make_call('plus', AstNode(AstNodeType.Literal, 2 ** 70),
+                                          AstNode(AstNodeType.Atom, 'x', 3, 4)))
+    assert get_nodes(round_trip(ast).root) == get_nodes(ast.root)
+
+
+def test_truncated_data():
+    data = FlatAst.from_ast(AST(TokenList(CODE))).to_bytes()
+    for length in range(len(data)):
+        with pytest.raises(AstFormatError):
+            FlatAst.from_bytes(data[:length]).to_ast()
+    with pytest.raises(AstFormatError, match='after the last node'):
+        FlatAst.from_bytes(data + b'\x00')
+
+
+def test_corrupt_data():
+    data = FlatAst.from_ast(AST(TokenList('(prog ((return (plus 1 2))))'))).to_bytes()
+    with pytest.raises(AstFormatError, match='Not a binary'):
+        FlatAst.from_bytes(b'(prog ((return 1)))')
+    with pytest.raises(AstFormatError, match='version'):
+        FlatAst.from_bytes(MAGIC + bytes([VERSION + 1]) + data[len(MAGIC) + 1:])
+    # One atom name with invalid UTF-8, no nodes
+    with pytest.raises(AstFormatError, match='UTF-8'):
+        FlatAst.from_bytes(MAGIC + bytes([VERSION, 1, 1, 0xff, 0]))
+    # Atom node refers to name 5 of empty table
+    with pytest.raises(AstFormatError, match='not in the table'):
+        FlatAst.from_bytes(MAGIC + bytes([VERSION, 0, 1, 5 << 4 | 2 << 1]))
+    # The first node is a list, then program inside of program
+    with pytest.raises(AstFormatError, match='must be program'):
+        FlatAst.from_bytes(MAGIC + bytes([VERSION, 0, 1, 1 << 1])).to_ast()
+    with pytest.raises(AstFormatError, match='inside of program'):
+        FlatAst.from_bytes(MAGIC + bytes([VERSION, 0, 2, 1 << 4, 0])).to_ast()
+
+
+def test_compiling_loaded_ast():
+    result, outputs = run_main(CODE, ['-o', 'output.ebc', '--save-ast', 'saved.ast'], ['output.ebc', 'saved.ast'])
+    assert result.returncode == 0, result.stderr
+    loaded, loaded_outputs = run_main(outputs['saved.ast'], ['--load-ast', '-o', 'output.ebc'], ['output.ebc'])
+    assert loaded.returncode == 0, loaded.stderr
+    assert loaded_outputs['output.ebc'] == outputs['output.ebc']
+
+
+def test_loading_other_file_is_reported():
+    for data in (CODE.encode(), MAGIC + bytes([VERSION, 3])):
+        result, _ = run_main(data, ['--load-ast', '-o', 'output.ebc'])
+        assert result.returncode == 1
+        assert result.stderr.startswith('Error: ') and 'Traceback' not in result.stderr
@@ -0,0 +1,38 @@
+import json
+
+from helpers import calldata, compile_program, run_compiled, run_main
+
+# Values of id stay on EVM stack during recursion, so deep one overflows it
+CODE = '''
+(func id (x) ((return x)))
+(func f (n) ((cond (equal n 0) (return 0)) (return (plus (id n) (f (minus n 1))))))
+(prog ((return (f (read 0)))))
+'''
+
+
+def test_results_are_ordered_json_lines():
+    arguments = list(range(0, 200, 3)) + [5000] + list(range(1, 100, 7))
+    lines = ['# argument of f', ''] + [calldata(x).hex() if i % 2 else '0x' + calldata(x).hex()
+                                       for i, x in enumerate(arguments)]
+    byte_code = compile_program(CODE)
+    expected = [run_compiled(byte_code, x) if x != 5000 else None for x in arguments]
+    for jobs in ('1', '2'):
+        for output in ('-', 'results.jsonl'):
+            result, outputs = run_main(CODE, ['-o', 'output.ebc', '-j', jobs, '--batch', 'vectors.txt',
+                                              '--batch-output', output], ['results.jsonl'],
+                                       {'vectors.txt': '\n'.join(lines) + '\n'})
+            assert result.returncode == 0, result.stderr
+            text = result.stdout if output == '-' else outputs['results.jsonl'].decode()
+            results = [json.loads(x) for x in text.splitlines()]
+            assert [x['vector'] for x in results] == list(range(len(arguments)))
+            assert [x.get('value') for x in results] == expected
+            failed = results[arguments.index(5000)]
+            assert set(failed) == {'vector', 'error'} and failed['error'].startswith('Stack overflow')
+            assert all(set(x) == {'vector', 'value', 'gas_used', 'steps'} for x in results if 'error' not in x)
+
+
+def test_bad_vector_is_reported():
+    result, _ = run_main(CODE, ['-o', 'output.ebc', '--batch', 'vectors.txt'], (),
+                         {'vectors.txt': '00\n0xzz\n'})
+    assert result.returncode == 1
+    assert result.stderr.startswith('Error: vectors.txt:2:') and 'Traceback' not in result.stderr
@@ -0,0 +1,70 @@
+import pytest
+
+from evm import Evm, Program
+from helpers import calldata, compile_program, cross_check, interpret
+from interpreter import InterpreterError
+
+CONDITIONS = '''
+(prog ((setq a (read 0)) (setq b (read 1)) (setq r 0)
+ (cond (and (less a 10) (greater b 5)) (setq r (plus r 1)))
+ (cond (or (equal a 3) (not (lesseq b 2))) (setq r (plus r 10)))
+ (cond (not (or (equal a 0) (and (lesseq a 3) (greater a 100)))) (setq r (plus r 100)))
+ (return r)))
+'''
+
+BITWISE = '''
+(prog ((setq a (read 0)) (setq b (read 1)) (setq r 0) (setq z (and a b))
+ (cond (and a b) (setq r (plus r 1)))
+ (cond (or a b) (setq r (plus r 10)))
+ (cond (and (less a 5) b) (setq r (plus r 100)))
+ (cond (not (and a b)) (setq r (plus r 1000)))
+ (return (plus r (times z 10000)))))
+'''
+
+LOOP = '''
+(prog ((setq n (read 0)) (setq i 0) (setq c 0)
+ (while (and (not (greatereq i 20)) (or (nonequal i n) (less c 0))) ((setq i (plus i 1)) (setq c (plus c 2))))
+ (return (plus c (times i 1000)))))
+'''
+
+# Second operand either costs a lot of gas or is too deep for interpreter, so it shows whether it is evaluated
+SLOW = '''
+(func slow (x) ((setq i 0) (while (less i (plus x 100)) (setq i (plus i 1))) (return x)))
+(func deep (n) ((cond (equal n 0) (return 1)) (return (deep (minus n 1)))))
+(prog ((setq k (read 0)) (setq a (read 1)) (setq x (read 2))
+ (cond (equal k 0) (cond (and (less a 5) (slow x)) (return 1) (return 2)))
+ (cond (equal k 1) (cond (and a (slow x)) (return 1) (return 2)))
+ (cond (equal k 2) (cond (or a (slow x)) (return 1) (return 2)))
+ (cond (equal k 3) (cond (and a (deep 100000)) (return 1) (return 2)))
+ (cond (equal k 4) (cond (or a (deep 100000)) (return 1) (return 2)))
+ (return 3)))
+'''
+
+
+def test_lazy_conditions():
+    cross_check(CONDITIONS, [(a, b) for a in (0, 3, 7, 200) for b in (0, 2, 6)])
+
+
+def test_and_or_of_other_values_are_bitwise():
+    assert cross_check(BITWISE, [(2, 1), (3, 1), (1, 2), (0, 4)]) == [1110, 10111, 1010, 1010]
+
+
+def test_lazy_loop_condition():
+    cross_check(LOOP, [(0,), (5,), (30,)])
+
+
+def test_second_operand_is_skipped():
+    for options in ([], ['--no-fold', '--unroll-budget', '0']):
+        program = Program(compile_program(SLOW, options))
+        for k, skipped, evaluated in [(0, (7, 1), (2, 1)), (1, (0, 1), (6, 1)), (2, (1, 0), (0, 1))]:
+            fast = Evm().run(program, calldata(k, *skipped))
+            slow = Evm().run(program, calldata(k, *evaluated))
+            assert fast.value == 2 - (k == 2) and slow.value == 1 + (k == 1)
+            assert slow.gas_used - fast.gas_used > 2000
+    assert cross_check(SLOW, [(1, 6, 1), (1, 7, 3), (2, 0, 0)]) == [2, 1, 2]
+
+
+def test_interpreter_skips_second_operand():
+    assert [interpret(SLOW, 3, 0, 0), interpret(SLOW, 4, 1, 0)] == [2, 1]
+    with pytest.raises(InterpreterError):
+        interpret(SLOW, 3, 1, 0)
@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from helpers import ROOT, calldata, compile_program, cross_check
+
+SHARED_TAILS = '''
+(func f (x) ((setq y (times x 3)) (return (plus (times y y) (plus y 7)))))
+(func g (x) ((setq y (minus x 5)) (return (plus (times y y) (plus y 7)))))
+(prog ((setq a (read 0)) (return (plus (f a) (f (plus a 1))))))
+'''
+
+FOLDED = '''
+(func sq (x) (return (times x x)))
+(func sq2 (y) (return (times y y)))
+(func useA (a) (return (plus (sq a) 1)))
+(func useB (a) (return (plus (sq2 a) 1)))
+(func cls (n) ((cond (less n 3) (return 1)) (cond (less n 10) (return 2)) (cond (less n 100) (return (sq n))) (return 4)))
+(prog ((setq n (read 0)) (setq r (plus (useA n) (useB n))) (setq r (plus r (cls n))) (return r)))
+'''
+
+
+def profile(code: str, *args: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'input.fst')
+        with open(source, 'w') as f:
+            f.write(code)
+        result = subprocess.run([sys.executable, os.path.join(ROOT, 'main.py'), source, '-o',
+                                 os.path.join(directory, 'output.ebc'), '--profile', calldata(*args).hex()],
+                                capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        return json.loads(result.stdout)
+
+
+def test_folded_code_runs_like_original():
+    cross_check(SHARED_TAILS, [(0,), (2,), (2 ** 255,)])
+    cross_check(FOLDED, [(0,), (5,), (50,), (500,)])
+
+
+def test_folding_makes_code_smaller():
+    assert len(compile_program(FOLDED)) < len(compile_program(FOLDED, ['--no-fold']))
+
+
+def test_shared_tail_is_charged_to_running_function():
+    result = profile(SHARED_TAILS, 2)
+    assert set(result['functions']) == {'<init>', 'prog', 'f'}
+    assert sum(x['gas'] for x in result['functions'].values()) == result['gas_used']
+    assert all(x['function'] != 'g' for x in result['forms'])
+
+
+def test_folded_functions_share_name():
+    result = profile(FOLDED, 5)
+    assert set(result['functions']) == {'<init>', 'prog', 'usea|useb', 'sq|sq2', 'cls'}
+
+
+def test_tail_shared_by_many_functions():
+    # Every function ends with the same tail, it is left once and lists each of them
+    names = [f'f{i}' for i in range(60)]
+    code = ''.join(f'(func {name} (x) ((setq y (plus x {i + 2})) (return (plus (times y y) (divide y 7)))))'
+                   for i, name in enumerate(names)) + '(prog ((return (plus (f0 (read 0)) (f59 (read 0))))))'
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'input.fst')
+        with open(source, 'w') as f:
+            f.write(code)
+        source_map = os.path.join(directory, 'map.json')
+        subprocess.run([sys.executable, os.path.join(ROOT, 'main.py'), source, '-o',
+                        os.path.join(directory, 'output.ebc'), '--source-map', source_map], check=True)
+        with open(source_map) as f:
+            entries = json.load(f)['opcodes']
+    shared = [x['shared_by'] for x in entries if x['shared_by'] is not None]
+    assert len(shared) > 0 and all(x == sorted(names) for x in shared)
+    cross_check(code, [(0,), (9,)])
@@ -0,0 +1,31 @@
+from helpers import cross_check
+
+REASSIGNED = '''
+(func g (x y) ((setq a (plus (times x y) (times x y))) (setq b (minus (times x y) a)) (setq x (plus x 1))
+ (setq c (times x y)) (return (plus (plus a b) (plus c (minus x y))))))
+(prog ((setq p (read 0)) (setq q (read 1)) (setq r (plus (times p q) (divide (times p q) (read 0))))
+ (setq r (plus r (g p q))) (return (plus r (minus (read 0) (read 1))))))
+'''
+
+
+def test_reuse_and_reassignment():
+    cross_check(REASSIGNED, [(7, 3), (2, 9), (0, 0), (2 ** 200, 3)])
+
+
+def test_more_copies_than_dup_reaches():
+    # Every (times a k) with distinct k is used twice, copies of the first ones go deeper than DUP16
+    assignments = ' '.join(f'(setq x{k} (plus (times a {k + 3}) (times a {k + 3})))' for k in range(20))
+    total = '0'
+    for k in range(20):
+        total = f'(plus {total} (minus x{k} (times a {k + 3})))'
+    code = f'(prog ((setq a (read 0)) {assignments} (return {total})))'
+    assert cross_check(code, [(1,), (5,)]) == [sum(k + 3 for k in range(20)), 5 * sum(k + 3 for k in range(20))]
+
+
+def test_run_broken_by_call_and_branch():
+    code = '''
+(func sq (x) ((return (times x x))))
+(prog ((setq a (read 0)) (setq b (plus (times a a) 1)) (setq c (sq a)) (setq d (plus (times a a) c))
+ (cond (greater a 3) (setq a (plus a 1))) (setq e (plus (times a a) (times a a))) (return (plus (plus b d) e))))
+'''
+    cross_check(code, [(2,), (4,)])
@@ -0,0 +1,26 @@
+from helpers import cross_check
+
+DENSE = '''
+(func cls (op x) ((cond (equal op 1) (return (plus x 1)) (cond (equal op 2) (return (times x 2))
+ (cond (equal op 3) (return (minus x 1)) (cond (equal op 4) (return (divide x 2))
+ (cond (equal op 7) (return 700) (return 0))))))))
+(prog ((setq o (read 0)) (setq v (read 1)) (return (cls o v))))
+'''
+
+SPARSE = '''
+(func sp (op) ((setq r 0) (cond (equal op 5) (setq r 1) (cond (equal 100 op) (setq r 2) (cond (equal op 1000) (setq r 3)
+ (cond (equal op 5) (setq r 9) (cond (equal op 77777) (setq r 4) (cond (equal op 3) (setq r 5)
+ (cond (equal op 40000) (setq r 6)))))))) (return r)))
+(func dn (op) ((setq r 0) (cond (equal op 10) (setq r 1) (cond (equal op 11) (setq r 2) (cond (equal op 13) (setq r 3)
+ (cond (equal op 14) (setq r 4))))) (return r)))
+(prog ((setq a (read 0)) (return (plus (times (sp a) 10) (dn a)))))
+'''
+
+
+def test_jump_table():
+    cross_check(DENSE, [(op, 10) for op in (0, 1, 2, 3, 4, 5, 6, 7, 8, 100, 2 ** 256 - 1)])
+
+
+def test_binary_search_and_duplicate_cases():
+    assert cross_check(SPARSE, [(x,) for x in (0, 3, 5, 10, 11, 12, 13, 14, 15, 100, 1000, 40000, 77777, 77778)]) == \
+        [0, 50, 10, 1, 2, 0, 3, 4, 0, 20, 30, 60, 40, 0]
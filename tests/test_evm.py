@@ -0,0 +1,73 @@
+import pytest
+
+from evm import Evm, EvmError, Program
+
+
+def run(byte_code: str, calldata: bytes = b'', gas_limit: int = 30000000):
+    return Evm(gas_limit).run(Program(byte_code), calldata)
+
+
+def push(value: int) -> str:
+    return '7f' + value.to_bytes(32, 'big').hex()
+
+
+def returned(*code: str) -> str:
+    # Stores the top of the stack at 0 and returns it
+    return ''.join(code) + push(0) + '52' + push(32) + push(0) + 'f3'
+
+
+def test_shift_takes_amount_from_the_top():
+    # SHL and SHR pop shift first, then value: PUSH value, PUSH shift, SHL
+    assert run(returned(push(3), push(4), '1b')).value == 48
+    assert run(returned(push(48), push(4), '1c')).value == 3
+    assert run(returned(push(1), push(256), '1b')).value == 0
+    assert run(returned(push(1), push(255), '1b')).value == 2 ** 255
+
+
+def test_operand_order_of_sub_div_lt():
+    assert run(returned(push(3), push(10), '03')).value == 7
+    assert run(returned(push(3), push(10), '04')).value == 3
+    assert run(returned(push(0), push(10), '04')).value == 0
+    assert run(returned(push(3), push(10), '10')).value == 0
+    assert run(returned(push(0), push(1), '03')).value == 1
+    assert run(returned(push(1), push(0), '03')).value == 2 ** 256 - 1
+
+
+def test_calldataload_past_the_end():
+    data = bytes(range(1, 41))
+    assert run(returned(push(0), '35'), data).value == int.from_bytes(data[:32], 'big')
+    assert run(returned(push(30), '35'), data).value == int.from_bytes(data[30:] + bytes(22), 'big')
+    assert run(returned(push(40), '35'), data).value == 0
+    assert run(returned(push(2 ** 255), '35'), data).value == 0
+
+
+def test_gas_of_straight_line_code():
+    # 4 PUSH, ADD, MSTORE with expansion of one word, RETURN
+    result = run(returned(push(1), push(2), '01'))
+    assert result.value == 3 and result.gas_used == 3 * 5 + 3 + 3 + 3
+    assert result.steps == 8
+
+
+def test_jumps():
+    # PUSH 35, JUMP over INVALID to JUMPDEST at 35
+    code = push(35) + '56' + 'fe' + '5b'
+    assert run(returned(code, push(7))).value == 7
+    with pytest.raises(EvmError, match='Bad jump destination'):
+        run(push(34) + '56' + 'fe' + '5b')
+    # Destination inside of PUSH data is not JUMPDEST
+    with pytest.raises(EvmError, match='Bad jump destination'):
+        run(push(0x5b) + push(33) + '56')
+    # JUMPI falls through on zero
+    assert run(returned(push(7), push(0), push(200), '57')).value == 7
+
+
+def test_errors():
+    with pytest.raises(EvmError, match='Stack underflow'):
+        run('01')
+    with pytest.raises(EvmError, match='Invalid instruction'):
+        run('fe')
+    with pytest.raises(EvmError, match='Out of gas'):
+        run('5b' + push(0) + '56', gas_limit=1000)
+    with pytest.raises(EvmError, match='Stack overflow'):
+        run('5b' + push(0) + push(0) + '56')
+    assert run('00').value is None
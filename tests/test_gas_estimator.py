@@ -0,0 +1,128 @@
+import json
+
+from evm import GAS_COSTS, Evm, Program
+from helpers import calldata, run_main
+
+STRAIGHT = '(prog ((setq a (read 0)) (setq b (times a 3)) (return (plus (minus b a) (divide a 7)))))'
+
+BRANCH = '''
+(prog ((setq a (read 0)) (setq r 0)
+ (cond (less a 10) (setq r (plus (times a a) (plus a 3))) (setq r 1))
+ (return r)))
+'''
+
+LOOP = '(prog ((setq n (read 0)) (setq i 0) (setq s 0) (while (less i n) ((setq s (plus s i)) (setq i (plus i 1)))) ' \
+       '(return s)))'
+
+CALL = '''
+(func f (x y) ((return (plus (times x y) 1))))
+(prog ((setq a (read 0)) (return (f a (f a 2)))))
+'''
+
+FOLDED = '''
+(func sq (x) ((return (times x x))))
+(func sq2 (y) ((return (times y y))))
+(prog ((setq a (read 0)) (return (plus (sq a) (sq2 a)))))
+'''
+
+RECURSIVE = '''
+(func fact (n) ((cond (equal n 0) (return 1)) (return (times n (fact (minus n 1))))))
+(prog ((return (fact (read 0)))))
+'''
+
+
+def estimate(code: str, *options: str) -> tuple:
+    result, outputs = run_main(code, ['-o', 'output.ebc', '--estimate', 'estimate.json', *options],
+                               ['output.ebc', 'estimate.json'])
+    return result, json.loads(outputs['estimate.json']), outputs['output.ebc'].decode().strip()
+
+
+def static_gas(byte_code: str, *args: int) -> int:
+    # Estimate leaves out memory expansion, so only static gas of executed instructions is summed
+    total = [0]
+
+    def trace(instruction, gas):
+        total[0] += GAS_COSTS[instruction.name]
+    Evm().run(Program(byte_code), calldata(*args), trace)
+    return total[0]
+
+
+def test_straight_line_code_is_exact():
+    for code in (STRAIGHT, CALL):
+        result, report, byte_code = estimate(code)
+        assert result.returncode == 0, result.stderr
+        assert report['gas']['min'] == report['gas']['max'] == static_gas(byte_code, 5) == static_gas(byte_code, 0)
+        assert report['size'] == len(byte_code) // 2
+
+
+def test_cond_bounds_both_branches():
+    result, report, byte_code = estimate(BRANCH)
+    assert result.returncode == 0, result.stderr
+    taken, skipped = static_gas(byte_code, 3), static_gas(byte_code, 30)
+    assert report['gas'] == {'min': min(taken, skipped), 'max': max(taken, skipped)}
+
+
+def test_loop_iteration():
+    result, report, byte_code = estimate(LOOP)
+    assert result.returncode == 0, result.stderr
+    prog = report['functions']['prog']
+    assert prog['gas']['max'] is None and report['gas']['max'] is None
+    assert report['gas']['min'] == static_gas(byte_code, 0)
+    [loop] = prog['loops']
+    iteration = static_gas(byte_code, 6) - static_gas(byte_code, 5)
+    assert loop['depth'] == 0 and loop['iteration_gas'] == {'min': iteration, 'max': iteration}
+    assert loop['form'] == 'while' and loop['line'] == 1
+
+
+def test_calls_and_recursion():
+    _, report, byte_code = estimate(CALL)
+    assert report['functions']['prog']['calls'] == ['f'] and not report['functions']['f']['recursive']
+    assert report['functions']['f']['gas']['min'] == report['functions']['f']['gas']['max'] > 0
+
+    _, report, byte_code = estimate(RECURSIVE)
+    fact = report['functions']['fact']
+    assert fact['recursive'] and fact['calls'] == ['fact']
+    # Frames live in memory and the call is evaluated before n, so stack does not grow with recursion
+    assert fact['gas']['max'] is None and isinstance(fact['max_stack'], int)
+    assert report['gas']['min'] == static_gas(byte_code, 0)
+    assert report['gas']['min'] < static_gas(byte_code, 3)
+
+
+def test_report_shape():
+    _, report, _ = estimate(FOLDED)
+    assert set(report) == {'size', 'gas', 'max_stack', 'functions', 'warnings'}
+    function_keys = {'offset', 'size', 'gas', 'max_stack', 'calls', 'recursive', 'loops', 'alias_of'}
+    assert all(set(x) == function_keys for x in report['functions'].values())
+    assert isinstance(report['max_stack'], int) and report['warnings'] == []
+
+
+def test_folded_function_is_alias():
+    _, report, _ = estimate(FOLDED)
+    functions = report['functions']
+    assert set(functions) == {'sq', 'sq2', 'prog'}
+    assert functions['sq2']['alias_of'] == 'sq' and functions['sq']['alias_of'] is None
+    assert functions['sq2']['gas'] == functions['sq']['gas'] and functions['sq2']['size'] == 0
+    _, report, _ = estimate(FOLDED, '--no-fold')
+    assert report['functions']['sq2']['alias_of'] is None and report['functions']['sq2']['size'] > 0
+
+
+def test_budgets():
+    result, report, _ = estimate(CALL, '--gas-budget', '100000', '--size-budget', '10000')
+    assert result.returncode == 0 and report['warnings'] == []
+
+    result, report, _ = estimate(CALL, '--gas-budget', '50')
+    assert result.returncode == 1
+    assert any(x.startswith('f: gas up to') for x in report['warnings'])
+    assert 'Warning: ' in result.stderr and 'Traceback' not in result.stderr
+
+    result, report, _ = estimate(CALL, '--size-budget', '10')
+    assert result.returncode == 1 and any('size' in x for x in report['warnings'])
+
+    # Loop has no max gas, so any budget may be exceeded
+    result, report, _ = estimate(LOOP, '--gas-budget', '1000000')
+    assert result.returncode == 1 and any('unbounded' in x for x in report['warnings'])
+
+
+def test_estimate_to_stdout():
+    result, _ = run_main(STRAIGHT, ['-o', 'output.ebc', '--estimate', '-'])
+    assert result.returncode == 0 and json.loads(result.stdout)['gas']['min'] > 0
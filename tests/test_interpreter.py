@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+from helpers import ROOT, cross_check
+
+REDEFINED = '''
+(func f (x) ((return (plus x 1))))
+(func g (x) ((return (f x))))
+(func f (x) ((return (times x 10))))
+(func h (x) ((return (f x))))
+(prog ((setq a (read 0)) (return (plus (times (g a) 1000) (h a)))))
+'''
+
+
+def interpret_in_main(code: str, *options: str) -> subprocess.CompletedProcess:
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'input.fst')
+        with open(source, 'w') as f:
+            f.write(code)
+        return subprocess.run([sys.executable, os.path.join(ROOT, 'main.py'), source, '-o',
+                               os.path.join(directory, 'output.ebc'), '--interpret', '00' * 32, *options],
+                              capture_output=True, text=True)
+
+
+def test_redefined_function_is_resolved_like_in_compiler():
+    # g sees the first f, h and prog see the second one
+    assert cross_check(REDEFINED, [(3,), (7,)]) == [4030, 8070]
+
+
+def test_errors_are_reported_without_traceback():
+    for code in ['(prog ((return (nothing 1))))',
+                 '(func f (x) ((return x))) (prog ((return (f 1 2))))',
+                 '(func f (x) ((return (plus 1 (f x))))) (prog ((return (f 1))))']:
+        result = interpret_in_main(code, '--cross-check')
+        assert result.returncode == 1
+        assert result.stderr.startswith('Error: ') and 'Traceback' not in result.stderr
+
+
+def test_cross_check_agrees():
+    result = interpret_in_main(REDEFINED, '--cross-check')
+    assert result.returncode == 0 and result.stdout.strip() == '1000'
@@ -0,0 +1,34 @@
+from helpers import compile_program, cross_check, run_compiled
+
+SHIFTS = '''
+(prog ((setq a (read 0))
+ (return (plus (plus (times a 8) (times 16 a)) (plus (divide a 4) (plus (times a 1) (divide (times a 3) 1)))))))
+'''
+
+HOISTED = '''
+(prog ((setq n (read 0)) (setq i 0) (setq s 0)
+ (while (less i (plus n 1)) ((setq s (plus s (times (read 1) (plus n 2)))) (setq i (plus i 1))))
+ (return s)))
+'''
+
+
+def test_shift_of_two_literals():
+    for code, value in [('(prog ((return (times 4 8))))', 32), ('(prog ((return (times 8 4))))', 32),
+                        ('(prog ((return (times 1 16))))', 16), ('(prog ((return (divide 16 4))))', 4),
+                        ('(prog ((return (divide 4 16))))', 0),
+                        ('(prog ((setq x (plus (times 4 8) (times 4 8))) (return x)))', 64)]:
+        assert cross_check(code, [()], [[]]) == [value]
+
+
+def test_shift_of_one_literal():
+    cross_check(SHIFTS, [(0,), (1,), (7,), (2 ** 255 + 5,)])
+
+
+def test_hoisted_invariants():
+    assert cross_check(HOISTED, [(0, 3), (4, 5)]) == [6, 150]
+
+
+def test_loop_with_shift_in_condition():
+    byte_code = compile_program('(prog ((setq i 1) (while (less (times i 2) (read 0)) (setq i (times 2 i))) '
+                                '(return i)))')
+    assert [run_compiled(byte_code, x) for x in (0, 5, 100)] == [1, 4, 64]
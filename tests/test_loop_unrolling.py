@@ -0,0 +1,91 @@
+from AST import AST, AstNode, AstNodeType
+from helpers import cross_check
+from optimizer.ast_utils import is_call
+from optimizer.loop_unrolling import LoopUnrolling
+from tokenizer import TokenList
+
+OPTIONS = [[], ['--unroll-budget', '0'], ['--unroll-budget', '512'], ['--unroll-budget', '4096'],
+           ['--no-fold', '-j', '2']]
+
+COUNT_DOWN = '''
+(prog ((setq n (read 0)) (setq s 0) (setq i 20)
+ (while (greater i 3) ((setq s (plus (times s 3) i)) (cond (equal s n) (break)) (setq i (minus i 2))))
+ (return (plus (times i 100000) s))))
+'''
+
+NONEQUAL = '''
+(prog ((setq n (read 0)) (setq s 0) (setq i 1)
+ (while (nonequal 31 i) ((cond (greater s n) (break)) (setq i (plus 3 i)) (setq s (plus s i))))
+ (return (plus (times i 100000) s))))
+'''
+
+NESTED = '''
+(prog ((setq n (read 0)) (setq s 0) (setq i 0)
+ (while (lesseq i 40) ((setq j 5)
+  (while (greatereq j 1) ((setq s (plus s (times i j))) (cond (equal s n) (break)) (setq j (minus j 1))))
+  (setq i (plus i 1))))
+ (return (plus (times i 100000) s))))
+'''
+
+WRAPPING = '''
+(prog ((setq n (read 0)) (setq s 0) (setq i 5)
+ (while (greatereq i 0) ((setq s (plus s 1)) (cond (greater s n) (break)) (setq i (minus i 1))))
+ (return (plus (times s 100000) i))))
+'''
+
+CONDITIONAL_STEP = '''
+(prog ((setq n (read 0)) (setq s 0) (setq k 2)
+ (while (less k 9) ((cond (equal k n) (setq k (plus k 1))) (setq s (plus s k)) (setq k (plus k 1))))
+ (return (plus s k))))
+'''
+
+REMAINDER = '''
+(func f (x) ((setq i 0) (setq r 0)
+ (while (less i 7) ((setq r (plus r (times x i))) (cond (equal r 99) (return 5)) (setq i (plus i 1))))
+ (return r)))
+(prog ((setq n (read 0)) (setq s 0) (setq i 0)
+ (while (less i 1000) ((setq s (plus s (f i))) (cond (equal i n) (break)) (setq i (plus i 7))))
+ (return (plus (times i 100000) s))))
+'''
+
+
+def count_loops(node: AstNode) -> int:
+    # Copies which may break are wrapped into (while 1 ...) running once
+    is_loop = is_call(node, 'while') and node.child_nodes[1].type != AstNodeType.Literal
+    return is_loop + sum(count_loops(x) for x in node.child_nodes)
+
+
+def unrolled_loops(code: str, budget: int = 64) -> int:
+    return count_loops(LoopUnrolling(budget).run(AST(TokenList(code))).root)
+
+
+def test_full_unrolling():
+    assert unrolled_loops(COUNT_DOWN, 4096) == 0
+    cross_check(COUNT_DOWN, [(0,), (20,), (202,), (2 ** 256 - 1,)], OPTIONS)
+
+
+def test_nonequal_with_literal_first():
+    assert unrolled_loops(NONEQUAL, 4096) == 0
+    cross_check(NONEQUAL, [(0,), (30,), (1000,)], OPTIONS)
+
+
+def test_nested_loops():
+    assert unrolled_loops(NESTED, 4096) == 1
+    cross_check(NESTED, [(0,), (15,), (100,), (10 ** 6,)], OPTIONS)
+
+
+def test_partial_unrolling_with_remainder():
+    assert unrolled_loops(REMAINDER, 4096) == 0 and unrolled_loops(REMAINDER, 512) == 1
+    ast = LoopUnrolling(512).run(AST(TokenList(REMAINDER)))
+    block = ast.root.child_nodes[1].child_nodes[1].child_nodes[3].child_nodes[2]
+    # 143 = 7 + 17 * 8, copies which may break are followed by the loop and wrapped into (while 1 ...)
+    assert len(block.child_nodes) == 7 * 3 + 2
+    assert len(block.child_nodes[7 * 3].child_nodes[2].child_nodes) == 8 * 3
+    cross_check(REMAINDER, [(0,), (7,), (14,), (999,), (10 ** 6,)], OPTIONS)
+
+
+def test_loops_which_are_not_unrolled():
+    assert unrolled_loops(WRAPPING, 4096) == 1
+    assert unrolled_loops(CONDITIONAL_STEP, 4096) == 1
+    cross_check(WRAPPING, [(0,), (3,), (6,), (20,)], OPTIONS)
+    cross_check(CONDITIONAL_STEP, [(0,), (2,), (5,), (8,)], OPTIONS)
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+from evm import Evm, Program
+from helpers import ROOT, calldata, compile_program, cross_check
+
+FIB = '''
+(func fib (n) ((cond (less n 2) (return n)) (return (plus (fib (minus n 1)) (fib (minus n 2))))))
+(prog ((return (fib (read 0)))))
+'''
+
+MIXED = '''
+(func g (n) ((setq k 0) (while (greater n 0) ((setq n (minus n 1)) (setq k (plus k 3)) (cond (equal k 30) (return 7))))
+ (return (plus k 1))))
+(func h (n) ((cond (equal n 0) (return 1)) (return (plus (h (minus n 1)) (g n)))))
+(prog ((setq x (read 0)) (setq a (h x)) (setq b (h x)) (setq c (g (minus 0 1))) (setq d (g (minus 0 1)))
+ (return (plus (plus a b) (plus (g 12) (g (read 1)))))))
+'''
+
+
+def test_memoized_results():
+    options = [['--memoize', 'fib'], ['--memoize', 'fib', '--memo-slots', '4'], ['--memoize', 'fib', '-j', '2']]
+    assert cross_check(FIB, [(0,), (1,), (10,), (20,)], options) == [0, 1, 55, 6765]
+
+
+def test_colliding_and_largest_arguments():
+    # Argument 2^256 - 1 has key 0 like empty slot, so it is never found in the table
+    options = [['--memoize', 'g', '--memoize', 'h'], ['--memoize', 'g', '--memoize', 'h', '--memo-slots', '1'],
+               ['--memoize', 'h', '--no-fold', '--unroll-budget', '0']]
+    cross_check(MIXED, [(0, 2 ** 256 - 1), (5, 3), (12, 12)], options)
+
+
+def test_memoization_makes_recursion_linear():
+    plain = Evm().run(Program(compile_program(FIB)), calldata(20)).gas_used
+    memoized = Evm().run(Program(compile_program(FIB, ['--memoize', 'fib'])), calldata(20)).gas_used
+    assert memoized * 100 < plain
+
+
+def test_invalid_functions_are_rejected():
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'input.fst')
+        with open(source, 'w') as f:
+            f.write('(func add (a b) ((return (plus a b)))) (prog ((return (add 1 2))))')
+        for name in ('add', 'missing'):
+            result = subprocess.run([sys.executable, os.path.join(ROOT, 'main.py'), source, '-o',
+                                     os.path.join(directory, 'output.ebc'), '--memoize', name],
+                                    capture_output=True, text=True)
+            assert result.returncode == 1 and result.stderr.startswith('Error: ')
@@ -0,0 +1,24 @@
+from helpers import compile_program, cross_check
+
+
+def make_program(count: int) -> str:
+    # Chain of functions with loops and dispatch tables, every one calls the previous one
+    functions = ['(func f0 (x) ((return (plus x 1))))']
+    for i in range(1, count):
+        functions.append(f'''
+(func f{i} (x) ((setq s 0) (setq i 0) (while (less i (divide x 8)) ((setq s (plus s i)) (setq i (plus i 1))))
+ (cond (equal x 1) (setq s (plus s 10)) (cond (equal x 2) (setq s (plus s 20)) (cond (equal x 3) (setq s (plus s 30))
+ (cond (equal x 4) (setq s (plus s {i}))))))
+ (return (plus s (f{i - 1} (divide x 2))))))''')
+    return ''.join(functions) + f'(prog ((return (f{count - 1} (read 0)))))'
+
+
+def test_fragments_link_into_the_same_code():
+    code = make_program(12)
+    serial = compile_program(code, ['-j', '1'])
+    assert compile_program(code, ['-j', '2']) == serial
+    assert compile_program(code, ['-j', '4', '--no-fold']) == compile_program(code, ['--no-fold'])
+
+
+def test_parallel_code_runs_like_interpreter():
+    cross_check(make_program(12), [(0,), (3,), (40,), (100,)], [['-j', '3'], ['-j', '3', '--no-fold']])
@@ -0,0 +1,45 @@
+from evm import Evm, Program
+from helpers import compile_program, cross_check
+
+PURE = '''
+(func fib (n) ((cond (less n 2) (return n)) (return (plus (fib (minus n 1)) (fib (minus n 2))))))
+(func pw (b e) ((cond (equal e 0) (return 1)) (return (times b (pw b (minus e 1))))))
+(func first (n) ((setq i 0) (while 1 ((cond (greater (times i i) n) (break)) (setq i (plus i 1)))) (return i)))
+(prog ((setq x (plus (fib 15) (pw 3 5))) (setq y (plus (first 50) (pw 2 100))) (return (plus (plus x y) (fib (read 0))))))
+'''
+
+IMPURE = '''
+(func rd (n) ((return (plus n (read 0)))))
+(func deep (n) ((cond (equal n 0) (return 0)) (return (plus 1 (deep (minus n 1))))))
+(func big (n) ((return (minus 0 n))))
+(prog ((return (plus (plus (rd 5) (big 1)) (deep 100)))))
+'''
+
+
+def test_pure_calls_with_literal_arguments():
+    assert cross_check(PURE, [(0,), (10,)]) == [610 + 243 + 8 + 2 ** 100, 610 + 243 + 8 + 2 ** 100 + 55]
+
+
+def test_folded_call_is_literal():
+    # fib 15 takes about two thousand calls at run time, folded one is a single PUSH
+    byte_code = compile_program('(func fib (n) ((cond (less n 2) (return n)) '
+                                '(return (plus (fib (minus n 1)) (fib (minus n 2))))))(prog ((return (fib 15))))')
+    result = Evm().run(Program(byte_code))
+    assert result.value == 610 and result.gas_used < 200
+
+
+def test_impure_and_too_deep_calls_stay():
+    cross_check(IMPURE, [(0,), (9,)])
+
+
+def test_redefined_function_is_resolved_by_position():
+    # Prog sees the first f only, the second one is declared after it
+    code = '(func f (x) ((return 1))) (prog ((return (f 0)))) (func f (x) ((return 2)))'
+    assert cross_check(code, [()]) == [1]
+    code = '(func f (x) ((return (read 0)))) (prog ((return (f 0)))) (func f (x) ((return 2)))'
+    assert cross_check(code, [(7,)]) == [7]
+    code = '''
+(func g (x) ((return 10))) (func f (x) ((return (g x)))) (func g (x) ((return (read 0))))
+(prog ((return (plus (f 0) (g 0)))))
+'''
+    assert cross_check(code, [(5,)]) == [15]
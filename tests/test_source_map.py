@@ -0,0 +1,73 @@
+import json
+import re
+
+from evm import Evm, Program
+from helpers import calldata, run_main
+
+CODE = '''(func sq (x) ((return (times x x))))
+(func sq2 (y) ((return (times y y))))
+(prog ((setq a (read 0))
+  (return (plus (sq a) (sq2 (plus a 1))))))
+'''
+
+
+def compile_with_map(code: str, *options: str) -> tuple:
+    result, outputs = run_main(code, ['-o', 'output.ebc', '--source-map', 'map.json', *options],
+                               ['output.ebc', 'map.json'])
+    assert result.returncode == 0, result.stderr
+    return outputs['output.ebc'].decode().strip(), json.loads(outputs['map.json'])
+
+
+def profile(code: str, *args: int) -> tuple:
+    result, outputs = run_main(code, ['-o', 'output.ebc', '--profile', calldata(*args).hex(),
+                                      '--flame-graph', 'out.folded'], ['output.ebc', 'out.folded'])
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout), outputs['out.folded'].decode(), outputs['output.ebc'].decode().strip()
+
+
+def check_entries(code: str, byte_code: str, source_map: dict):
+    instructions = Program(byte_code).instructions
+    assert [(x['offset'], x['opcode']) for x in source_map['opcodes']] == [(x.offset, x.name) for x in instructions]
+    for entry in source_map['opcodes']:
+        if entry['start'] is None:
+            continue
+        text = code[entry['start']:entry['end']]
+        assert text.startswith(f'({entry["form"]}') or text == entry['form'] or entry['form'] == 'block'
+        assert entry['line'] == code.count('\n', 0, entry['start']) + 1
+        assert entry['column'] == entry['start'] - code.rfind('\n', 0, entry['start'])
+
+
+def test_entries_map_offsets_to_spans():
+    for options in ([], ['--no-fold']):
+        byte_code, source_map = compile_with_map(CODE, *options)
+        check_entries(CODE, byte_code, source_map)
+        entries = source_map['opcodes']
+        multiplications = [x for x in entries if x['opcode'] == 'MUL']
+        assert all(CODE[x['start']:x['end']] in ('(times x x)', '(times y y)') for x in multiplications)
+        assert [x['line'] for x in entries if x['form'] == 'read'][0] == 3
+        assert {x['column'] for x in entries if x['form'] == 'plus'} == {11, 29}
+
+
+def test_folded_function_shares_entry():
+    byte_code, source_map = compile_with_map(CODE)
+    functions = source_map['functions']
+    assert functions['sq'] == functions['sq2'] != functions['prog']
+    assert all(x['function'] != 'sq2' for x in source_map['opcodes'])
+    _, unfolded = compile_with_map(CODE, '--no-fold')
+    assert unfolded['functions']['sq'] != unfolded['functions']['sq2']
+    assert {x['function'] for x in unfolded['opcodes']} == {None, 'sq', 'sq2', 'prog'}
+
+
+def test_profile_sums_to_gas_used():
+    for args in [(0,), (5,), (2 ** 200,)]:
+        result, folded, byte_code = profile(CODE, *args)
+        expected = Evm().run(Program(byte_code), calldata(*args))
+        assert result['value'] == expected.value and result['gas_used'] == expected.gas_used
+        assert sum(x['gas'] for x in result['functions'].values()) == result['gas_used']
+        assert sum(x['gas'] for x in result['forms']) == result['gas_used']
+
+        stacks = [re.fullmatch(r'(\S+(?:;\S+)*) (\d+)', line) for line in folded.splitlines()]
+        assert all(x is not None for x in stacks)
+        assert sum(int(x.group(2)) for x in stacks) == result['gas_used']
+        assert {x.group(1).split(';')[0] for x in stacks} == {'<init>', 'prog'}
+        assert any(x.group(1).startswith('prog;sq|sq2;') for x in stacks)
@@ -0,0 +1,47 @@
+import json
+
+from helpers import OPTION_SETS, cross_check, run_main
+
+NO_RETURN = '''
+(func noret (x) ((setq y (plus x 1))))
+(func half (x) ((cond (greater x 10) (return (divide x 2)))))
+(prog ((setq x (noret 5)) (setq z (half (read 0))) (return (plus (plus x 7) z))))
+'''
+
+STATEMENTS = '''
+(func f (x) ((return (times x 2))))
+(func g (x) ((setq x (plus x 1))))
+(prog ((setq i 0) (setq n (read 0)) (while (less i n) ((f i) (g i) (plus i 1) i 5 (setq i (plus i 1)))) (return i)))
+'''
+
+DEEP = '''
+(func g (a b) ((return (minus (times a (plus b (minus a (plus b (minus a 1)))))
+ (divide (plus a (times b (plus a (times b (plus a 2))))) (plus b 1))))))
+(prog ((setq x (read 0))
+ (return (plus (g x (plus x 1)) (minus (g (plus x 2) x) (g x (minus (divide 100 (plus x 1)) (less x (greater 3 x)))))))))
+'''
+
+
+def test_function_without_return_gives_zero():
+    options = OPTION_SETS + [['--memoize', 'noret', '--memoize', 'half']]
+    assert cross_check(NO_RETURN, [(3,), (30,)], options) == [7, 22]
+
+
+def test_values_of_statements_are_dropped():
+    # Every iteration used to leave values on EVM stack, 2000 iterations overflowed it
+    assert cross_check(STATEMENTS, [(0,), (2000,)], [[], ['--unroll-budget', '0']]) == [0, 2000]
+
+
+def test_mirrored_operands():
+    cross_check(DEEP, [(0,), (1,), (7,), (2 ** 255,)])
+
+
+def test_stack_budget():
+    result, _ = run_main(DEEP, ['-o', 'output.ebc', '--estimate', '-'])
+    assert result.returncode == 0, result.stderr
+    depth = json.loads(result.stdout)['max_stack']
+    result, _ = run_main(DEEP, ['-o', 'output.ebc', '--estimate', '-', '--stack-budget', str(depth)])
+    assert result.returncode == 0, result.stderr
+    result, _ = run_main(DEEP, ['-o', 'output.ebc', '--estimate', '-', '--stack-budget', str(depth - 1)])
+    assert result.returncode == 1
+    assert f'Warning: Stack depth up to {depth} exceeds budget {depth - 1}' in result.stderr
@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import List
+from typing import List, Tuple
 
 
 DIGITS = '1234567890'
@@ -22,9 +22,12 @@ class Terminal(Enum):
 class Token:
     type: Terminal
     value: str
+    position: int
 
-    def __init__(self, char: str):
+    def __init__(self, char: str, position: int = -1):
         self.value = char
+        # Offset of character in source code
+        self.position = position
         if char == SPACE:
             self.type = Terminal.SPACE
         elif char == LEFT_PARENTHESIS:
@@ -41,8 +44,8 @@ class Token:
             self.type = Terminal.UNKNOWN
 
     @staticmethod
-    def get_eof_token():
-        return Token(chr(0))
+    def get_eof_token(position: int = -1):
+        return Token(chr(0), position)
 
 
 class TokenList:
@@ -51,8 +54,8 @@ class TokenList:
     currentTokenIndex: int
 
     def __init__(self, rawCode: str):
-        self.tokens = [Token(x) for x in TokenList.__preprocess_code(rawCode)]
-        self.tokens.append(Token.get_eof_token())
+        self.tokens = [Token(x, i) for x, i in TokenList.__preprocess_code(rawCode)]
+        self.tokens.append(Token.get_eof_token(len(rawCode)))
         self.length = len(self.tokens)
         self.currentTokenIndex = 0
 
@@ -75,12 +78,19 @@ class TokenList:
         self.currentTokenIndex += 1
 
     @staticmethod
-    def __preprocess_code(formatted_code: str):
-        formatted_code = formatted_code.replace('\n', ' ')
-        formatted_code = formatted_code.replace('\t', ' ')
-        while '  ' in formatted_code:
-            formatted_code = formatted_code.replace('  ', ' ')
-        while formatted_code[-1] == ' ':
-            formatted_code = formatted_code[:-1]
-
-        return formatted_code
+    def __preprocess_code(formatted_code: str) -> List[Tuple[str, int]]:
+        """
+        Replaces line breaks and tabs with spaces, collapses repeated spaces and removes trailing ones.
+        Every remaining character keeps its offset in source code.
+        """
+        chars = []
+        for i, char in enumerate(formatted_code):
+            if char == '\n' or char == '\t':
+                char = SPACE
+            if char == SPACE and len(chars) > 0 and chars[-1][0] == SPACE:
+                continue
+            chars.append((char, i))
+        while len(chars) > 0 and chars[-1][0] == SPACE:
+            chars.pop()
+
+        return chars